@@ -1,18 +1,38 @@
 import customtkinter as ctk
 import os
+import sys
 import datetime
+import time
+import hashlib
+import functools
+import argparse
+import queue
 import pandas as pd
-from tkinter import messagebox, filedialog, ttk
+import numpy as np
+import tkinter as tk
+from tkinter import messagebox, filedialog, simpledialog, ttk
 import re
 import sqlite3
 import shutil
+import tempfile
 import json
-from typing import List, Dict, Any, Optional, Tuple, cast
+import threading
+import unicodedata
+import urllib.parse
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import multiprocessing
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable, Iterator, Union, cast
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use('Agg')
 from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch
@@ -41,18 +61,22 @@ class Config:
     
     APP_NAME = "Calculadora DRE de TODOS"
     CREATOR_NAME = "Powered by: Lucas Costa"
-    CURRENT_YEAR = datetime.datetime.now().year
-    CURRENT_YEAR_SHORT = datetime.datetime.now().strftime('%y')
     DB_FOLDER = "database"
     DB_NAME = "dre_database.db"
     DB_PATH = os.path.join(DB_FOLDER, DB_NAME)
     BACKUP_LOG_FILE = os.path.join(DB_FOLDER, "backup_log.json")
-    # File to persist user edits to mappings (chart of accounts, description mapping, notas negocio)
+    # Legacy file with user edits to mappings; imported once into the database (table 'mappings')
     MAPPINGS_FILE = os.path.join(DB_FOLDER, "mappings.json")
+    # Versão dos mapeamentos no banco (crescente a cada edição); estruturas derivadas
+    # (RuleEngine, ClassificationCache) são reconstruídas quando ela muda.
+    MAPPINGS_REVISION = 0
+    MAPPING_NAMES = ("CHART_OF_ACCOUNTS", "DESCRIPTION_MAPPING", "NOTAS_NEGOCIO_MAPPING")
 
     # ==============================================================================
     # --- MAPEAMENTO DE CONTAS CORRIGIDO ---
-    # As chaves agora correspondem ao formato 'XX.XX.XXX' do arquivo 'detalhamento financeiro.csv'
+    # As chaves agora correspondem ao formato 'XX.XX.XXX' do arquivo 'detalhamento financeiro.csv'.
+    # Prefixos ('05.04', '05') também são aceitos e valem para todos os códigos abaixo deles
+    # que não tenham regra mais específica.
     # ==============================================================================
     CHART_OF_ACCOUNTS = {
         # Receitas
@@ -202,61 +226,460 @@ class Config:
         "Ajustes da Franqueadora",
         "Outros"
     ]
+
+    # --- REGRAS DE CLASSIFICAÇÃO (ver RuleEngine) ---
+    # Os três mapeamentos acima viram regras automaticamente (códigos/prefixos com prioridade 100,
+    # palavras-chave com 50, na ordem do dicionário). Aqui ficam as regras que não vêm de mapeamento.
+    # Campos: priority, match ('code', 'prefix', 'keyword', 'regex' ou 'any'), pattern, group,
+    # subgroup, sign ('positive', 'negative' ou 'keep'; padrão: SIGN_RULES), action ('classify' ou
+    # 'skip') e source ('detalhamento' ou 'notas').
+    CLASSIFICATION_RULES = [
+        {"source": "detalhamento", "priority": 40, "match": "keyword", "pattern": "TRANSFERENCIA ENTRE CONTAS", "action": "skip"},
+        {"source": "detalhamento", "priority": 0, "match": "any", "group": "Outros", "subgroup": "Não Categorizado"},
+        {"source": "notas", "priority": 0, "match": "any", "group": "Ajustes da Franqueadora", "subgroup": "Não Mapeado"},
+    ]
+
+    # Sinal aplicado ao valor conforme o nome do grupo; a primeira regra que casar vale.
+    # Grupos sem regra (ex: 'Outros', 'Ajustes') mantêm o sinal do arquivo.
+    SIGN_RULES = [
+        {"keyword": "Receita", "sign": "positive"},
+        {"keyword": "Despesas", "sign": "negative"},
+        {"keyword": "Impostos", "sign": "negative"},
+        {"keyword": "Investimentos", "sign": "negative"},
+        {"keyword": "Dividendos", "sign": "negative"},
+    ]
     @staticmethod
-    def load_mappings() -> None:
-        """Load user-edited mappings from Config.MAPPINGS_FILE if present.
-        This will update the in-memory mapping dictionaries on Config.
+    def load_mappings(db_manager: "DatabaseManager") -> None:
+        """Carrega os mapeamentos do banco para os dicionários de Config.
+
+        Na primeira execução o banco é populado com os mapeamentos padrão mais as edições
+        salvas no antigo Config.MAPPINGS_FILE, se existir.
         """
-        try:
-            if os.path.exists(Config.MAPPINGS_FILE):
-                with open(Config.MAPPINGS_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                # Merge loaded mappings, but keep defaults for missing entries
-                if isinstance(data.get('CHART_OF_ACCOUNTS'), dict):
-                    Config.CHART_OF_ACCOUNTS.update(data['CHART_OF_ACCOUNTS'])
-                if isinstance(data.get('DESCRIPTION_MAPPING'), dict):
-                    Config.DESCRIPTION_MAPPING.update(data['DESCRIPTION_MAPPING'])
-                if isinstance(data.get('NOTAS_NEGOCIO_MAPPING'), dict):
-                    Config.NOTAS_NEGOCIO_MAPPING.update(data['NOTAS_NEGOCIO_MAPPING'])
-        except Exception:
-            # Fail silently; fall back to built-in mappings
-            pass
+        if db_manager.get_mapping_version() == 0:
+            seed = {name: dict(getattr(Config, name)) for name in Config.MAPPING_NAMES}
+            try:
+                if os.path.exists(Config.MAPPINGS_FILE):
+                    with open(Config.MAPPINGS_FILE, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    for name in Config.MAPPING_NAMES:
+                        if isinstance(data.get(name), dict):
+                            seed[name].update(data[name])
+            except Exception:
+                # Arquivo antigo ilegível: segue só com os padrões
+                pass
+            db_manager.seed_mappings(seed)
+        Config.apply_mappings(db_manager.get_mappings(), db_manager.get_mapping_version())
 
     @staticmethod
-    def save_mappings() -> bool:
-        """Persist the current mapping dicts to Config.MAPPINGS_FILE.
-        Returns True on success.
-        """
-        try:
-            os.makedirs(os.path.dirname(Config.MAPPINGS_FILE), exist_ok=True)
-            payload = {
-                'CHART_OF_ACCOUNTS': Config.CHART_OF_ACCOUNTS,
-                'DESCRIPTION_MAPPING': Config.DESCRIPTION_MAPPING,
-                'NOTAS_NEGOCIO_MAPPING': Config.NOTAS_NEGOCIO_MAPPING
-            }
-            with open(Config.MAPPINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(payload, f, ensure_ascii=False, indent=2)
-            return True
-        except Exception:
+    def apply_mappings(mappings: Dict[str, Dict[str, Dict[str, str]]], version: int) -> None:
+        for name in Config.MAPPING_NAMES:
+            mapping = getattr(Config, name)
+            mapping.clear()
+            mapping.update(mappings.get(name, {}))
+        Config.MAPPINGS_REVISION = version
+
+    @staticmethod
+    def save_mapping(db_manager: "DatabaseManager", mapping_name: str, key: str, info: Dict[str, str]) -> int:
+        """Grava uma única entrada (upsert) e retorna a nova versão dos mapeamentos."""
+        version = db_manager.upsert_mapping(mapping_name, key, info.get("group", ""), info.get("subgroup"))
+        getattr(Config, mapping_name)[key] = info
+        Config.MAPPINGS_REVISION = version
+        return version
+
+    @staticmethod
+    def delete_mapping(db_manager: "DatabaseManager", mapping_name: str, key: str) -> int:
+        version = db_manager.delete_mapping(mapping_name, key)
+        getattr(Config, mapping_name).pop(key, None)
+        Config.MAPPINGS_REVISION = version
+        return version
+
+# Períodos: cada mês importado tem um índice contínuo (ano * 12 + mês - 1), gravado em
+# analysis_summary.period_index, e qualquer intervalo de meses, mesmo atravessando anos,
+# vira um único `period_index BETWEEN ? AND ?` sobre o índice.
+def current_year() -> int:
+    return datetime.date.today().year
+
+def period_index(year: int, month: int) -> int:
+    return year * 12 + month - 1
+
+def period_bounds(start_month: int, end_month: int, start_year: Optional[int] = None, end_year: Optional[int] = None) -> Tuple[int, int]:
+    """Converte um intervalo de meses em (índice inicial, índice final).
+
+    Sem ano, vale o ano corrente; sem `end_year`, o intervalo termina no mesmo ano em que começa.
+    """
+    start_year = current_year() if start_year is None else start_year
+    end_year = start_year if end_year is None else end_year
+    first, last = period_index(start_year, start_month), period_index(end_year, end_month)
+    if last < first:
+        raise ValueError(f"Período inválido: {start_month:02d}/{start_year} a {end_month:02d}/{end_year}")
+    return first, last
+
+def period_label(index: int, short_year: bool = False) -> str:
+    year, month0 = divmod(index, 12)
+    return f"{month0 + 1:02d}/{year % 100:02d}" if short_year else f"{month0 + 1:02d}/{year}"
+
+def format_period_range(start_month: int, end_month: int, start_year: Optional[int] = None, end_year: Optional[int] = None) -> str:
+    """Título do intervalo: '08/2025', '01-03/2025' ou '11/2024-02/2025'."""
+    first, last = period_bounds(start_month, end_month, start_year, end_year)
+    if first == last:
+        return period_label(first)
+    if first // 12 == last // 12:
+        return f"{first % 12 + 1:02d}-{period_label(last)}"
+    return f"{period_label(first)}-{period_label(last)}"
+
+def parse_period_spec(spec: str, default_year: Optional[int] = None) -> Tuple[int, int, int, int]:
+    """Converte textos como '08', '1-12', '08/2024', '1-3/2024' ou '11/2024-02/2025' em
+    (mês inicial, mês final, ano inicial, ano final). Lança ValueError para entradas inválidas."""
+    default_year = current_year() if default_year is None else default_year
+    parts = spec.replace(" ", "").split("-")
+    if not 1 <= len(parts) <= 2 or not all(parts):
+        raise ValueError(f"Período inválido: '{spec}'")
+    parsed: List[Tuple[int, Optional[int]]] = []
+    for part in parts:
+        month_text, _, year_text = part.partition("/")
+        month = int(month_text)
+        year = int(year_text) if year_text else None
+        if not 1 <= month <= 12 or (year is not None and year < 1900):
+            raise ValueError(f"Período inválido: '{spec}'")
+        parsed.append((month, year))
+    (start_month, start_year), (end_month, end_year) = parsed[0], parsed[-1]
+    # '1-3/2024': o ano informado no fim vale também para o início (e vice-versa)
+    start_year = start_year or end_year or default_year
+    end_year = end_year or start_year
+    period_bounds(start_month, end_month, start_year, end_year)
+    return start_month, end_month, start_year, end_year
+
+# ==============================================================================
+# --- 1.1 INSTRUMENTAÇÃO DE DESEMPENHO ---
+# ==============================================================================
+class PerformanceMonitor:
+    """Mede as etapas quentes: leitura e classificação dos CSVs, consultas, montagem de telas e exportações.
+
+    Desligado por padrão: `timed` e `span` só consultam `enabled` antes de seguir. Ligado, cada medida
+    (instante, etapa, ms, linhas) vai para um buffer circular em memória, que `flush` descarrega na
+    tabela perf_samples. As etapas usam prefixos: 'db.', 'processor.', 'screen.' e 'export.'.
+    """
+    CAPACITY = 5000
+    CACHE_HIT_STAGE = "db.cache_hit"
+
+    class _Span:
+        __slots__ = ("monitor", "stage", "rows", "started")
+
+        def __init__(self, monitor: "PerformanceMonitor", stage: str):
+            self.monitor, self.stage, self.rows = monitor, stage, None
+
+        def __enter__(self):
+            self.started = time.perf_counter()
+            return self
+
+        def __exit__(self, *exc_info):
+            self.monitor.record(self.stage, self.started, self.rows)
             return False
 
+    class _NullSpan:
+        rows = None
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+    _NULL_SPAN = _NullSpan()
+
+    def __init__(self, capacity: int = CAPACITY):
+        self.enabled = False
+        self.capacity = capacity
+        self._samples: deque = deque(maxlen=capacity)
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self, stage: str, started: float, rows: Optional[int] = None):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._samples.append((time.time(), stage, elapsed_ms, rows))
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def mark_cache_hit(self):
+        """Avisa que a chamada medida em andamento nesta thread foi atendida pelo cache de consultas."""
+        self._local.cache_hit = True
+
+    def span(self, stage: str):
+        """Context manager que mede o bloco; atribua `.rows` dentro dele para registrar a contagem de linhas."""
+        return self._Span(self, stage) if self.enabled else self._NULL_SPAN
+
+    @staticmethod
+    def row_count(result: Any) -> Optional[int]:
+        """Linhas de um retorno típico: DataFrame, lista ou a primeira lista de uma tupla (resultado, erro)."""
+        if isinstance(result, tuple):
+            result = next((item for item in result if isinstance(item, (list, pd.DataFrame))), None)
+        if isinstance(result, (list, pd.DataFrame)):
+            return len(result)
+        return None
+
+    def timed(self, stage: str, rows: Optional[Callable[[Any], Optional[int]]] = None):
+        """Decorador que registra a duração de cada chamada em `stage`; `rows` extrai a contagem do retorno.
+
+        Chamadas marcadas com `mark_cache_hit` vão para CACHE_HIT_STAGE, para não baixar as latências de `stage`.
+        """
+        count_rows = rows or self.row_count
+
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                outer_hit = getattr(self._local, "cache_hit", False)
+                self._local.cache_hit = False
+                started, row_total = time.perf_counter(), None
+                try:
+                    result = func(*args, **kwargs)
+                    row_total = count_rows(result)
+                    return result
+                finally:
+                    # Como em _Span, chamadas que lançam exceção também entram na medida (sem linhas)
+                    hit, self._local.cache_hit = self._local.cache_hit, outer_hit
+                    self.record(self.CACHE_HIT_STAGE if hit else stage, started, row_total)
+            return wrapper
+        return decorate
+
+    def samples(self) -> List[Tuple[float, str, float, Optional[int]]]:
+        with self._lock:
+            return list(self._samples)
+
+    def counts(self) -> Dict[str, int]:
+        """Chamadas por etapa desde a última limpeza ou gravação, inclusive as que já saíram do buffer circular."""
+        with self._lock:
+            return dict(self._counts)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+    def flush(self, db_manager: "DatabaseManager") -> int:
+        """Grava as medidas do buffer na tabela perf_samples e zera buffer e contagens; retorna quantas foram gravadas."""
+        with self._lock:
+            pending = list(self._samples)
+            self._samples.clear()
+            self._counts.clear()
+        if pending:
+            db_manager.save_perf_samples(pending)
+        return len(pending)
+
+    @staticmethod
+    def statistics(samples: pd.DataFrame) -> pd.DataFrame:
+        """p50/p95/máximo/total em ms e linhas médias por etapa, a partir de colunas stage, elapsed_ms e row_count."""
+        if samples.empty:
+            return pd.DataFrame(columns=["stage", "calls", "p50_ms", "p95_ms", "max_ms", "total_ms", "avg_rows"])
+        grouped = samples.assign(row_count=pd.to_numeric(samples["row_count"], errors="coerce")).groupby("stage")
+        stats = pd.DataFrame({
+            "calls": grouped["elapsed_ms"].size(),
+            "p50_ms": grouped["elapsed_ms"].quantile(0.5),
+            "p95_ms": grouped["elapsed_ms"].quantile(0.95),
+            "max_ms": grouped["elapsed_ms"].max(),
+            "total_ms": grouped["elapsed_ms"].sum(),
+            "avg_rows": grouped["row_count"].mean(),
+        })
+        return stats.reset_index().sort_values("total_ms", ascending=False, ignore_index=True)
+
+PERF_MONITOR = PerformanceMonitor()
+
 # ==============================================================================
 # --- 2. GERENCIADOR DE BANCO DE DADOS (Sem alterações) ---
 # ==============================================================================
 class DatabaseManager:
     """Gerencia todas as interações com o banco de dados SQLite."""
-    def __init__(self, db_path: str):
-        self.db_path = db_path
-        self._setup_database()
+    # Migrações incrementais, aplicadas em ordem e registradas em PRAGMA user_version.
+    MIGRATIONS: List[List[str]] = [
+        [
+            "CREATE INDEX IF NOT EXISTS idx_summary_period ON analysis_summary (period)",
+            "CREATE INDEX IF NOT EXISTS idx_summary_unit_period ON analysis_summary (unit_name, period)",
+            "CREATE INDEX IF NOT EXISTS idx_details_summary ON analysis_details (summary_id)",
+        ],
+        [
+            "CREATE TABLE IF NOT EXISTS unit_regions (unit_name TEXT PRIMARY KEY, region TEXT NOT NULL)",
+        ],
+        [
+            # Dados brutos de cada linha, para reclassificar o histórico sem reimportar os CSVs
+            "ALTER TABLE analysis_details ADD COLUMN source_kind TEXT",
+            "ALTER TABLE analysis_details ADD COLUMN account_code TEXT",
+            "ALTER TABLE analysis_details ADD COLUMN indicator_key TEXT",
+            "ALTER TABLE analysis_details ADD COLUMN raw_value REAL",
+            "ALTER TABLE analysis_summary ADD COLUMN reclassified_at TEXT",
+            "CREATE INDEX IF NOT EXISTS idx_details_account_code ON analysis_details (account_code)",
+            "CREATE INDEX IF NOT EXISTS idx_details_source_key ON analysis_details (source_kind, indicator_key)",
+        ],
+        [
+            # Mapeamentos versionados: cada alteração ganha uma versão nova em mapping_history
+            """CREATE TABLE IF NOT EXISTS mappings (
+                mapping_name TEXT NOT NULL, map_key TEXT NOT NULL, group_name TEXT NOT NULL, subgroup_name TEXT,
+                version INTEGER NOT NULL, PRIMARY KEY (mapping_name, map_key)
+            )""",
+            """CREATE TABLE IF NOT EXISTS mapping_history (
+                version INTEGER PRIMARY KEY AUTOINCREMENT, changed_at TEXT NOT NULL, mapping_name TEXT NOT NULL,
+                map_key TEXT NOT NULL, action TEXT NOT NULL, group_name TEXT, subgroup_name TEXT
+            )""",
+            "ALTER TABLE analysis_summary ADD COLUMN mapping_version INTEGER",
+        ],
+        [
+            # Índice de texto completo dos detalhes (rowid = analysis_details.id), mantido por gatilhos
+            "CREATE VIRTUAL TABLE IF NOT EXISTS details_fts USING fts5(indicator, group_name, subgroup_name, unit_name, tokenize = 'unicode61 remove_diacritics 2')",
+            """INSERT INTO details_fts (rowid, indicator, group_name, subgroup_name, unit_name)
+               SELECT d.id, d.indicator, d.group_name, d.subgroup_name, s.unit_name
+               FROM analysis_details d JOIN analysis_summary s ON s.id = d.summary_id""",
+            """CREATE TRIGGER IF NOT EXISTS trg_details_fts_insert AFTER INSERT ON analysis_details BEGIN
+                   INSERT INTO details_fts (rowid, indicator, group_name, subgroup_name, unit_name)
+                   SELECT new.id, new.indicator, new.group_name, new.subgroup_name, unit_name FROM analysis_summary WHERE id = new.summary_id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_details_fts_delete AFTER DELETE ON analysis_details BEGIN
+                   DELETE FROM details_fts WHERE rowid = old.id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_details_fts_update AFTER UPDATE OF indicator, group_name, subgroup_name ON analysis_details BEGIN
+                   UPDATE details_fts SET indicator = new.indicator, group_name = new.group_name, subgroup_name = new.subgroup_name WHERE rowid = new.id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_summary_fts_rename AFTER UPDATE OF unit_name ON analysis_summary BEGIN
+                   UPDATE details_fts SET unit_name = new.unit_name WHERE rowid IN (SELECT id FROM analysis_details WHERE summary_id = new.id);
+               END""",
+            "CREATE INDEX IF NOT EXISTS idx_details_value ON analysis_details (value)",
+        ],
+        [
+            # Totais por importação/grupo/subgrupo, para consolidar a rede sem varrer os detalhes
+            """CREATE TABLE IF NOT EXISTS analysis_rollups (
+                summary_id INTEGER NOT NULL, group_name TEXT NOT NULL, subgroup_name TEXT NOT NULL, total_value REAL NOT NULL,
+                PRIMARY KEY (summary_id, group_name, subgroup_name),
+                FOREIGN KEY (summary_id) REFERENCES analysis_summary (id) ON DELETE CASCADE
+            )""",
+            """INSERT OR REPLACE INTO analysis_rollups (summary_id, group_name, subgroup_name, total_value)
+               SELECT summary_id, group_name, subgroup_name, SUM(value) FROM analysis_details GROUP BY summary_id, group_name, subgroup_name""",
+        ],
+        [
+            # Índice contínuo do período (ano * 12 + mês - 1): intervalos de meses de qualquer ano viram range scans
+            "ALTER TABLE analysis_summary ADD COLUMN period_index INTEGER",
+            "UPDATE analysis_summary SET period_index = CAST(substr(period, 4) AS INTEGER) * 12 + CAST(substr(period, 1, 2) AS INTEGER) - 1",
+            "CREATE INDEX IF NOT EXISTS idx_summary_period_index ON analysis_summary (period_index)",
+            "CREATE INDEX IF NOT EXISTS idx_summary_unit_period_index ON analysis_summary (unit_name, period_index)",
+        ],
+        [
+            # Valores atípicos sinalizados pelo AnomalyDetector a cada importação
+            """CREATE TABLE IF NOT EXISTS anomaly_flags (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, summary_id INTEGER NOT NULL, unit_name TEXT NOT NULL, period_index INTEGER NOT NULL,
+                group_name TEXT NOT NULL, subgroup_name TEXT NOT NULL, reason TEXT NOT NULL, value REAL NOT NULL,
+                unit_median REAL, unit_z REAL, network_median REAL, network_z REAL, created_at TEXT NOT NULL,
+                FOREIGN KEY (summary_id) REFERENCES analysis_summary (id) ON DELETE CASCADE
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_anomaly_flags_summary ON anomaly_flags (summary_id)",
+            "CREATE INDEX IF NOT EXISTS idx_anomaly_flags_unit_period ON anomaly_flags (unit_name, period_index)",
+            "CREATE INDEX IF NOT EXISTS idx_anomaly_flags_period ON anomaly_flags (period_index)",
+        ],
+        [
+            # Orçamento mensal por unidade e grupo do DRE, com o sinal do grupo (como nos detalhes)
+            """CREATE TABLE IF NOT EXISTS budgets (
+                unit_name TEXT NOT NULL, period_index INTEGER NOT NULL, group_name TEXT NOT NULL, amount REAL NOT NULL,
+                updated_at TEXT NOT NULL, PRIMARY KEY (unit_name, period_index, group_name)
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_budgets_period ON budgets (period_index)",
+        ],
+        [
+            # Índice de cobertura do ranking da rede: totais por período lidos sem tocar na tabela
+            "CREATE INDEX IF NOT EXISTS idx_summary_period_unit_totals ON analysis_summary (period_index, unit_name, net_result, total_revenue)",
+        ],
+        [
+            # Drill-down de uma linha do DRE até os detalhes que a compõem
+            "CREATE INDEX IF NOT EXISTS idx_details_line ON analysis_details (group_name, subgroup_name, indicator, summary_id)",
+        ],
+        [
+            # Medidas de desempenho descarregadas do buffer do PerformanceMonitor
+            """CREATE TABLE IF NOT EXISTS perf_samples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, recorded_at TEXT NOT NULL, stage TEXT NOT NULL,
+                elapsed_ms REAL NOT NULL, row_count INTEGER
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_perf_samples_recorded ON perf_samples (recorded_at)",
+        ],
+        [
+            # Linhas que a reclassificação passou a ignorar ficam guardadas (com os dados brutos) e
+            # marcadas como excluídas: fora de totais, rollups, consultas e busca, mas reversíveis
+            "ALTER TABLE analysis_details ADD COLUMN excluded INTEGER NOT NULL DEFAULT 0",
+            """CREATE TRIGGER IF NOT EXISTS trg_details_fts_exclude AFTER UPDATE OF excluded ON analysis_details
+               WHEN new.excluded = 1 AND old.excluded = 0 BEGIN
+                   DELETE FROM details_fts WHERE rowid = new.id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_details_fts_include AFTER UPDATE OF excluded ON analysis_details
+               WHEN new.excluded = 0 AND old.excluded = 1 BEGIN
+                   INSERT INTO details_fts (rowid, indicator, group_name, subgroup_name, unit_name)
+                   SELECT new.id, new.indicator, new.group_name, new.subgroup_name, unit_name FROM analysis_summary WHERE id = new.summary_id;
+               END""",
+        ],
+        [
+            # anomaly_flags guarda unit_name para filtrar pelo índice; o gatilho o mantém igual ao do resumo
+            # quando a unidade é renomeada, e o UPDATE corrige bancos com unidades já renomeadas
+            """CREATE TRIGGER IF NOT EXISTS trg_summary_anomaly_rename AFTER UPDATE OF unit_name ON analysis_summary BEGIN
+                   UPDATE anomaly_flags SET unit_name = new.unit_name WHERE summary_id = new.id;
+               END""",
+            "UPDATE anomaly_flags SET unit_name = (SELECT s.unit_name FROM analysis_summary s WHERE s.id = anomaly_flags.summary_id)",
+        ],
+    ]
 
-    def _get_connection(self) -> sqlite3.Connection:
+    def __init__(self, db_path: str, defer_setup: bool = False):
+        self.db_path = db_path
+        self._ready = False
+        self._setup_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._query_cache: Dict[Tuple, Any] = {}
+        if not defer_setup:
+            self.ensure_ready()
+
+    def _connect(self) -> sqlite3.Connection:
         conn = sqlite3.connect(self.db_path)
         conn.execute('PRAGMA foreign_keys = ON;')
         return conn
 
+    def _get_connection(self) -> sqlite3.Connection:
+        if not self._ready:
+            self.ensure_ready()
+        return self._connect()
+
+    def ensure_ready(self):
+        """Cria e migra o banco uma única vez; seguro para chamadas de várias threads."""
+        with self._setup_lock:
+            if self._ready:
+                return
+            self._setup_database()
+            self._ready = True
+
+    def _cached(self, key: Tuple, loader):
+        with self._cache_lock:
+            if key in self._query_cache:
+                if PERF_MONITOR.enabled:
+                    PERF_MONITOR.mark_cache_hit()
+                return self._query_cache[key]
+        value = loader()
+        with self._cache_lock:
+            self._query_cache[key] = value
+        return value
+
+    def invalidate_cache(self):
+        with self._cache_lock:
+            self._query_cache.clear()
+
+    def warm_cache(self):
+        """Percorre tabelas e índices principais para trazer suas páginas ao cache do SQLite/SO."""
+        with self._get_connection() as conn:
+            conn.execute("SELECT COUNT(*), SUM(net_result) FROM analysis_summary").fetchone()
+            conn.execute("SELECT COUNT(*), SUM(value) FROM analysis_details").fetchone()
+            conn.execute("SELECT COUNT(DISTINCT period_index) FROM analysis_summary INDEXED BY idx_summary_period_index").fetchone()
+
+    def _migrate(self, conn: sqlite3.Connection):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, statements in enumerate(self.MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target}")
+
     def _setup_database(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        with self._get_connection() as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS analysis_summary (
@@ -287,6 +710,7 @@ class DatabaseManager:
                     details TEXT
                 )
             ''')
+            self._migrate(conn)
             conn.commit()
 
     def log_action(self, action_type: str, details: str = ""):
@@ -298,7 +722,11 @@ class DatabaseManager:
             )
             conn.commit()
 
-    def save_imported_data(self, unit_name: str, month: int, source_file: str, all_details: List[Dict[str, Any]], collector: Optional[str] = 'N/A') -> bool:
+    @PERF_MONITOR.timed("db.save_imported_data")
+    def save_imported_data(self, unit_name: str, month: int, source_file: str, all_details: List[Dict[str, Any]], collector: Optional[str] = 'N/A', year: Optional[int] = None) -> Optional[int]:
+        """Grava a importação (substituindo a anterior do mesmo arquivo) e retorna o id do resumo, ou None em caso de erro."""
+        year = current_year() if year is None else year
+        period = f"{month:02d}/{year}"
         total_revenue = sum(item['value'] for item in all_details if item['value'] > 0)
         total_expense = sum(item['value'] for item in all_details if item['value'] < 0)
         net_result = total_revenue + total_expense
@@ -309,68 +737,407 @@ class DatabaseManager:
                 # Remove existing data for the same consolidated file to avoid duplicates
                 cursor.execute(
                     "DELETE FROM analysis_details WHERE summary_id IN (SELECT id FROM analysis_summary WHERE unit_name = ? AND period = ? AND source_file = ?)",
-                    (unit_name, f"{month:02d}/{Config.CURRENT_YEAR}", source_file)
+                    (unit_name, period, source_file)
                 )
                 cursor.execute(
                     "DELETE FROM analysis_summary WHERE unit_name = ? AND period = ? AND source_file = ?",
-                    (unit_name, f"{month:02d}/{Config.CURRENT_YEAR}", source_file)
+                    (unit_name, period, source_file)
                 )
 
                 # Insert new summary
                 cursor.execute(
-                    'INSERT INTO analysis_summary (unit_name, period, source_file, generation_date, collector, total_revenue, total_expense, net_result) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                    (unit_name, f"{month:02d}/{Config.CURRENT_YEAR}", source_file, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), collector, total_revenue, total_expense, net_result)
+                    'INSERT INTO analysis_summary (unit_name, period, period_index, source_file, generation_date, collector, total_revenue, total_expense, net_result, mapping_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (unit_name, period, period_index(year, month), source_file, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), collector, total_revenue, total_expense, net_result, Config.MAPPINGS_REVISION)
                 )
                 
                 summary_id = cursor.lastrowid
 
                 # Insert new details
                 detail_values = [
-                    (summary_id, item['group'], item['subgroup'], item['indicator'], item['value'])
+                    (summary_id, item['group'], item['subgroup'], item['indicator'], item['value'],
+                     item.get('source'), item.get('account_code'), item.get('indicator_key'), item.get('raw_value'))
                     for item in all_details
                 ]
-                cursor.executemany('INSERT INTO analysis_details (summary_id, group_name, subgroup_name, indicator, value) VALUES (?, ?, ?, ?, ?)', detail_values)
+                cursor.executemany(
+                    'INSERT INTO analysis_details (summary_id, group_name, subgroup_name, indicator, value, source_kind, account_code, indicator_key, raw_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    detail_values
+                )
+                self._refresh_rollups(conn, [cast(int, summary_id)])
                 
                 conn.commit()
+                self.invalidate_cache()
                 self.log_action("IMPORT_SUCCESS", f"Dados para '{source_file}' importados para '{unit_name}'.")
-                return True
+                return summary_id
             except Exception as e:
                 conn.rollback()
                 self.log_action("IMPORT_ERROR", f"Erro ao importar '{source_file}' para '{unit_name}': {e}")
                 messagebox.showerror("Erro no Banco de Dados", f"Erro ao salvar dados do arquivo {source_file}.\n{e}")
-                return False
+                return None
     
-    def get_detailed_results(self, unit_name: str, start_month: int, end_month: int) -> pd.DataFrame:
+    def _refresh_rollups(self, conn: sqlite3.Connection, summary_ids: List[int]):
+        """Recalcula analysis_rollups das importações informadas, dentro da transação de quem chama."""
+        for start in range(0, len(summary_ids), 500):
+            batch = summary_ids[start:start + 500]
+            placeholders = ','.join('?' for _ in batch)
+            conn.execute(f"DELETE FROM analysis_rollups WHERE summary_id IN ({placeholders})", batch)
+            conn.execute(f"""
+                INSERT INTO analysis_rollups (summary_id, group_name, subgroup_name, total_value)
+                SELECT summary_id, group_name, subgroup_name, SUM(value)
+                FROM analysis_details
+                WHERE summary_id IN ({placeholders}) AND excluded = 0
+                GROUP BY summary_id, group_name, subgroup_name
+            """, batch)
+
+    @staticmethod
+    def _units_condition(units: Union[str, List[str], None], column: str) -> Tuple[str, List[Any]]:
+        """Filtro SQL para uma unidade, uma lista de unidades ou (None) a rede inteira."""
+        if units is None:
+            return "1 = 1", []
+        if isinstance(units, str):
+            return f"{column} = ?", [units]
+        return f"{column} IN ({','.join('?' for _ in units)})", list(units)
+
+    @PERF_MONITOR.timed("db.get_consolidated_results")
+    def get_consolidated_results(self, unit_names: Optional[List[str]], start_month: int, end_month: int,
+                                 start_year: Optional[int] = None, end_year: Optional[int] = None) -> pd.DataFrame:
+        """Totais por unidade/grupo/subgrupo de várias unidades (None = rede inteira) em uma só consulta.
+
+        Lê analysis_rollups em vez dos detalhes; o resultado tem uma linha por unidade e subgrupo.
+        """
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        unit_condition, unit_params = self._units_condition(unit_names, "s.unit_name")
+        query = f"""
+            SELECT s.unit_name, r.group_name, r.subgroup_name, SUM(r.total_value) as total_value
+            FROM analysis_summary s
+            JOIN analysis_rollups r ON r.summary_id = s.id
+            WHERE s.period_index BETWEEN ? AND ? AND {unit_condition}
+            GROUP BY s.unit_name, r.group_name, r.subgroup_name
+        """
         with self._get_connection() as conn:
-            periods = [f"{month:02d}/{Config.CURRENT_YEAR}" for month in range(start_month, end_month + 1)]
-            placeholders = ','.join('?' for _ in periods)
+            return pd.read_sql_query(query, conn, params=tuple([first, last] + unit_params))
+
+    @PERF_MONITOR.timed("db.get_group_history")
+    def get_group_history(self, units: Union[str, List[str], None], first_period: int, last_period: int) -> pd.DataFrame:
+        """Totais mensais por (unit_name, period_index, group_name) das unidades, entre dois period_index.
+
+        Uma única consulta para todas as unidades pedidas, base das séries do TrendEngine.
+        """
+        unit_condition, unit_params = self._units_condition(units, "s.unit_name")
+        query = f"""
+            SELECT s.unit_name, s.period_index, r.group_name, SUM(r.total_value) AS total_value
+            FROM analysis_summary s
+            JOIN analysis_rollups r ON r.summary_id = s.id
+            WHERE {unit_condition} AND s.period_index BETWEEN ? AND ?
+            GROUP BY s.unit_name, s.period_index, r.group_name
+        """
+        with self._get_connection() as conn:
+            return pd.read_sql_query(query, conn, params=tuple(unit_params + [first_period, last_period]))
+
+    @PERF_MONITOR.timed("db.get_rollup_history")
+    def get_rollup_history(self, first_period: int, last_period: int) -> pd.DataFrame:
+        """Série mensal de toda a rede por subgrupo, entre dois period_index (inclusive).
+
+        Uma linha por (unit_name, period_index, group_name, subgroup_name) com total_value; o
+        DataFrame fica no cache de consultas até a próxima importação e não deve ser alterado.
+        """
+        query = """
+            SELECT s.unit_name, s.period_index, r.group_name, r.subgroup_name, SUM(r.total_value) as total_value
+            FROM analysis_summary s
+            JOIN analysis_rollups r ON r.summary_id = s.id
+            WHERE s.period_index BETWEEN ? AND ?
+            GROUP BY s.unit_name, s.period_index, r.group_name, r.subgroup_name
+        """
+        def load() -> pd.DataFrame:
+            with self._get_connection() as conn:
+                return pd.read_sql_query(query, conn, params=(first_period, last_period))
+        return self._cached(("rollup_history", first_period, last_period), load)
+
+    @PERF_MONITOR.timed("db.get_anomaly_inputs")
+    def get_anomaly_inputs(self, summary_id: int, history_months: int) -> Optional[Tuple[str, int, pd.DataFrame, pd.DataFrame]]:
+        """Dados do AnomalyDetector para uma importação: (unidade, period_index, histórico, rede).
+
+        O histórico traz os totais por mês e subgrupo da unidade nos `history_months` meses
+        anteriores e no próprio mês; a rede, os totais por unidade e subgrupo no mesmo mês.
+        """
+        with self._get_connection() as conn:
+            row = conn.execute("SELECT unit_name, period_index FROM analysis_summary WHERE id = ?", (summary_id,)).fetchone()
+            if row is None:
+                return None
+            unit_name, current_period = row
+            history = pd.read_sql_query("""
+                SELECT s.period_index, r.group_name, r.subgroup_name, SUM(r.total_value) as total_value
+                FROM analysis_summary s
+                JOIN analysis_rollups r ON r.summary_id = s.id
+                WHERE s.unit_name = ? AND s.period_index BETWEEN ? AND ?
+                GROUP BY s.period_index, r.group_name, r.subgroup_name
+            """, conn, params=(unit_name, current_period - history_months, current_period))
+            network = pd.read_sql_query("""
+                SELECT s.unit_name, r.group_name, r.subgroup_name, SUM(r.total_value) as total_value
+                FROM analysis_summary s
+                JOIN analysis_rollups r ON r.summary_id = s.id
+                WHERE s.period_index = ?
+                GROUP BY s.unit_name, r.group_name, r.subgroup_name
+            """, conn, params=(current_period,))
+        return unit_name, current_period, history, network
+
+    @PERF_MONITOR.timed("db.save_anomaly_flags")
+    def save_anomaly_flags(self, summary_id: int, flags: List[Tuple]):
+        """Substitui os alertas da importação. Cada alerta: (unit_name, period_index, group_name,
+        subgroup_name, reason, value, unit_median, unit_z, network_median, network_z)."""
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._get_connection() as conn:
+            conn.execute("DELETE FROM anomaly_flags WHERE summary_id = ?", (summary_id,))
+            conn.executemany("""
+                INSERT INTO anomaly_flags (summary_id, unit_name, period_index, group_name, subgroup_name, reason, value,
+                                           unit_median, unit_z, network_median, network_z, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(summary_id, *flag, timestamp) for flag in flags])
+            conn.commit()
+
+    @PERF_MONITOR.timed("db.get_anomaly_flags")
+    def get_anomaly_flags(self, units: Union[str, List[str], None], start_month: int, end_month: int,
+                          start_year: Optional[int] = None, end_year: Optional[int] = None) -> pd.DataFrame:
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        unit_condition, unit_params = self._units_condition(units, "unit_name")
+        query = f"""
+            SELECT unit_name, period_index, group_name, subgroup_name, reason, value, unit_median, unit_z, network_median, network_z
+            FROM anomaly_flags
+            WHERE {unit_condition} AND period_index BETWEEN ? AND ?
+            ORDER BY period_index, unit_name, group_name, subgroup_name
+        """
+        with self._get_connection() as conn:
+            return pd.read_sql_query(query, conn, params=tuple(unit_params + [first, last]))
+
+    @PERF_MONITOR.timed("db.get_detailed_results")
+    def get_detailed_results(self, unit_name: Optional[str], start_month: int, end_month: int,
+                             start_year: Optional[int] = None, end_year: Optional[int] = None) -> pd.DataFrame:
+        """Totais por grupo/subgrupo/indicador de uma unidade, ou da rede inteira com `unit_name=None`.
+
+        Os anos seguem period_bounds: sem ano vale o corrente, e o intervalo pode atravessar anos.
+        """
+        with self._get_connection() as conn:
+            first, last = period_bounds(start_month, end_month, start_year, end_year)
+            unit_filter = "s.unit_name = ? AND " if unit_name is not None else ""
             query = f"""
                 SELECT d.group_name, d.subgroup_name, d.indicator, SUM(d.value) as total_value
                 FROM analysis_details d
                 JOIN analysis_summary s ON d.summary_id = s.id
-                WHERE s.unit_name = ? AND s.period IN ({placeholders})
+                WHERE {unit_filter}s.period_index BETWEEN ? AND ? AND d.excluded = 0
                 GROUP BY d.group_name, d.subgroup_name, d.indicator
                 ORDER BY d.group_name, d.subgroup_name, d.indicator
             """
             # pandas typing expects a sequence/tuple; use tuple to avoid type complaints
-            params = tuple([unit_name] + periods)
+            params = tuple(([unit_name] if unit_name is not None else []) + [first, last])
             return pd.read_sql_query(query, conn, params=params)
 
+    def iter_detailed_results(self, unit_name: Optional[str], start_month: int, end_month: int, chunk_size: int = 5000,
+                              start_year: Optional[int] = None, end_year: Optional[int] = None) -> Iterator[Tuple[str, str, str, float]]:
+        """Mesmos totais de get_detailed_results, lidos do cursor já na ordem do DRE (ver iter_dre_tree)."""
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        unit_filter = "s.unit_name = ? AND " if unit_name is not None else ""
+        rank_cases = " ".join(f"WHEN ? THEN {i}" for i in range(len(Config.DRE_GROUP_ORDER)))
+        query = f"""
+            SELECT d.group_name, d.subgroup_name, d.indicator, SUM(d.value) as total_value
+            FROM analysis_details d
+            JOIN analysis_summary s ON d.summary_id = s.id
+            WHERE {unit_filter}s.period_index BETWEEN ? AND ? AND d.excluded = 0
+            GROUP BY d.group_name, d.subgroup_name, d.indicator
+            ORDER BY CASE d.group_name {rank_cases} ELSE {len(Config.DRE_GROUP_ORDER)} END, d.group_name, d.subgroup_name, d.indicator
+        """
+        params = ([unit_name] if unit_name is not None else []) + [first, last] + list(Config.DRE_GROUP_ORDER)
+        for chunk in self._iter_query_chunks(query, params, chunk_size):
+            yield from chunk
+
+    def _iter_query_chunks(self, query: str, params: List[Any], chunk_size: int) -> Iterator[List[tuple]]:
+        """Executa `query` e entrega as linhas em blocos de `chunk_size`, sem materializar o resultado."""
+        conn = self._get_connection()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def iter_summary_rows(self, unit_name: Optional[str], start_month: int, end_month: int, chunk_size: int = 5000,
+                          start_year: Optional[int] = None, end_year: Optional[int] = None) -> Iterator[List[tuple]]:
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        unit_filter = "unit_name = ? AND " if unit_name is not None else ""
+        query = f"""
+            SELECT unit_name, period, source_file, collector, total_revenue, total_expense, net_result
+            FROM analysis_summary
+            WHERE {unit_filter}period_index BETWEEN ? AND ?
+            ORDER BY unit_name, period_index, source_file
+        """
+        return self._iter_query_chunks(query, ([unit_name] if unit_name is not None else []) + [first, last], chunk_size)
+
+    def iter_detail_rows(self, unit_name: Optional[str], start_month: int, end_month: int, chunk_size: int = 5000,
+                         start_year: Optional[int] = None, end_year: Optional[int] = None) -> Iterator[List[tuple]]:
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        unit_filter = "s.unit_name = ? AND " if unit_name is not None else ""
+        query = f"""
+            SELECT s.unit_name, s.period, s.source_file, d.group_name, d.subgroup_name, d.indicator, d.value
+            FROM analysis_summary s
+            JOIN analysis_details d ON d.summary_id = s.id
+            WHERE {unit_filter}s.period_index BETWEEN ? AND ? AND d.excluded = 0
+            ORDER BY s.unit_name, s.period_index, s.id, d.id
+        """
+        return self._iter_query_chunks(query, ([unit_name] if unit_name is not None else []) + [first, last], chunk_size)
+
+    def iter_reclassification_candidates(self, changed_keys: Optional[Dict[str, Iterable[str]]] = None, chunk_size: int = 5000) -> Iterator[List[tuple]]:
+        """Linhas de detalhe que podem mudar de classificação com a alteração das chaves informadas.
+
+        `changed_keys` mapeia o nome do mapeamento (CHART_OF_ACCOUNTS, DESCRIPTION_MAPPING ou
+        NOTAS_NEGOCIO_MAPPING) às chaves alteradas; None seleciona todas as linhas reclassificáveis.
+        Linhas importadas antes do armazenamento dos dados brutos (source_kind nulo) não entram.
+        Inclui as linhas marcadas como excluídas, que voltam a valer se a nova regra as classificar.
+        Cada linha: (id, summary_id, source_kind, account_code, indicator_key, raw_value, collector,
+        group_name, subgroup_name, value, excluded).
+        """
+        conditions: List[str] = []
+        params: List[Any] = []
+        if changed_keys is None:
+            conditions.append("d.source_kind IS NOT NULL")
+        else:
+            codes = sorted(set(changed_keys.get("CHART_OF_ACCOUNTS", ())))
+            keywords = sorted(set(changed_keys.get("DESCRIPTION_MAPPING", ())))
+            nota_keys = sorted(set(changed_keys.get("NOTAS_NEGOCIO_MAPPING", ())))
+            if codes:
+                # Um código alterado também pode ser o prefixo de outros ('05.04' vale para '05.04.036')
+                code_tests = " OR ".join("d.account_code = ? OR substr(d.account_code, 1, ?) = ?" for _ in codes)
+                conditions.append(f"(d.source_kind = 'detalhamento' AND ({code_tests}))")
+                for code in codes:
+                    params.extend([code, len(code) + 1, code + "."])
+            if keywords:
+                # instr() reproduz o teste `chave in descrição` do importador (sensível a maiúsculas)
+                conditions.append(f"(d.source_kind = 'detalhamento' AND ({' OR '.join('instr(d.indicator_key, ?) > 0' for _ in keywords)}))")
+                params.extend(keywords)
+            if nota_keys:
+                conditions.append(f"(d.source_kind = 'notas' AND d.indicator_key IN ({','.join('?' for _ in nota_keys)}))")
+                params.extend(nota_keys)
+            if not conditions:
+                return iter(())
+        query = f"""
+            SELECT d.id, d.summary_id, d.source_kind, d.account_code, d.indicator_key, d.raw_value, s.collector,
+                   d.group_name, d.subgroup_name, d.value, d.excluded
+            FROM analysis_details d
+            JOIN analysis_summary s ON d.summary_id = s.id
+            WHERE {' OR '.join(conditions)}
+        """
+        return self._iter_query_chunks(query, params, chunk_size)
+
+    @PERF_MONITOR.timed("db.apply_reclassification")
+    def apply_reclassification(self, updates: List[Tuple[str, str, float, int]], excluded_ids: List[int], summary_ids: List[int], mapping_version: int):
+        """Aplica em uma transação as novas classificações (grupo, subgrupo, valor, id), que também
+        reativam linhas excluídas, marca como excluídas as que passaram a ser ignoradas e recalcula
+        os totais dos resumos afetados, que passam a registrar `mapping_version`."""
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._get_connection() as conn:
+            conn.executemany("UPDATE analysis_details SET group_name = ?, subgroup_name = ?, value = ?, excluded = 0 WHERE id = ?", updates)
+            conn.executemany("UPDATE analysis_details SET excluded = 1 WHERE id = ?", [(detail_id,) for detail_id in excluded_ids])
+            conn.executemany("""
+                UPDATE analysis_summary SET
+                    total_revenue = (SELECT COALESCE(SUM(value), 0) FROM analysis_details WHERE summary_id = analysis_summary.id AND excluded = 0 AND value > 0),
+                    total_expense = (SELECT COALESCE(SUM(value), 0) FROM analysis_details WHERE summary_id = analysis_summary.id AND excluded = 0 AND value < 0),
+                    net_result = (SELECT COALESCE(SUM(value), 0) FROM analysis_details WHERE summary_id = analysis_summary.id AND excluded = 0),
+                    reclassified_at = ?,
+                    mapping_version = ?
+                WHERE id = ?
+            """, [(timestamp, mapping_version, summary_id) for summary_id in summary_ids])
+            self._refresh_rollups(conn, summary_ids)
+            conn.commit()
+        self.invalidate_cache()
+
+    @PERF_MONITOR.timed("db.get_partition_fingerprints")
+    def get_partition_fingerprints(self) -> Dict[Tuple[str, str], str]:
+        """Impressão digital de cada partição (ano, unidade), usada pelo snapshot incremental.
+
+        Toda reimportação apaga e recria o resumo com novo id e nova data de geração, e toda
+        reclassificação marca reclassified_at, então a impressão digital muda junto com os dados.
+        Arrecadadoras renomeadas ou mescladas não mudam nada disso, então entram como um hash
+        das arrecadadoras de cada resumo, na ordem dos ids.
+        """
+        with self._get_connection() as conn:
+            rows = conn.execute("""
+                SELECT period_index / 12 AS year, unit_name, COUNT(*), MAX(id), MAX(generation_date), MAX(reclassified_at), ROUND(SUM(net_result), 2)
+                FROM analysis_summary
+                GROUP BY year, unit_name
+            """).fetchall()
+            collectors: Dict[Tuple[str, str], Any] = {}
+            for year, unit, collector in conn.execute(
+                    "SELECT period_index / 12, unit_name, COALESCE(collector, '') FROM analysis_summary ORDER BY unit_name, period_index, id"):
+                collectors.setdefault((str(year), unit), hashlib.sha1()).update(collector.encode("utf-8") + b"\x1f")
+        return {(str(year), unit): f"{count}:{max_id}:{last_generated}:{last_reclassified}:{net}:{collectors[(str(year), unit)].hexdigest()[:12]}"
+                for year, unit, count, max_id, last_generated, last_reclassified, net in rows}
+
+    def iter_partition_summary_rows(self, year: str, unit_name: str, chunk_size: int = 5000) -> Iterator[List[tuple]]:
+        first, last = period_bounds(1, 12, int(year))
+        query = """
+            SELECT id, unit_name, period, period_index % 12 + 1, period_index / 12,
+                   generation_date, collector, source_file, total_revenue, total_expense, net_result
+            FROM analysis_summary
+            WHERE unit_name = ? AND period_index BETWEEN ? AND ?
+            ORDER BY period_index, id
+        """
+        return self._iter_query_chunks(query, [unit_name, first, last], chunk_size)
+
+    def iter_partition_detail_rows(self, year: str, unit_name: str, chunk_size: int = 5000) -> Iterator[List[tuple]]:
+        first, last = period_bounds(1, 12, int(year))
+        query = """
+            SELECT d.id, d.summary_id, s.unit_name, s.period_index % 12 + 1, s.period_index / 12,
+                   d.group_name, d.subgroup_name, d.indicator, d.value
+            FROM analysis_summary s
+            JOIN analysis_details d ON d.summary_id = s.id
+            WHERE s.unit_name = ? AND s.period_index BETWEEN ? AND ? AND d.excluded = 0
+            ORDER BY s.period_index, s.id, d.id
+        """
+        return self._iter_query_chunks(query, [unit_name, first, last], chunk_size)
+
+    @PERF_MONITOR.timed("db.get_collector_results")
+    def get_collector_results(self, unit_name: Union[str, List[str], None], start_month: int, end_month: int,
+                              start_year: Optional[int] = None, end_year: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """Totais de receitas/despesas por arrecadadora, no formato esperado pelo PDFExporter.
+
+        `unit_name` pode ser uma unidade, uma lista de unidades ou None (rede inteira).
+        """
+        with self._get_connection() as conn:
+            first, last = period_bounds(start_month, end_month, start_year, end_year)
+            unit_condition, unit_params = self._units_condition(unit_name, "unit_name")
+            query = f"""
+                SELECT COALESCE(collector, 'N/A'), SUM(total_revenue), SUM(total_expense)
+                FROM analysis_summary
+                WHERE {unit_condition} AND period_index BETWEEN ? AND ?
+                GROUP BY COALESCE(collector, 'N/A')
+                ORDER BY 1
+            """
+            rows = conn.execute(query, unit_params + [first, last]).fetchall()
+        return {
+            ("Consolidado" if collector == 'N/A' else collector): {"receitas": revenue or 0.0, "despesas": expense or 0.0}
+            for collector, revenue, expense in rows
+        }
+
+    @PERF_MONITOR.timed("db.get_global_kpis_for_current_month")
     def get_global_kpis_for_current_month(self) -> Dict[str, Any]:
-        current_month_period = f"{datetime.datetime.now().month:02d}/{Config.CURRENT_YEAR}"
+        today = datetime.date.today()
+        current_period = period_index(today.year, today.month)
+        return self._cached(("global_kpis", current_period), lambda: self._load_global_kpis(current_period))
+
+    def _load_global_kpis(self, current_period: int) -> Dict[str, Any]:
         with self._get_connection() as conn:
-            query = "SELECT SUM(net_result) as total_net, SUM(total_revenue) as total_revenue FROM analysis_summary WHERE period = ?"
-            df = pd.read_sql_query(query, conn, params=(current_month_period,))
+            query = "SELECT SUM(net_result) as total_net, SUM(total_revenue) as total_revenue FROM analysis_summary WHERE period_index = ?"
+            df = pd.read_sql_query(query, conn, params=(current_period,))
             
             top_units_query = """
                 SELECT unit_name, SUM(net_result) as monthly_net
                 FROM analysis_summary
-                WHERE period = ?
+                WHERE period_index = ?
                 GROUP BY unit_name
                 ORDER BY monthly_net DESC
                 LIMIT 3
             """
-            top_units_df = pd.read_sql_query(top_units_query, conn, params=(current_month_period,))
+            top_units_df = pd.read_sql_query(top_units_query, conn, params=(current_period,))
 
             return {
                 "total_net": df['total_net'].iloc[0] or 0.0,
@@ -378,26 +1145,175 @@ class DatabaseManager:
                 "top_units": top_units_df.to_dict('records')
             }
 
-    def get_comparison_data(self, unit_names: List[str], start_month: int, end_month: int) -> pd.DataFrame:
+    # Métricas aceitas por get_leaderboard (nome -> coluna de `metrics`)
+    LEADERBOARD_METRICS = ("net_result", "total_revenue", "margin", "growth")
+
+    @PERF_MONITOR.timed("db.get_leaderboard")
+    def get_leaderboard(self, start_month: int, end_month: int, start_year: Optional[int] = None, end_year: Optional[int] = None,
+                        metric: str = "net_result", limit: int = 50, offset: int = 0) -> pd.DataFrame:
+        """Ranking das unidades no período por `metric`, com uma página de `limit` linhas a partir de `offset`.
+
+        O período anterior tem o mesmo número de meses e termina logo antes do início; margin é
+        resultado / receita (%) e growth a variação do resultado contra o período anterior (%).
+        Cada linha traz rank, percentile (0-100), previous_rank, rank_change (positivo = subiu),
+        ranked_units e os cortes da rede p25, p50, p75 e p90 da métrica. Unidades sem valor para
+        a métrica (ex: sem receita, para margin) ficam fora do ranking.
+        """
+        if metric not in self.LEADERBOARD_METRICS:
+            raise ValueError(f"Métrica de ranking desconhecida: '{metric}'")
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        length = last - first + 1
+        query = f"""
+            WITH periods AS (
+                -- bucket 0 = período escolhido, 1 = anterior, 2 = o anterior a ele (base do crescimento do período 1)
+                SELECT unit_name, (? - period_index) / ? AS bucket, SUM(net_result) AS net_result, SUM(total_revenue) AS total_revenue
+                FROM analysis_summary INDEXED BY idx_summary_period_unit_totals
+                WHERE period_index BETWEEN ? AND ?
+                GROUP BY unit_name, bucket
+            ),
+            metrics AS (
+                SELECT unit_name, bucket, net_result, total_revenue,
+                       net_result * 100.0 / NULLIF(total_revenue, 0) AS margin,
+                       (net_result - prior_net) * 100.0 / NULLIF(ABS(prior_net), 0) AS growth
+                FROM (
+                    SELECT *, SUM(net_result) OVER (PARTITION BY unit_name ORDER BY bucket RANGE BETWEEN 1 FOLLOWING AND 1 FOLLOWING) AS prior_net
+                    FROM periods
+                )
+                WHERE bucket < 2
+            ),
+            ranked AS (
+                SELECT unit_name, bucket, net_result, total_revenue, margin, growth, {metric} AS value,
+                       RANK() OVER by_value AS rank,
+                       PERCENT_RANK() OVER (PARTITION BY bucket ORDER BY {metric}) * 100 AS percentile,
+                       COUNT(*) OVER (PARTITION BY bucket) AS ranked_units
+                FROM metrics
+                WHERE {metric} IS NOT NULL
+                WINDOW by_value AS (PARTITION BY bucket ORDER BY {metric} DESC)
+            ),
+            chosen AS (
+                -- Posição anterior e cortes por janela, sem autojunção de `ranked`
+                SELECT *,
+                       MAX(CASE WHEN bucket = 1 THEN rank END) OVER (PARTITION BY unit_name) AS previous_rank,
+                       MIN(CASE WHEN bucket = 0 AND percentile >= 25 THEN value END) OVER () AS p25,
+                       MIN(CASE WHEN bucket = 0 AND percentile >= 50 THEN value END) OVER () AS p50,
+                       MIN(CASE WHEN bucket = 0 AND percentile >= 75 THEN value END) OVER () AS p75,
+                       MIN(CASE WHEN bucket = 0 AND percentile >= 90 THEN value END) OVER () AS p90
+                FROM ranked
+            )
+            SELECT unit_name, net_result, total_revenue, margin, growth, value, rank, percentile,
+                   previous_rank, previous_rank - rank AS rank_change, ranked_units, p25, p50, p75, p90
+            FROM chosen
+            WHERE bucket = 0
+            ORDER BY rank, unit_name
+            LIMIT ? OFFSET ?
+        """
+        params = (last, length, last - 3 * length + 1, last, limit, offset)
+
+        def load() -> pd.DataFrame:
+            with self._get_connection() as conn:
+                return pd.read_sql_query(query, conn, params=params)
+        return self._cached(("leaderboard", first, last, metric, limit, offset), load)
+
+    # Ordenações aceitas por get_variance_report (nome -> cláusula ORDER BY)
+    VARIANCE_SORTS = {
+        "dre": "group_name, subgroup_name IS NOT NULL, subgroup_name",
+        "previous": "ABS(previous_delta) DESC, group_name, subgroup_name",
+        "last_year": "ABS(last_year_delta) DESC, group_name, subgroup_name",
+    }
+
+    @PERF_MONITOR.timed("db.get_variance_report")
+    def get_variance_report(self, units: Union[str, List[str], None], month: int, year: int, sort: str = "dre") -> pd.DataFrame:
+        """Variação do mês contra o mês anterior e contra o mesmo mês do ano anterior, em uma consulta.
+
+        Uma linha por grupo (subgroup_name nulo) e por subgrupo, com current_value, previous_value,
+        previous_delta, previous_pct, last_year_value, last_year_delta e last_year_pct. Os meses de
+        referência vêm de janelas RANGE sobre period_index, então meses sem importação contam como zero.
+        """
+        current = period_index(year, month)
+        unit_condition, unit_params = self._units_condition(units, "s.unit_name")
+        query = f"""
+            WITH base AS (
+                SELECT s.period_index, r.group_name, r.subgroup_name, SUM(r.total_value) AS total_value
+                FROM analysis_summary s
+                JOIN analysis_rollups r ON r.summary_id = s.id
+                WHERE {unit_condition} AND s.period_index IN (?, ?, ?)
+                GROUP BY s.period_index, r.group_name, r.subgroup_name
+            ),
+            lines AS (
+                SELECT period_index, group_name, subgroup_name, total_value FROM base
+                UNION ALL
+                SELECT period_index, group_name, NULL, SUM(total_value) FROM base GROUP BY period_index, group_name
+                UNION ALL
+                -- Linha zerada no mês atual, para que subgrupos que sumiram também apareçam
+                SELECT ?, group_name, subgroup_name, 0 FROM base
+                UNION ALL
+                SELECT ?, group_name, NULL, 0 FROM base
+            ),
+            monthly AS (
+                SELECT period_index, group_name, subgroup_name, SUM(total_value) AS total_value
+                FROM lines
+                GROUP BY period_index, group_name, subgroup_name
+            ),
+            windowed AS (
+                SELECT period_index, group_name, subgroup_name, total_value AS current_value,
+                       COALESCE(SUM(total_value) OVER previous_month, 0) AS previous_value,
+                       COALESCE(SUM(total_value) OVER same_month_last_year, 0) AS last_year_value
+                FROM monthly
+                WINDOW previous_month AS (PARTITION BY group_name, subgroup_name ORDER BY period_index RANGE BETWEEN 1 PRECEDING AND 1 PRECEDING),
+                       same_month_last_year AS (PARTITION BY group_name, subgroup_name ORDER BY period_index RANGE BETWEEN 12 PRECEDING AND 12 PRECEDING)
+            )
+            SELECT group_name, subgroup_name, current_value,
+                   previous_value, current_value - previous_value AS previous_delta,
+                   (current_value - previous_value) * 100.0 / NULLIF(ABS(previous_value), 0) AS previous_pct,
+                   last_year_value, current_value - last_year_value AS last_year_delta,
+                   (current_value - last_year_value) * 100.0 / NULLIF(ABS(last_year_value), 0) AS last_year_pct
+            FROM windowed
+            WHERE period_index = ?
+            ORDER BY {self.VARIANCE_SORTS[sort]}
+        """
+        params = unit_params + [current - 12, current - 1, current, current, current, current]
         with self._get_connection() as conn:
-            periods = [f"{month:02d}/{Config.CURRENT_YEAR}" for month in range(start_month, end_month + 1)]
+            return pd.read_sql_query(query, conn, params=tuple(params))
+
+    @PERF_MONITOR.timed("db.get_comparison_data")
+    def get_comparison_data(self, unit_names: List[str], start_month: int, end_month: int,
+                            start_year: Optional[int] = None, end_year: Optional[int] = None) -> pd.DataFrame:
+        with self._get_connection() as conn:
+            first, last = period_bounds(start_month, end_month, start_year, end_year)
             placeholders_units = ','.join('?' for _ in unit_names)
-            placeholders_periods = ','.join('?' for _ in periods)
             
             query = f"""
                 SELECT unit_name, SUM(total_revenue) as total_revenue, SUM(net_result) as net_result
                 FROM analysis_summary
-                WHERE unit_name IN ({placeholders_units}) AND period IN ({placeholders_periods})
+                WHERE unit_name IN ({placeholders_units}) AND period_index BETWEEN ? AND ?
                 GROUP BY unit_name
             """
-            params = tuple(unit_names + periods)
+            params = tuple(unit_names + [first, last])
             return pd.read_sql_query(query, conn, params=params)
 
-    def get_annual_dashboard_data(self, unit_name: str) -> pd.DataFrame:
+    @PERF_MONITOR.timed("db.get_annual_dashboard_data")
+    def get_annual_dashboard_data(self, unit_name: str, start_month: int = 1, end_month: int = 12,
+                                  start_year: Optional[int] = None, end_year: Optional[int] = None) -> pd.DataFrame:
+        """Resultado líquido mês a mês (period, period_index, total_net) da unidade no intervalo, em ordem cronológica."""
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
         with self._get_connection() as conn:
-            query = "SELECT period, SUM(net_result) as total_net FROM analysis_summary WHERE unit_name = ? AND period LIKE ? GROUP BY period ORDER BY period ASC"
-            return pd.read_sql_query(query, conn, params=(unit_name, f'%/{Config.CURRENT_YEAR}'))
+            query = """
+                SELECT period, period_index, SUM(net_result) as total_net
+                FROM analysis_summary
+                WHERE unit_name = ? AND period_index BETWEEN ? AND ?
+                GROUP BY period_index
+                ORDER BY period_index ASC
+            """
+            return pd.read_sql_query(query, conn, params=(unit_name, first, last))
+
+    @PERF_MONITOR.timed("db.get_available_years")
+    def get_available_years(self) -> List[int]:
+        """Anos com dados importados, do mais recente ao mais antigo, sempre incluindo o ano corrente."""
+        with self._get_connection() as conn:
+            rows = conn.execute("SELECT DISTINCT period_index / 12 FROM analysis_summary WHERE period_index IS NOT NULL").fetchall()
+        return sorted({row[0] for row in rows} | {current_year()}, reverse=True)
 
+    @PERF_MONITOR.timed("db.get_unit_goal")
     def get_unit_goal(self, unit_name: str) -> float:
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -411,20 +1327,164 @@ class DatabaseManager:
             cursor.execute("INSERT OR REPLACE INTO unit_goals (unit_name, monthly_goal) VALUES (?, ?)", (unit_name, goal))
             conn.commit()
 
+    @PERF_MONITOR.timed("db.import_budgets", rows=lambda count: count)
+    def import_budgets(self, rows: List[Tuple[str, int, str, float]]) -> int:
+        """Grava linhas (unit_name, period_index, group_name, amount), substituindo o orçamento já existente da mesma chave."""
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO budgets (unit_name, period_index, group_name, amount, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (unit_name, period_index, group_name) DO UPDATE SET
+                    amount = excluded.amount, updated_at = excluded.updated_at
+            """, [(*row, timestamp) for row in rows])
+            conn.commit()
+        self.invalidate_cache()
+        return len(rows)
+
+    @PERF_MONITOR.timed("db.get_budget_vs_actual")
+    def get_budget_vs_actual(self, units: Union[str, List[str], None], start_month: int, end_month: int,
+                             start_year: Optional[int] = None, end_year: Optional[int] = None) -> pd.DataFrame:
+        """Previsto x realizado por unidade, mês e grupo do DRE, em uma consulta.
+
+        Totais das rollups com LEFT JOIN em budgets, mais (UNION ALL) os orçamentos sem realizado, então
+        aparecem tanto grupos sem orçamento quanto orçamentos ainda sem importação. Sem FULL OUTER JOIN
+        porque ele só existe a partir do SQLite 3.39. As colunas ytd_* acumulam desde janeiro
+        de cada ano (a leitura começa em janeiro do ano inicial); attainment e ytd_attainment são
+        realizado / previsto em %, nulos sem orçamento.
+        """
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        year_start = first - first % 12
+        actual_condition, actual_params = self._units_condition(units, "s.unit_name")
+        budget_condition, budget_params = self._units_condition(units, "b.unit_name")
+        query = f"""
+            WITH actual AS (
+                SELECT s.unit_name, s.period_index, r.group_name, SUM(r.total_value) AS actual
+                FROM analysis_summary s
+                JOIN analysis_rollups r ON r.summary_id = s.id
+                WHERE {actual_condition} AND s.period_index BETWEEN ? AND ?
+                GROUP BY s.unit_name, s.period_index, r.group_name
+            ),
+            joined AS (
+                -- Junção direto na tabela (e não em uma CTE) para que cada linha de `actual` use a chave primária de budgets
+                SELECT a.unit_name, a.period_index, a.group_name, COALESCE(b.amount, 0) AS budget, a.actual
+                FROM actual a
+                LEFT JOIN budgets b ON b.unit_name = a.unit_name AND b.period_index = a.period_index AND b.group_name = a.group_name
+                UNION ALL
+                -- Orçamentos sem realizado (anti-join), a metade que o FULL OUTER JOIN cobria
+                SELECT b.unit_name, b.period_index, b.group_name, b.amount AS budget, 0 AS actual
+                FROM budgets b
+                LEFT JOIN actual a ON a.unit_name = b.unit_name AND a.period_index = b.period_index AND a.group_name = b.group_name
+                WHERE {budget_condition} AND b.period_index BETWEEN ? AND ? AND a.unit_name IS NULL
+            ),
+            cumulative AS (
+                SELECT unit_name, period_index, group_name, budget, actual,
+                       SUM(budget) OVER year_to_date AS ytd_budget, SUM(actual) OVER year_to_date AS ytd_actual
+                FROM joined
+                WINDOW year_to_date AS (PARTITION BY unit_name, group_name, period_index / 12 ORDER BY period_index ROWS UNBOUNDED PRECEDING)
+            )
+            SELECT unit_name, period_index, group_name, budget, actual, ytd_budget, ytd_actual,
+                   actual * 100.0 / NULLIF(budget, 0) AS attainment, ytd_actual * 100.0 / NULLIF(ytd_budget, 0) AS ytd_attainment
+            FROM cumulative
+            WHERE period_index BETWEEN ? AND ?
+            ORDER BY unit_name, group_name, period_index
+        """
+        params = tuple(actual_params + [year_start, last] + budget_params + [year_start, last, first, last])
+        unit_key = tuple(units) if isinstance(units, list) else units
+
+        def load() -> pd.DataFrame:
+            with self._get_connection() as conn:
+                return pd.read_sql_query(query, conn, params=params)
+        return self._cached(("budget_vs_actual", unit_key, first, last), load)
+
     def rename_unit_data(self, old_name: str, new_name: str):
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE analysis_summary SET unit_name = ? WHERE unit_name = ?", (new_name, old_name))
             cursor.execute("UPDATE unit_goals SET unit_name = ? WHERE unit_name = ?", (new_name, old_name))
+            cursor.execute("UPDATE budgets SET unit_name = ? WHERE unit_name = ?", (new_name, old_name))
+            cursor.execute("UPDATE unit_regions SET unit_name = ? WHERE unit_name = ?", (new_name, old_name))
             conn.commit()
+        self.invalidate_cache()
 
     def delete_unit_data(self, unit_name: str):
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM analysis_summary WHERE unit_name = ?", (unit_name,))
             cursor.execute("DELETE FROM unit_goals WHERE unit_name = ?", (unit_name,))
+            cursor.execute("DELETE FROM budgets WHERE unit_name = ?", (unit_name,))
+            cursor.execute("DELETE FROM unit_regions WHERE unit_name = ?", (unit_name,))
+            conn.commit()
+        self.invalidate_cache()
+
+    @PERF_MONITOR.timed("db.get_unit_regions")
+    def get_unit_regions(self) -> Dict[str, str]:
+        with self._get_connection() as conn:
+            return dict(conn.execute("SELECT unit_name, region FROM unit_regions").fetchall())
+
+    def set_unit_region(self, unit_name: str, region: str):
+        with self._get_connection() as conn:
+            if region.strip():
+                conn.execute("INSERT OR REPLACE INTO unit_regions (unit_name, region) VALUES (?, ?)", (unit_name, region.strip()))
+            else:
+                conn.execute("DELETE FROM unit_regions WHERE unit_name = ?", (unit_name,))
             conn.commit()
 
+    @PERF_MONITOR.timed("db.get_mapping_version")
+    def get_mapping_version(self) -> int:
+        """Versão atual dos mapeamentos (0 = ainda não populados). Consulta só o fim do índice."""
+        with self._get_connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(version), 0) FROM mapping_history").fetchone()[0]
+
+    @PERF_MONITOR.timed("db.get_mappings")
+    def get_mappings(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        mappings: Dict[str, Dict[str, Dict[str, str]]] = {}
+        with self._get_connection() as conn:
+            rows = conn.execute("SELECT mapping_name, map_key, group_name, subgroup_name FROM mappings ORDER BY mapping_name, rowid").fetchall()
+        for mapping_name, key, group, subgroup in rows:
+            info = {"group": group}
+            if subgroup is not None:
+                info["subgroup"] = subgroup
+            mappings.setdefault(mapping_name, {})[key] = info
+        return mappings
+
+    def _record_mapping_change(self, conn: sqlite3.Connection, mapping_name: str, key: str, action: str,
+                               group: Optional[str] = None, subgroup: Optional[str] = None) -> int:
+        cursor = conn.execute(
+            "INSERT INTO mapping_history (changed_at, mapping_name, map_key, action, group_name, subgroup_name) VALUES (?, ?, ?, ?, ?, ?)",
+            (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), mapping_name, key, action, group, subgroup)
+        )
+        return cast(int, cursor.lastrowid)
+
+    def seed_mappings(self, mappings: Dict[str, Dict[str, Dict[str, str]]]):
+        """Popula a tabela vazia de mapeamentos; registra uma única versão para a carga inicial."""
+        with self._get_connection() as conn:
+            version = self._record_mapping_change(conn, "*", "*", "seed")
+            conn.executemany(
+                "INSERT OR REPLACE INTO mappings (mapping_name, map_key, group_name, subgroup_name, version) VALUES (?, ?, ?, ?, ?)",
+                [(name, key, info.get("group", ""), info.get("subgroup"), version)
+                 for name, mapping in mappings.items() for key, info in mapping.items()]
+            )
+            conn.commit()
+
+    def upsert_mapping(self, mapping_name: str, key: str, group: str, subgroup: Optional[str]) -> int:
+        with self._get_connection() as conn:
+            version = self._record_mapping_change(conn, mapping_name, key, "upsert", group, subgroup)
+            conn.execute("""
+                INSERT INTO mappings (mapping_name, map_key, group_name, subgroup_name, version) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (mapping_name, map_key) DO UPDATE SET
+                    group_name = excluded.group_name, subgroup_name = excluded.subgroup_name, version = excluded.version
+            """, (mapping_name, key, group, subgroup, version))
+            conn.commit()
+        return version
+
+    def delete_mapping(self, mapping_name: str, key: str) -> int:
+        with self._get_connection() as conn:
+            version = self._record_mapping_change(conn, mapping_name, key, "delete")
+            conn.execute("DELETE FROM mappings WHERE mapping_name = ? AND map_key = ?", (mapping_name, key))
+            conn.commit()
+        return version
+
+    @PERF_MONITOR.timed("db.get_imported_files_summary")
     def get_imported_files_summary(self, unit_name: str, search_term: Optional[str] = None) -> pd.DataFrame:
         with self._get_connection() as conn:
             query = "SELECT id, period, source_file, collector, net_result FROM analysis_summary WHERE unit_name = ?"
@@ -433,14 +1493,97 @@ class DatabaseManager:
                 params = (unit_name, f"%{search_term}%")
             else:
                 params = (unit_name,)
-            query += " ORDER BY period DESC, source_file ASC"
+            query += " ORDER BY period_index DESC, source_file ASC"
             return pd.read_sql_query(query, conn, params=params)
 
+    SEARCH_LIMIT = 500
+    # Acima disso a ordenação por relevância (bm25 sobre todas as ocorrências) custa mais do que
+    # ajuda, e os resultados vêm das importações mais recentes
+    SEARCH_RANK_MAX_MATCHES = 5000
+
+    @staticmethod
+    def fts_query(text: str) -> str:
+        """Converte o texto digitado em consulta FTS5: todas as palavras, cada uma como prefixo."""
+        return " ".join(f'"{token}"*' for token in re.findall(r"\w+", text))
+
+    @PERF_MONITOR.timed("db.search_details")
+    def search_details(self, text: str, min_value: Optional[float] = None, max_value: Optional[float] = None, limit: int = SEARCH_LIMIT) -> pd.DataFrame:
+        """Busca em todas as unidades e anos pelo texto do indicador, grupo, subgrupo ou unidade.
+
+        Os filtros de valor comparam o valor absoluto (despesas são gravadas negativas). Com texto,
+        o resultado vem ordenado por relevância (bm25) se houver até SEARCH_RANK_MAX_MATCHES
+        ocorrências; nos demais casos, pelas linhas importadas mais recentemente.
+        """
+        query = self.fts_query(text)
+        conditions: List[str] = []
+        params: List[Any] = []
+        if min_value is not None or max_value is not None:
+            low = abs(min_value) if min_value is not None else 0.0
+            high = abs(max_value) if max_value is not None else float("inf")
+            # Duas faixas em vez de ABS(value) para aproveitar idx_details_value
+            conditions.append("(d.value BETWEEN ? AND ? OR d.value BETWEEN ? AND ?)")
+            params.extend([low, high, -high, -low])
+        if not query and not conditions:
+            return pd.DataFrame(columns=["id", "summary_id", "unit_name", "period", "source_file", "group_name", "subgroup_name", "indicator", "value"])
+        columns = "d.id, d.summary_id, s.unit_name, s.period, s.source_file, d.group_name, d.subgroup_name, d.indicator, d.value"
+        with self._get_connection() as conn:
+            if query:
+                match_count = conn.execute(
+                    "SELECT COUNT(*) FROM (SELECT rowid FROM details_fts WHERE details_fts MATCH ? LIMIT ?)",
+                    (query, self.SEARCH_RANK_MAX_MATCHES + 1)
+                ).fetchone()[0]
+                order = "f.rank" if match_count <= self.SEARCH_RANK_MAX_MATCHES else "f.rowid DESC"
+                sql = f"""
+                    SELECT {columns}
+                    FROM details_fts f
+                    JOIN analysis_details d ON d.id = f.rowid
+                    JOIN analysis_summary s ON s.id = d.summary_id
+                    WHERE details_fts MATCH ?{''.join(' AND ' + c for c in conditions)}
+                    ORDER BY {order}
+                    LIMIT ?
+                """
+                params = [query] + params
+            else:
+                sql = f"""
+                    SELECT {columns}
+                    FROM analysis_details d
+                    JOIN analysis_summary s ON s.id = d.summary_id
+                    WHERE d.excluded = 0 AND {' AND '.join(conditions)}
+                    ORDER BY d.id DESC
+                    LIMIT ?
+                """
+            return pd.read_sql_query(sql, conn, params=params + [limit])
+
+    @PERF_MONITOR.timed("db.get_line_details")
+    def get_line_details(self, units: Union[str, List[str], None], group_name: str, subgroup_name: str, indicator: Optional[str],
+                         start_month: int, end_month: int, start_year: Optional[int] = None, end_year: Optional[int] = None) -> pd.DataFrame:
+        """Linhas importadas que compõem um subgrupo (ou, com `indicator`, um indicador) do DRE no período.
+
+        Uma linha por registro de analysis_details com unidade, período e arquivo de origem, na
+        ordem cronológica. A busca parte de idx_details_line, então só lê os detalhes da linha.
+        """
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        unit_condition, unit_params = self._units_condition(units, "s.unit_name")
+        indicator_filter = " AND d.indicator = ?" if indicator is not None else ""
+        query = f"""
+            SELECT d.id, d.summary_id, s.unit_name, s.period, s.source_file, s.collector, d.indicator, d.account_code, d.value
+            FROM analysis_details d INDEXED BY idx_details_line
+            JOIN analysis_summary s ON s.id = d.summary_id
+            WHERE d.group_name = ? AND d.subgroup_name = ?{indicator_filter} AND d.excluded = 0
+              AND {unit_condition} AND s.period_index BETWEEN ? AND ?
+            ORDER BY s.period_index, s.unit_name, s.source_file, d.id
+        """
+        params = [group_name, subgroup_name] + ([indicator] if indicator is not None else []) + unit_params + [first, last]
+        with self._get_connection() as conn:
+            return pd.read_sql_query(query, conn, params=tuple(params))
+
+    @PERF_MONITOR.timed("db.get_file_details")
     def get_file_details(self, summary_id: int) -> pd.DataFrame:
         with self._get_connection() as conn:
-            query = "SELECT group_name, subgroup_name, indicator, value FROM analysis_details WHERE summary_id = ? ORDER BY id ASC"
+            query = "SELECT group_name, subgroup_name, indicator, value FROM analysis_details WHERE summary_id = ? AND excluded = 0 ORDER BY id ASC"
             return pd.read_sql_query(query, conn, params=(summary_id,))
 
+    @PERF_MONITOR.timed("db.get_distinct_collectors")
     def get_distinct_collectors(self) -> List[str]:
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -462,6 +1605,30 @@ class DatabaseManager:
             conn.commit()
             self.log_action("MERGE_COLLECTORS", f"Arrecadadoras {collectors_to_merge} mescladas em '{final_name}'.")
 
+    def save_perf_samples(self, samples: List[Tuple[float, str, float, Optional[int]]]):
+        """Grava medidas (instante em segundos, etapa, ms, linhas) vindas de PerformanceMonitor.flush."""
+        rows = [(datetime.datetime.fromtimestamp(at).strftime("%Y-%m-%d %H:%M:%S.%f"), stage, elapsed_ms, row_count)
+                for at, stage, elapsed_ms, row_count in samples]
+        with self._get_connection() as conn:
+            conn.executemany("INSERT INTO perf_samples (recorded_at, stage, elapsed_ms, row_count) VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+
+    def get_perf_samples(self, since: Optional[str] = None) -> pd.DataFrame:
+        """Medidas gravadas, opcionalmente só as a partir de `since` ('AAAA-MM-DD')."""
+        query = "SELECT recorded_at, stage, elapsed_ms, row_count FROM perf_samples"
+        params: List[Any] = []
+        if since:
+            query += " WHERE recorded_at >= ?"
+            params.append(since)
+        with self._get_connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def clear_perf_samples(self):
+        with self._get_connection() as conn:
+            conn.execute("DELETE FROM perf_samples")
+            conn.commit()
+
+    @PERF_MONITOR.timed("db.get_all_logs")
     def get_all_logs(self) -> pd.DataFrame:
         with self._get_connection() as conn:
             query = "SELECT timestamp, action_type, details FROM action_logs ORDER BY timestamp DESC"
@@ -473,6 +1640,7 @@ class DatabaseManager:
 class FileManager:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
+        self._units_cache: Optional[List[str]] = None
 
     def create_unit_folders(self, unit_name: str) -> bool:
         if not unit_name or not unit_name.strip():
@@ -483,6 +1651,7 @@ class FileManager:
             return False
         try:
             os.makedirs(unit_name)
+            self._units_cache = None
             self.db_manager.log_action("CREATE_UNIT", f"Unidade '{unit_name}' criada com sucesso.")
             return True
         except Exception as e:
@@ -490,12 +1659,15 @@ class FileManager:
             messagebox.showerror("Erro de Sistema", f"Ocorreu um erro ao criar as pastas: {e}")
             return False
 
-    def get_existing_units(self) -> List[str]:
-        return sorted([d for d in os.listdir() if os.path.isdir(d) and d not in [Config.DB_FOLDER, "__pycache__"]])
+    def get_existing_units(self, refresh: bool = False) -> List[str]:
+        if self._units_cache is None or refresh:
+            self._units_cache = sorted([d for d in os.listdir() if os.path.isdir(d) and d not in [Config.DB_FOLDER, "__pycache__"]])
+        return list(self._units_cache)
 
     def rename_unit(self, old_name: str, new_name: str) -> bool:
         try:
             os.rename(old_name, new_name)
+            self._units_cache = None
             self.db_manager.rename_unit_data(old_name, new_name)
             return True
         except Exception as e:
@@ -508,6 +1680,7 @@ class FileManager:
         if messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir '{unit_name}'?\nTODOS os dados e pastas serão apagados PERMANENTEMENTE."):
             try:
                 shutil.rmtree(unit_name)
+                self._units_cache = None
                 self.db_manager.delete_unit_data(unit_name)
                 self.db_manager.log_action("DELETE_UNIT", f"Unidade '{unit_name}' foi excluída.")
                 return True
@@ -565,16 +1738,271 @@ class FileManager:
             if messagebox.askyesno("Backup Recomendado", "Já faz mais de 7 dias desde o último backup. Deseja fazer um agora?"):
                 self.backup_database()
 
+class UnitIndex:
+    """Índice pré-construído para a busca incremental (type-ahead) de unidades.
+
+    Os nomes são normalizados (sem acentos, caixa baixa) e ordenados uma única vez; cada busca
+    por prefixo do nome ou de qualquer palavra do nome é resolvida com bisect.
+    """
+    def __init__(self, units: List[str], regions: Optional[Dict[str, str]] = None):
+        self.units = list(units)
+        self.regions = dict(regions or {})
+        self._normalized = {unit: self.normalize(unit) for unit in self.units}
+        entries = sorted((norm, unit) for unit, norm in self._normalized.items())
+        entries += [(word, unit) for unit, norm in self._normalized.items() for word in norm.split()[1:]]
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._entries = [unit for _, unit in entries]
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        decomposed = unicodedata.normalize("NFKD", text)
+        return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+    def region_names(self) -> List[str]:
+        return sorted(set(self.regions.values()))
+
+    def search(self, query: str = "", region: Optional[str] = None) -> List[str]:
+        """Retorna as unidades que casam com `query` (na ordem original), opcionalmente filtradas por região."""
+        q = self.normalize(query)
+        if not q:
+            matches = self.units
+        else:
+            found = set()
+            i = bisect_left(self._keys, q)
+            while i < len(self._keys) and self._keys[i].startswith(q):
+                found.add(self._entries[i])
+                i += 1
+            if not found:
+                found = {unit for unit, norm in self._normalized.items() if q in norm}
+            matches = [unit for unit in self.units if unit in found]
+        if region:
+            matches = [unit for unit in matches if self.regions.get(unit) == region]
+        return matches
+
 # ==============================================================================
 # --- 4. PROCESSADOR DE DADOS (COM LÓGICA DE CATEGORIZAÇÃO CORRIGIDA) ---
 # ==============================================================================
+class AccountTrie:
+    """Árvore de prefixos do plano de contas, por segmento do código ('05', '04', '036').
+
+    Um código é resolvido em uma única descida pela árvore, ficando com a regra do prefixo
+    conhecido mais longo: '05.04.036' usa '05.04.036' se existir, senão '05.04', senão '05'.
+    """
+    def __init__(self, chart: Optional[Dict[str, Any]] = None):
+        self.root: Dict[Any, Any] = {}
+        for code, info in (chart or {}).items():
+            self.insert(code, info)
+
+    @staticmethod
+    def segments(code: str) -> List[str]:
+        return [segment for segment in code.strip().split('.') if segment]
+
+    def insert(self, code: str, info: Any, exact: bool = False):
+        """Cadastra a regra de `code`; com `exact=True` ela não vale para os códigos abaixo dele.
+
+        Se o código já tiver regra do mesmo tipo, a primeira cadastrada é mantida.
+        """
+        node = self.root
+        for segment in self.segments(code):
+            node = node.setdefault(segment, {})
+        # As chaves None (prefixo) e "" (código exato) nunca colidem com segmentos, que não são vazios
+        node.setdefault("" if exact else None, info)
+
+    def resolve(self, code: str) -> Optional[Any]:
+        node = self.root
+        match = None
+        for segment in self.segments(code):
+            node = node.get(segment)
+            if node is None:
+                return match
+            match = node.get(None, match)
+        return node.get("", match)
+
+class RuleEngine:
+    """Motor de classificação compilado a partir de uma tabela declarativa de regras.
+
+    As regras são ordenadas por prioridade (maior primeiro; empate mantém a ordem da tabela) e
+    agrupadas em faixas consecutivas do mesmo tipo: códigos/prefixos viram uma AccountTrie (uma
+    descida por linha), palavras-chave e regex viram listas já compiladas. A primeira faixa que
+    casar decide. O sinal de cada regra é resolvido na compilação, não a cada linha.
+    """
+    PRIORITY_CODE = 100
+    PRIORITY_KEYWORD = 50
+    SIGN_POLICIES = ("positive", "negative", "keep")
+    # Decisão das regras de descarte; classify() a converte em None
+    SKIP = ("skip", None, "keep")
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        ordered = [rule for _, rule in sorted(enumerate(rules), key=lambda item: (-item[1].get("priority", 0), item[0]))]
+        self.tiers: List[Tuple[str, Any]] = []
+        for rule in ordered:
+            match = rule["match"]
+            kind = "trie" if match in ("code", "prefix") else match
+            if kind not in ("trie", "keyword", "regex", "any"):
+                raise ValueError(f"Tipo de regra desconhecido: '{match}'")
+            if not self.tiers or self.tiers[-1][0] != kind:
+                self.tiers.append((kind, AccountTrie() if kind == "trie" else []))
+            decision = self._decision(rule)
+            matcher = self.tiers[-1][1]
+            if kind == "trie":
+                matcher.insert(rule["pattern"], decision, exact=(match == "code"))
+            elif kind == "keyword":
+                matcher.append((rule["pattern"], decision))
+            elif kind == "regex":
+                matcher.append((re.compile(rule["pattern"]), decision))
+            else:
+                matcher.append(decision)
+
+    @classmethod
+    def _decision(cls, rule: Dict[str, Any]) -> Tuple[str, Optional[str], str]:
+        """(grupo, subgrupo, sinal) da regra, ou SKIP para regras de descarte."""
+        if rule.get("action", "classify") == "skip":
+            return cls.SKIP
+        sign = rule.get("sign") or cls.sign_policy(rule["group"])
+        if sign not in cls.SIGN_POLICIES:
+            raise ValueError(f"Política de sinal desconhecida: '{sign}'")
+        return rule["group"], rule.get("subgroup"), sign
+
+    @staticmethod
+    def sign_policy(group: str) -> str:
+        """Sinal esperado para os valores de um grupo, conforme Config.SIGN_RULES."""
+        for rule in Config.SIGN_RULES:
+            if rule["keyword"] in group:
+                return rule["sign"]
+        return "keep"
+
+    @staticmethod
+    def apply_sign(policy: str, value: float) -> float:
+        if policy == "positive":
+            return abs(value)
+        if policy == "negative":
+            return -abs(value)
+        return value
+
+    @classmethod
+    def rules_from_config(cls, source: str) -> List[Dict[str, Any]]:
+        """Tabela completa de uma origem: regras derivadas dos mapeamentos + Config.CLASSIFICATION_RULES."""
+        if source == "notas":
+            # Nas Notas de Negócio o sinal do arquivo é mantido e a chave é o código do indicador
+            rules = [{"priority": cls.PRIORITY_CODE, "match": "code", "pattern": key, "group": info["group"],
+                      "subgroup": info.get("subgroup"), "sign": "keep"}
+                     for key, info in Config.NOTAS_NEGOCIO_MAPPING.items()]
+        else:
+            rules = [{"priority": cls.PRIORITY_CODE, "match": "prefix", "pattern": code, "group": info["group"], "subgroup": info["subgroup"]}
+                     for code, info in Config.CHART_OF_ACCOUNTS.items()]
+            rules += [{"priority": cls.PRIORITY_KEYWORD, "match": "keyword", "pattern": key, "group": info["group"], "subgroup": info["subgroup"]}
+                      for key, info in Config.DESCRIPTION_MAPPING.items()]
+        rules += [rule if source != "notas" else {"sign": "keep", **rule}
+                  for rule in Config.CLASSIFICATION_RULES if rule.get("source", "detalhamento") == source]
+        return rules
+
+    def classify(self, code: str, text: str) -> Optional[Tuple[str, Optional[str], str]]:
+        """Decide (grupo, subgrupo, sinal) pelo código e pelo texto da linha; None = ignorar a linha.
+
+        Linhas que não casam com nenhuma regra também retornam None.
+        """
+        decision = self._match(code, text)
+        return None if decision is self.SKIP else decision
+
+    def _match(self, code: str, text: str) -> Optional[Tuple[str, Optional[str], str]]:
+        for kind, matcher in self.tiers:
+            if kind == "trie":
+                decision = matcher.resolve(code)
+                if decision is not None:
+                    return decision
+            elif kind == "keyword":
+                for pattern, decision in matcher:
+                    if pattern in text:
+                        return decision
+            elif kind == "regex":
+                for pattern, decision in matcher:
+                    if pattern.search(text):
+                        return decision
+            else:
+                return matcher[0]
+        return None
+
+class ClassificationCache:
+    """Cache limitado de (SubConta, descrição normalizada) -> (grupo, subgrupo, regra de sinal).
+
+    As mesmas contas (salários, aluguel, energia...) se repetem todo mês em todas as unidades, então
+    a maior parte das linhas de um detalhamento é resolvida sem percorrer os mapeamentos. O cache fica
+    em memória pela sessão inteira (vive com o DataProcessor), é esvaziado quando
+    Config.MAPPINGS_REVISION muda e, ao atingir o limite, descarta as menos usadas recentemente. Linhas
+    ignoradas são guardadas como None.
+    """
+    MAX_ENTRIES = 20_000
+    _MISSING = object()
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Optional[Tuple[str, str, str]]]" = OrderedDict()
+        self._revision = Config.MAPPINGS_REVISION
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: Tuple[str, str], compute: Callable[..., Optional[Tuple[str, str, str]]], *args) -> Optional[Tuple[str, str, str]]:
+        """Valor em cache de `key`, ou `compute(*args)` guardado para as próximas consultas."""
+        revision = Config.MAPPINGS_REVISION
+        if self._revision != revision:
+            with self._lock:
+                if self._revision != revision:
+                    self._entries.clear()
+                    self._revision = revision
+        with self._lock:
+            value = self._entries.get(key, self._MISSING)
+            if value is not self._MISSING:
+                # LRU: o acerto move a entrada para o fim, longe do descarte
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cast(Optional[Tuple[str, str, str]], value)
+        value = compute(*args)
+        with self._lock:
+            self.misses += 1
+            # Se os mapeamentos mudaram durante o cálculo, o valor pode ter vindo das regras antigas:
+            # é devolvido a quem pediu, mas não entra no cache da nova versão
+            if self._revision == revision == Config.MAPPINGS_REVISION:
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "hit_rate": self.hits / lookups if lookups else 0.0, "revision": self._revision}
+
 class DataProcessor:
+    def __init__(self):
+        self._rule_engines: Dict[str, RuleEngine] = {}
+        self._rule_engines_revision = -1
+        self.classification_cache = ClassificationCache()
+
+    def rule_engine(self, source: str) -> RuleEngine:
+        """RuleEngine da origem ('detalhamento' ou 'notas'), recompilado só quando Config.MAPPINGS_REVISION muda."""
+        if self._rule_engines_revision != Config.MAPPINGS_REVISION:
+            self._rule_engines = {}
+            self._rule_engines_revision = Config.MAPPINGS_REVISION
+        if source not in self._rule_engines:
+            self._rule_engines[source] = RuleEngine(RuleEngine.rules_from_config(source))
+        return self._rule_engines[source]
+
     def _parse_value(self, value: Any) -> float:
         """Converte um valor (string ou número) para float, tratando R$, parênteses e outros formatos."""
         if isinstance(value, (int, float)):
             return float(value)
+        parsed = self._try_parse_value(value)
+        return 0.0 if parsed is None else parsed
+
+    def _try_parse_value(self, value: Any) -> Optional[float]:
+        """Como _parse_value, mas retorna None para vazio, NaN ou texto que não é número."""
+        if isinstance(value, (int, float)):
+            return None if pd.isna(value) else float(value)
         if not isinstance(value, str):
-            return 0.0
+            return None
         
         value_str = value.strip().replace("R$", "").strip()
         
@@ -592,31 +2020,61 @@ class DataProcessor:
                 return -abs(number)
             return number
         except (ValueError, TypeError):
-            return 0.0
+            return None
+
+    def classify_detalhamento(self, sub_conta: str, descricao: str) -> Optional[Tuple[str, str, str]]:
+        """(grupo, subgrupo, regra de sinal) de uma linha do detalhamento; None quando a linha deve ser ignorada.
+
+        `descricao` já deve estar em maiúsculas. Usado na importação e na reclassificação.
+        """
+        return self.classification_cache.get_or_compute((sub_conta, descricao), self._classify_detalhamento, sub_conta, descricao)
 
+    def _classify_detalhamento(self, sub_conta: str, descricao: str) -> Optional[Tuple[str, str, str]]:
+        # Código/prefixo da SubConta, depois palavra-chave na descrição, depois as regras fixas
+        # de Config.CLASSIFICATION_RULES (descarte de transferências e 'Outros')
+        decision = self.rule_engine("detalhamento").classify(sub_conta, descricao)
+        if decision is None:
+            return None
+        group, subgroup, sign = decision
+        return group, subgroup or "Não Categorizado", sign
+
+    @staticmethod
+    def apply_sign_rule(rule: str, valor: float) -> float:
+        return RuleEngine.apply_sign(rule, valor)
+
+    def classify_nota(self, indicator_key: str, collector_name: str) -> Tuple[str, str]:
+        decision = self.rule_engine("notas").classify(indicator_key, indicator_key)
+        if decision is None:
+            return "Ajustes da Franqueadora", "Não Mapeado"
+        group, subgroup, _ = decision
+        return group, subgroup or collector_name
+
+    @PERF_MONITOR.timed("processor.extract_from_notas_negocio")
     def extract_from_notas_negocio(self, filepath: str) -> Tuple[Optional[str], Optional[List[Dict]], Optional[str]]:
         """Extrai e classifica dados de arquivos CSV de Nota de Negócio."""
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-                lines = f.readlines()
-            
-            collector_name = "Não Identificada"
-            header_row_index = -1
-            
-            for i, line in enumerate(lines):
-                if 'Arrecadadora:' in line:
-                    match = re.search(r'Arrecadadora:\s*([^;]+)', line, re.IGNORECASE)
-                    if match:
-                        collector_name = match.group(1).strip()
-                if 'Indicadores' in line and 'Valores' in line:
-                    header_row_index = i
-            
-            if header_row_index == -1:
-                return None, None, f"Cabeçalho 'Indicadores'/'Valores' não encontrado em '{os.path.basename(filepath)}'."
-
-            csv_data = io.StringIO("".join(lines[header_row_index:]))
-            df = pd.read_csv(csv_data, sep=';', header=0)
-            df.dropna(how='all', inplace=True)
+            with PERF_MONITOR.span("processor.notas.parse") as span:
+                with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+                    lines = f.readlines()
+
+                collector_name = "Não Identificada"
+                header_row_index = -1
+
+                for i, line in enumerate(lines):
+                    if 'Arrecadadora:' in line:
+                        match = re.search(r'Arrecadadora:\s*([^;]+)', line, re.IGNORECASE)
+                        if match:
+                            collector_name = match.group(1).strip()
+                    if 'Indicadores' in line and 'Valores' in line:
+                        header_row_index = i
+
+                if header_row_index == -1:
+                    return None, None, f"Cabeçalho 'Indicadores'/'Valores' não encontrado em '{os.path.basename(filepath)}'."
+
+                csv_data = io.StringIO("".join(lines[header_row_index:]))
+                df = pd.read_csv(csv_data, sep=';', header=0)
+                df.dropna(how='all', inplace=True)
+                span.rows = len(df)
             
             df.columns = [str(c).strip() for c in df.columns]
             indicadores_col = next((col for col in df.columns if 'Indicadores' in col), None)
@@ -626,52 +2084,58 @@ class DataProcessor:
                 return None, None, f"Não foi possível localizar as colunas 'Indicadores'/'Valores'. Cabeçalho lido: {list(df.columns)}"
 
             details = []
-            for _, row in df.iterrows():
-                indicator = str(row[indicadores_col]).strip()
-                if not indicator or pd.isna(row[valores_col]) or indicator.lower() == 'nan':
-                    continue
-                
-                value = self._parse_value(row[valores_col])
-                
-                if "SLR" in indicator.upper() or value == 0:
-                    continue
+            with PERF_MONITOR.span("processor.notas.classify") as span:
+                for _, row in df.iterrows():
+                    indicator = str(row[indicadores_col]).strip()
+                    if not indicator or pd.isna(row[valores_col]) or indicator.lower() == 'nan':
+                        continue
 
-                indicator_key = indicator.split(' ')[0].strip().upper()
-                account_info = Config.NOTAS_NEGOCIO_MAPPING.get(indicator_key)
+                    value = self._parse_value(row[valores_col])
 
-                if not account_info:
-                    account_info = {"group": "Ajustes da Franqueadora", "subgroup": "Não Mapeado"}
+                    if "SLR" in indicator.upper() or value == 0:
+                        continue
 
-                details.append({
-                    "group": account_info["group"],
-                    "subgroup": account_info.get("subgroup", collector_name),
-                    "indicator": indicator,
-                    "value": value
-                })
+                    indicator_key = indicator.split(' ')[0].strip().upper()
+                    group, subgroup = self.classify_nota(indicator_key, collector_name)
+
+                    details.append({
+                        "group": group,
+                        "subgroup": subgroup,
+                        "indicator": indicator,
+                        "value": value,
+                        "source": "notas",
+                        "account_code": None,
+                        "indicator_key": indicator_key,
+                        "raw_value": value
+                    })
+                span.rows = len(details)
             return collector_name, details, None
         except Exception as e:
             return None, None, f"Erro inesperado ao processar '{os.path.basename(filepath)}': {e}"
 
+    @PERF_MONITOR.timed("processor.extract_from_detalhamento")
     def extract_from_detalhamento(self, filepath: str) -> Tuple[Optional[List[Dict]], Optional[str]]:
         """Extrai dados de arquivos CSV de Detalhamento Financeiro com a nova lógica de mapeamento."""
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-                lines = f.readlines()
+            with PERF_MONITOR.span("processor.detalhamento.parse") as span:
+                with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+                    lines = f.readlines()
 
-            header_row_index = -1
-            for i, line in enumerate(lines):
-                if all(keyword in line for keyword in ['SubConta', 'Descrição', 'Valor']):
-                    header_row_index = i
-                    break
-            
-            if header_row_index == -1:
-                return None, f"Linha de cabeçalho com 'SubConta', 'Descrição', 'Valor' não encontrada em '{os.path.basename(filepath)}'."
+                header_row_index = -1
+                for i, line in enumerate(lines):
+                    if all(keyword in line for keyword in ['SubConta', 'Descrição', 'Valor']):
+                        header_row_index = i
+                        break
 
-            csv_data = io.StringIO("".join(lines[header_row_index:]))
-            df = pd.read_csv(csv_data, sep=';', header=0)
-            
-            df.dropna(how='all', axis=1, inplace=True)
-            df.dropna(subset=[df.columns[0]], inplace=True)
+                if header_row_index == -1:
+                    return None, f"Linha de cabeçalho com 'SubConta', 'Descrição', 'Valor' não encontrada em '{os.path.basename(filepath)}'."
+
+                csv_data = io.StringIO("".join(lines[header_row_index:]))
+                df = pd.read_csv(csv_data, sep=';', header=0)
+
+                df.dropna(how='all', axis=1, inplace=True)
+                df.dropna(subset=[df.columns[0]], inplace=True)
+                span.rows = len(df)
 
             subconta_col, desc_col, valor_col = None, None, None
             for col in df.columns:
@@ -688,74 +2152,349 @@ class DataProcessor:
             df.dropna(subset=['SubConta', 'Valor'], inplace=True)
 
             details = []
-            for _, row in df.iterrows():
-                sub_conta = str(row['SubConta']).strip()
-                descricao = str(row['Descrição']).strip().upper()
-                valor = self._parse_value(str(row['Valor']))
-                
-                if valor == 0:
-                    continue
-                
-                # --- LÓGICA DE CATEGORIZAÇÃO ATUALIZADA ---
-                # 1. Tenta mapear pelo código 'SubConta' (ex: '01.01.000')
-                account_info = Config.CHART_OF_ACCOUNTS.get(sub_conta)
-                
-                # 2. Se não encontrar, tenta mapear por palavra-chave na descrição
-                if not account_info:
-                    for key, info in Config.DESCRIPTION_MAPPING.items():
-                        if key in descricao:
-                            account_info = info
-                            break
-                
-                # 3. Se ainda não encontrar, classifica como 'Outros'
-                if not account_info:
-                    if "TRANSFERENCIA ENTRE CONTAS" in descricao:
+            with PERF_MONITOR.span("processor.detalhamento.classify") as span:
+                for _, row in df.iterrows():
+                    sub_conta = str(row['SubConta']).strip()
+                    descricao = str(row['Descrição']).strip().upper()
+                    valor = self._parse_value(str(row['Valor']))
+
+                    if valor == 0:
+                        continue
+
+                    classification = self.classify_detalhamento(sub_conta, descricao)
+                    if not classification:
                         continue
-                    account_info = {"group": "Outros", "subgroup": "Não Categorizado"}
-
-                # --- LÓGICA DE SINAL CORRIGIDA E MAIS EXPLÍCITA ---
-                final_value = valor
-
-                # Regra 1: Itens em grupos de "Receita" DEVEM ser positivos.
-                if "Receita" in account_info["group"]:
-                    final_value = abs(valor)
-                # Regra 2: Itens em grupos de "Despesa" (e similares) DEVEM ser negativos.
-                elif any(keyword in account_info["group"] for keyword in ["Despesas", "Impostos", "Investimentos", "Dividendos"]):
-                    final_value = -abs(valor)
-                # Regra 3: Para outros casos (ex: "Outros", "Ajustes"), confia no sinal do arquivo.
-                # Nenhuma ação é necessária aqui, pois final_value já é igual a 'valor'.
-
-                details.append({
-                    "group": account_info["group"],
-                    "subgroup": account_info["subgroup"],
-                    "indicator": str(row['Descrição']).strip(),
-                    "value": final_value
-                })
+                    group, subgroup, rule = classification
+
+                    details.append({
+                        "group": group,
+                        "subgroup": subgroup,
+                        "indicator": str(row['Descrição']).strip(),
+                        "value": self.apply_sign_rule(rule, valor),
+                        "source": "detalhamento",
+                        "account_code": sub_conta,
+                        "indicator_key": descricao,
+                        "raw_value": valor
+                    })
+                span.rows = len(details)
             return details, None
         except Exception as e:
             return None, f"Erro inesperado ao processar o detalhamento '{os.path.basename(filepath)}': {e}"
 
+    MAX_BUDGET_ERRORS = 10
+
+    @PERF_MONITOR.timed("processor.extract_budgets")
+    def extract_budgets(self, filepath: str) -> Tuple[Optional[List[Tuple[str, int, str, float]]], Optional[str]]:
+        """Lê o CSV de orçamento da rede e devolve linhas (unit_name, period_index, group_name, amount).
+
+        Aceita o formato longo (Unidade;Ano;Mês;Grupo;Valor) ou uma coluna por mês
+        (Unidade;Ano;Grupo;Jan;...;Dez ou 1;...;12). O sinal segue o grupo (Config.SIGN_RULES), então
+        as despesas podem vir positivas na planilha. Qualquer linha inválida rejeita o arquivo inteiro.
+        """
+        try:
+            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+                df = pd.read_csv(f, sep=';', header=0, dtype=str)
+            df.dropna(how='all', inplace=True)
+            columns = {UnitIndex.normalize(str(col)): col for col in df.columns}
+            unit_col, year_col, group_col = columns.get("unidade"), columns.get("ano"), columns.get("grupo")
+            if not all([unit_col, year_col, group_col]):
+                return None, f"Colunas 'Unidade', 'Ano' e 'Grupo' não encontradas. Colunas lidas: {list(df.columns)}"
+
+            if "mes" in columns and "valor" in columns:
+                long_df = df[[unit_col, year_col, group_col, columns["mes"], columns["valor"]]].copy()
+                long_df.columns = ["unit", "year", "group", "month", "value"]
+            else:
+                month_cols = {}
+                for month, abbreviation in enumerate(MONTH_ABBREVIATIONS, start=1):
+                    for key in (UnitIndex.normalize(abbreviation), str(month), f"{month:02d}"):
+                        if key in columns:
+                            month_cols[columns[key]] = str(month)
+                if not month_cols:
+                    return None, f"Informe as colunas 'Mês' e 'Valor' ou uma coluna por mês (Jan a Dez). Colunas lidas: {list(df.columns)}"
+                long_df = df.melt(id_vars=[unit_col, year_col, group_col], value_vars=list(month_cols), var_name="month", value_name="value", ignore_index=False)
+                long_df["month"] = long_df["month"].map(month_cols)
+                long_df.columns = ["unit", "year", "group", "month", "value"]
+            # Células de valor vazias significam mês sem orçamento, não zero
+            long_df = long_df[long_df["value"].notna() & (long_df["value"].str.strip() != "")]
+
+            valid_groups = set(Config.DRE_GROUP_ORDER)
+            rows: List[Tuple[str, int, str, float]] = []
+            errors: List[str] = []
+            for line, unit, year, group, month, value in long_df.itertuples():
+                unit, group = str(unit).strip(), str(group).strip()
+                try:
+                    year_value, month_value = int(str(year).strip()), int(str(month).strip())
+                except ValueError:
+                    errors.append(f"Linha {line + 2}: ano/mês inválido ('{year}', '{month}').")
+                    continue
+                if not unit or unit.lower() == "nan":
+                    errors.append(f"Linha {line + 2}: unidade vazia.")
+                elif group not in valid_groups:
+                    errors.append(f"Linha {line + 2}: grupo desconhecido '{group}'.")
+                elif not 1 <= month_value <= 12:
+                    errors.append(f"Linha {line + 2}: mês {month_value} fora de 1 a 12.")
+                else:
+                    parsed = self._try_parse_value(value)
+                    if parsed is None:
+                        errors.append(f"Linha {line + 2}: valor inválido '{value}'.")
+                        continue
+                    amount = RuleEngine.apply_sign(RuleEngine.sign_policy(group), parsed)
+                    rows.append((unit, period_index(year_value, month_value), group, amount))
+            if errors:
+                extra = f" (e mais {len(errors) - self.MAX_BUDGET_ERRORS})" if len(errors) > self.MAX_BUDGET_ERRORS else ""
+                return None, "\n".join(errors[:self.MAX_BUDGET_ERRORS]) + extra
+            return rows, None
+        except Exception as e:
+            return None, f"Erro inesperado ao processar o orçamento '{os.path.basename(filepath)}': {e}"
+
+class ReclassificationJob:
+    """Reaplica os mapeamentos atuais ao histórico importado, sem reimportar os CSVs.
+
+    Somente as linhas atingidas pelas chaves alteradas são lidas; das lidas, só as que mudam de
+    grupo, subgrupo ou valor são gravadas, junto com os totais dos resumos a que pertencem.
+    Linhas que passam a ser ignoradas são só marcadas como excluídas e voltam se a regra voltar.
+    Os alertas do AnomalyDetector das importações recalculadas são refeitos no mesmo passo.
+    """
+    def __init__(self, db_manager: DatabaseManager, data_processor: DataProcessor):
+        self.db_manager = db_manager
+        self.data_processor = data_processor
+
+    @PERF_MONITOR.timed("processor.reclassify", rows=lambda report: report["scanned"])
+    def run(self, changed_keys: Optional[Dict[str, Iterable[str]]] = None) -> Dict[str, int]:
+        """Retorna as contagens {"scanned", "updated", "excluded", "summaries", "anomalies"}."""
+        updates: List[Tuple[str, str, float, int]] = []
+        excluded_ids: List[int] = []
+        summary_ids = set()
+        scanned = 0
+        for chunk in self.db_manager.iter_reclassification_candidates(changed_keys):
+            scanned += len(chunk)
+            for detail_id, summary_id, source_kind, account_code, indicator_key, raw_value, collector, group, subgroup, value, excluded in chunk:
+                if source_kind == "notas":
+                    new_group, new_subgroup = self.data_processor.classify_nota(indicator_key, collector or "N/A")
+                    new_value = raw_value
+                else:
+                    classification = self.data_processor.classify_detalhamento(account_code, indicator_key)
+                    if not classification:
+                        if not excluded:
+                            excluded_ids.append(detail_id)
+                            summary_ids.add(summary_id)
+                        continue
+                    new_group, new_subgroup, rule = classification
+                    new_value = self.data_processor.apply_sign_rule(rule, raw_value)
+                if excluded or (new_group, new_subgroup, new_value) != (group, subgroup, value):
+                    updates.append((new_group, new_subgroup, new_value, detail_id))
+                    summary_ids.add(summary_id)
+
+        if updates or excluded_ids:
+            self.db_manager.apply_reclassification(updates, excluded_ids, sorted(summary_ids), Config.MAPPINGS_REVISION)
+            self.db_manager.log_action("RECLASSIFY", f"{len(updates)} linha(s) reclassificada(s), {len(excluded_ids)} excluída(s), {len(summary_ids)} resumo(s) recalculado(s).")
+        # Os alertas guardados descrevem grupos e valores de antes da reclassificação
+        detector = AnomalyDetector(self.db_manager)
+        anomalies = sum(detector.check(summary_id) for summary_id in sorted(summary_ids))
+        return {"scanned": scanned, "updated": len(updates), "excluded": len(excluded_ids), "summaries": len(summary_ids), "anomalies": anomalies}
+
+def benchmark_rule_engine(row_count: int = 100_000, seed: int = 0) -> Dict[str, float]:
+    """Mede o custo por linha da classificação do detalhamento com os mapeamentos atuais.
+
+    As linhas sintéticas misturam códigos exatos, códigos novos sob prefixos conhecidos,
+    descrições resolvidas por palavra-chave, transferências descartadas e linhas sem regra.
+    """
+    rng = np.random.default_rng(seed)
+    codes = list(Config.CHART_OF_ACCOUNTS)
+    keywords = list(Config.DESCRIPTION_MAPPING)
+    samples = (
+        [(code, "LANCAMENTO") for code in codes]
+        + [(f"{code}.{n}", "LANCAMENTO") for code in codes for n in range(3)]
+        + [("99.99.999", f"PAGAMENTO {keyword} REF") for keyword in keywords]
+        + [("99.99.999", "TRANSFERENCIA ENTRE CONTAS"), ("99.99.999", "LANCAMENTO SEM REGRA")]
+    )
+    rows = [samples[i] for i in rng.integers(0, len(samples), row_count)]
+
+    rules = RuleEngine.rules_from_config("detalhamento")
+    start = time.perf_counter()
+    engine = RuleEngine(rules)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for code, text in rows:
+        engine.classify(code, text)
+    engine_us = (time.perf_counter() - start) / row_count * 1e6
+
+    processor = DataProcessor()
+    start = time.perf_counter()
+    for code, text in rows:
+        processor.classify_detalhamento(code, text)
+    cached_us = (time.perf_counter() - start) / row_count * 1e6
+
+    return {"rows": row_count, "rules": len(rules),
+            "compile_ms": compile_ms, "engine_us_per_row": engine_us, "cached_us_per_row": cached_us,
+            "cache_hit_rate": processor.classification_cache.stats()["hit_rate"]}
+
 
 # ==============================================================================
 # --- 5. EXPORTADORES (Sem alterações) ---
 # ==============================================================================
+def iter_dre_tree(records: Iterable[Tuple[str, str, str, float]]) -> Iterator[Tuple[str, str, Optional[float]]]:
+    """Percorre a árvore grupo > subgrupo > indicador emitindo cabeçalhos e subtotais.
+
+    `records` são tuplas (grupo, subgrupo, indicador, valor) já ordenadas por posição do grupo
+    em Config.DRE_GROUP_ORDER, subgrupo e indicador; são consumidas uma a uma, sem acumular.
+    Gera tuplas (tipo, rótulo, valor), onde tipo é 'group', 'subgroup', 'indicator',
+    'subgroup_total', 'group_total' ou 'result'. Linhas de cabeçalho têm valor None.
+    """
+    group_name = subgroup_name = None
+    group_total = subgroup_total = result = 0.0
+    seen_any = False
+    for group, subgroup, indicator, value in records:
+        seen_any = True
+        if group != group_name:
+            if subgroup_name is not None:
+                yield "subgroup_total", f"Subtotal {subgroup_name}", subgroup_total
+            if group_name is not None:
+                yield "group_total", f"Total {group_name}", group_total
+            group_name, subgroup_name = group, None
+            group_total = 0.0
+            yield "group", str(group), None
+        if subgroup != subgroup_name:
+            if subgroup_name is not None:
+                yield "subgroup_total", f"Subtotal {subgroup_name}", subgroup_total
+            subgroup_name = subgroup
+            subgroup_total = 0.0
+            yield "subgroup", str(subgroup), None
+        value = float(value)
+        subgroup_total += value
+        group_total += value
+        result += value
+        yield "indicator", str(indicator), value
+    if not seen_any:
+        return
+    yield "subgroup_total", f"Subtotal {subgroup_name}", subgroup_total
+    yield "group_total", f"Total {group_name}", group_total
+    yield "result", "Resultado Líquido do Período", result
+
+def dre_group_rank(group_name: str) -> int:
+    """Posição do grupo no DRE; grupos fora de Config.DRE_GROUP_ORDER vão para o final."""
+    try:
+        return Config.DRE_GROUP_ORDER.index(group_name)
+    except ValueError:
+        return len(Config.DRE_GROUP_ORDER)
+
+def iter_dre_rows(detail_df: pd.DataFrame) -> Iterator[Tuple[str, str, Optional[float]]]:
+    """Árvore do DRE (ver iter_dre_tree) a partir da saída de get_detailed_results."""
+    if detail_df.empty:
+        return iter(())
+    ordered = detail_df.assign(_rank=detail_df["group_name"].map(dre_group_rank)).sort_values(
+        ["_rank", "group_name", "subgroup_name", "indicator"], kind="stable")
+    return iter_dre_tree(zip(ordered["group_name"], ordered["subgroup_name"], ordered["indicator"], ordered["total_value"]))
+
+def consolidated_dre_frames(consolidated_df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], List[Tuple[str, str, np.ndarray]]]:
+    """Prepara a saída de get_consolidated_results para a tela do DRE consolidado.
+
+    Retorna (dre_df, unidades, linhas): dre_df no formato de get_detailed_results, com um
+    "indicador" por subgrupo; e a matriz de contribuição, em que cada linha é (tipo, rótulo, valores)
+    e valores[0] é o total da rede seguido de uma coluna por unidade, na ordem de `unidades`.
+    """
+    pivot = consolidated_df.pivot_table(index=["group_name", "subgroup_name"], columns="unit_name",
+                                        values="total_value", aggfunc="sum", fill_value=0.0)
+    units = [str(unit) for unit in pivot.columns]
+    dre_df = pivot.sum(axis=1).rename("total_value").reset_index()
+    dre_df["indicator"] = dre_df["subgroup_name"]
+
+    matrix = pivot.to_numpy()
+    positions = {key: i for i, key in enumerate(pivot.index)}
+    rows: List[Tuple[str, str, np.ndarray]] = []
+    groups = sorted({group for group, _ in pivot.index}, key=lambda g: (dre_group_rank(g), g))
+    for group in groups:
+        indices = [positions[key] for key in pivot.index if key[0] == group]
+        for i in indices:
+            values = matrix[i]
+            rows.append(("subgroup", f"{group} / {pivot.index[i][1]}", np.concatenate(([values.sum()], values))))
+        group_values = matrix[indices].sum(axis=0)
+        rows.append(("group_total", f"Total {group}", np.concatenate(([group_values.sum()], group_values))))
+    result = matrix.sum(axis=0)
+    rows.append(("result", "Resultado Líquido do Período", np.concatenate(([result.sum()], result))))
+    return dre_df, units, rows
+
+def variance_line_label(group_name: str, subgroup_name: Optional[str]) -> str:
+    """Rótulo de uma linha de get_variance_report: o grupo (total) ou 'grupo / subgrupo'."""
+    if subgroup_name is None or pd.isna(subgroup_name):
+        return f"Total {group_name}"
+    return f"{group_name} / {subgroup_name}"
+
+def build_pdf_styles():
+    """Monta a folha de estilos dos relatórios. É cara o suficiente para ser criada uma única vez."""
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='Right', alignment=TA_RIGHT))
+    styles.add(ParagraphStyle(name='Center', alignment=TA_CENTER))
+    styles.add(ParagraphStyle(name='ResultGreen', parent=styles['h3'], textColor=colors.darkgreen, alignment=TA_RIGHT))
+    styles.add(ParagraphStyle(name='ResultRed', parent=styles['h3'], textColor=colors.red, alignment=TA_RIGHT))
+    return styles
+
 class PDFExporter:
-    def export(self, unit_name: str, period_title: str, results_data: Dict[str, Dict[str, float]]):
+    # Linhas por LongTable no detalhamento: mantém o custo de layout/quebra de página linear
+    DETAIL_CHUNK_ROWS = 200
+    MAX_LABEL_CHARS = 90
+    DETAIL_COL_WIDTHS = [5.0*inch, 1.5*inch]
+    DETAIL_BASE_STYLE = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('LEFTPADDING', (0, 1), (0, -1), 30),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('LINEBELOW', (0, 0), (-1, 0), 1, colors.black),
+    ])
+    # Estilos por tipo de linha, aplicados apenas às linhas que não são indicadores
+    DETAIL_ROW_STYLES = {
+        "group": (('FONTNAME', 'Helvetica-Bold'), ('FONTSIZE', 9), ('BACKGROUND', colors.HexColor("#E8F5E9")), ('LEFTPADDING', 6)),
+        "subgroup": (('FONTNAME', 'Helvetica-Bold'), ('LEFTPADDING', 18)),
+        "subgroup_total": (('FONTNAME', 'Helvetica-Oblique'), ('LEFTPADDING', 18), ('LINEABOVE', 0.25, colors.grey)),
+        "group_total": (('FONTNAME', 'Helvetica-Bold'), ('LEFTPADDING', 6), ('LINEABOVE', 0.5, colors.black)),
+        "result": (('FONTNAME', 'Helvetica-Bold'), ('FONTSIZE', 10), ('LEFTPADDING', 6), ('LINEABOVE', 1, colors.black)),
+    }
+
+    def __init__(self):
+        self._styles = None
+
+    @property
+    def styles(self):
+        if self._styles is None:
+            self._styles = build_pdf_styles()
+        return self._styles
+
+    @staticmethod
+    def default_filename(unit_name: str, period_title: str) -> str:
+        return f"DRE_{unit_name.replace(' ', '_')}_{period_title.replace('/', '-')}.pdf"
+
+    @staticmethod
+    def _money(value: float) -> str:
+        return f"R$ {value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+    def export(self, unit_name: str, period_title: str, results_data: Dict[str, Dict[str, float]], detail_df: Optional[pd.DataFrame] = None):
         filepath = filedialog.asksaveasfilename(
             defaultextension=".pdf",
-            initialfile=f"DRE_{unit_name.replace(' ', '_')}_{period_title.replace('/', '-')}.pdf"
+            initialfile=self.default_filename(unit_name, period_title)
         )
         if not filepath: return
-        
+
+        try:
+            self.build(filepath, unit_name, period_title, results_data, detail_df)
+            messagebox.showinfo("Sucesso", f"Relatório salvo em:\n{filepath}")
+        except Exception as e:
+            messagebox.showerror("Erro ao Salvar PDF", f"Não foi possível gerar o PDF.\nErro: {e}")
+
+    @PERF_MONITOR.timed("export.pdf")
+    def build(self, filepath: str, unit_name: str, period_title: str, results_data: Dict[str, Dict[str, float]], detail_df: Optional[pd.DataFrame] = None):
+        """Gera o PDF em `filepath` sem nenhuma interação com a interface; propaga erros ao chamador.
+
+        Com `detail_df` (saída de get_detailed_results), inclui a árvore completa do DRE.
+        """
         doc = SimpleDocTemplate(filepath, pagesize=(8.5*inch, 11*inch), topMargin=inch, bottomMargin=inch)
-        styles = getSampleStyleSheet()
+        styles = self.styles
         elements = []
 
-        styles.add(ParagraphStyle(name='Right', alignment=TA_RIGHT))
-        styles.add(ParagraphStyle(name='Center', alignment=TA_CENTER))
-        styles.add(ParagraphStyle(name='ResultGreen', parent=styles['h3'], textColor=colors.darkgreen, alignment=TA_RIGHT))
-        styles.add(ParagraphStyle(name='ResultRed', parent=styles['h3'], textColor=colors.red, alignment=TA_RIGHT))
-
         elements.append(Paragraph(f"<b>Relatório DRE - {unit_name}</b>", styles['h1']))
         elements.append(Paragraph(f"Período de Análise: {period_title}", styles['h2']))
         elements.append(Spacer(1, 0.3*inch))
@@ -795,11 +2534,117 @@ class PDFExporter:
         elements.append(Spacer(1, 0.3*inch))
         elements.append(total_tbl)
 
-        try:
-            doc.build(elements)
-            messagebox.showinfo("Sucesso", f"Relatório salvo em:\n{filepath}")
-        except Exception as e:
-            messagebox.showerror("Erro ao Salvar PDF", f"Não foi possível gerar o PDF.\nErro: {e}")
+        if detail_df is not None and not detail_df.empty:
+            elements.append(Spacer(1, 0.4*inch))
+            elements.append(Paragraph("Demonstrativo Detalhado", styles['h2']))
+            elements.extend(self._detail_tables(detail_df))
+
+        doc.build(elements)
+
+    def _detail_tables(self, detail_df: pd.DataFrame) -> Iterator[LongTable]:
+        """Monta o detalhamento em blocos de DETAIL_CHUNK_ROWS linhas, com células de texto simples.
+
+        Cada bloco é uma LongTable dividida por linha e com cabeçalho repetido; só as linhas
+        de grupo/subgrupo/subtotal recebem comandos de estilo próprios.
+        """
+        header = ["Descrição", "Valor"]
+        rows: List[List[str]] = [header]
+        commands: List[tuple] = []
+        for kind, label, value in iter_dre_rows(detail_df):
+            if len(label) > self.MAX_LABEL_CHARS:
+                label = label[:self.MAX_LABEL_CHARS - 3] + "..."
+            r = len(rows)
+            rows.append([label, "" if value is None else self._money(value)])
+            for command, *args in self.DETAIL_ROW_STYLES.get(kind, ()):
+                commands.append((command, (0, r), (-1, r), *args))
+            if kind == "result" and value is not None:
+                commands.append(('TEXTCOLOR', (1, r), (1, r), colors.darkgreen if value >= 0 else colors.red))
+            if len(rows) > self.DETAIL_CHUNK_ROWS:
+                yield self._detail_table(rows, commands)
+                rows, commands = [header], []
+        if len(rows) > 1:
+            yield self._detail_table(rows, commands)
+
+    def _detail_table(self, rows: List[List[str]], commands: List[tuple]) -> LongTable:
+        table = LongTable(rows, colWidths=self.DETAIL_COL_WIDTHS, repeatRows=1, splitByRow=1)
+        table.setStyle(self.DETAIL_BASE_STYLE)
+        if commands:
+            table.setStyle(TableStyle(commands))
+        return table
+
+# Estado de cada processo do pool de exportação em lote, criado uma vez por processo pelo initializer.
+_PDF_WORKER_STATE: Dict[str, Any] = {}
+
+def _init_pdf_worker(db_path: str):
+    _PDF_WORKER_STATE["exporter"] = PDFExporter()
+    _PDF_WORKER_STATE["exporter"].styles  # constrói os estilos já na inicialização do processo
+    _PDF_WORKER_STATE["db"] = DatabaseManager(db_path)
+
+def _render_batch_pdf_job(job: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Executado dentro do pool: gera o PDF de uma unidade/período. Retorna (status, arquivo, mensagem)."""
+    filepath = job["filepath"]
+    try:
+        db = cast(DatabaseManager, _PDF_WORKER_STATE["db"])
+        results_data = db.get_collector_results(job["unit_name"], job["start_month"], job["end_month"], job["year"])
+        if not results_data:
+            return "skipped", filepath, f"{job['unit_name']} ({job['period_title']}): sem dados."
+        detail_df = db.get_detailed_results(job["unit_name"], job["start_month"], job["end_month"], job["year"])
+        cast(PDFExporter, _PDF_WORKER_STATE["exporter"]).build(filepath, job["unit_name"], job["period_title"], results_data, detail_df)
+        return "generated", filepath, filepath
+    except Exception as e:
+        return "errors", filepath, f"{job['unit_name']} ({job['period_title']}): {e}"
+
+class BatchPDFExporter:
+    """Gera um PDF de DRE por unidade e período em um pool de processos, reportando o progresso."""
+    def __init__(self, db_path: str, max_workers: Optional[int] = None):
+        self.db_path = db_path
+        self.max_workers = max_workers
+
+    @staticmethod
+    def parse_month_spec(spec: str) -> List[int]:
+        """Converte textos como '1-3,5' em [1, 2, 3, 5]. Lança ValueError para meses inválidos."""
+        months = set()
+        for part in spec.replace(" ", "").split(","):
+            if not part:
+                continue
+            if "-" in part:
+                start, end = (int(p) for p in part.split("-", 1))
+                months.update(range(start, end + 1))
+            else:
+                months.add(int(part))
+        if not months or not all(1 <= m <= 12 for m in months):
+            raise ValueError(f"Meses inválidos: '{spec}'")
+        return sorted(months)
+
+    def plan_jobs(self, units: List[str], months: List[int], output_dir: str, include_annual: bool = False, year: Optional[int] = None) -> List[Dict[str, Any]]:
+        year = current_year() if year is None else year
+        periods = [(m, m, f"{m:02d}/{year}") for m in months]
+        if include_annual:
+            periods.append((1, 12, f"Ano de {year}"))
+        return [
+            {
+                "unit_name": unit, "start_month": start, "end_month": end, "year": year, "period_title": title,
+                "filepath": os.path.join(output_dir, PDFExporter.default_filename(unit, title)),
+            }
+            for unit in units for start, end, title in periods
+        ]
+
+    @PERF_MONITOR.timed("export.batch_pdf", rows=lambda report: len(report["generated"]))
+    def run(self, jobs: List[Dict[str, Any]], progress: Optional[Callable[[int, int, str], None]] = None) -> Dict[str, List[str]]:
+        report: Dict[str, List[str]] = {"generated": [], "skipped": [], "errors": []}
+        if not jobs:
+            return report
+        for directory in {os.path.dirname(job["filepath"]) for job in jobs}:
+            os.makedirs(directory or ".", exist_ok=True)
+        workers = self.max_workers or min(len(jobs), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pdf_worker, initargs=(self.db_path,)) as pool:
+            futures = [pool.submit(_render_batch_pdf_job, job) for job in jobs]
+            for done, future in enumerate(as_completed(futures), start=1):
+                status, filepath, message = future.result()
+                report[status].append(message)
+                if progress:
+                    progress(done, len(jobs), os.path.basename(filepath))
+        return report
 
 class ExcelExporter:
     def export(self, period_title: str, results_data: Dict[str, Any]):
@@ -819,22 +2664,1055 @@ class ExcelExporter:
             total_row.name = "TOTAL GERAL"
             df = pd.concat([df, pd.DataFrame(total_row).T])
 
-            df.to_excel(filepath, sheet_name="DRE_Consolidado")
+            with PERF_MONITOR.span("export.excel_consolidated") as span:
+                span.rows = len(df)
+                df.to_excel(filepath, sheet_name="DRE_Consolidado")
+            messagebox.showinfo("Sucesso", f"Relatório salvo em:\n{filepath}")
+        except Exception as e:
+            messagebox.showerror("Erro ao Salvar Excel", f"Não foi possível gerar o arquivo.\nErro: {e}")
+
+    VARIANCE_HEADER = {
+        "line": "Linha", "current_value": "Mês", "previous_value": "Mês Anterior", "previous_delta": "Variação (R$)",
+        "previous_pct": "Variação (%)", "last_year_value": "Mesmo Mês Ano Anterior", "last_year_delta": "Variação Anual (R$)",
+        "last_year_pct": "Variação Anual (%)",
+    }
+
+    def export_variance(self, report: pd.DataFrame, scope: str, period_title: str):
+        """Salva o relatório de variação (get_variance_report) na ordem exibida."""
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            initialfile=f"Variacao_{scope.replace(' ', '_')}_{period_title.replace('/', '-')}.xlsx"
+        )
+        if not filepath: return
+
+        try:
+            df = report.assign(line=[variance_line_label(g, sg) for g, sg in zip(report["group_name"], report["subgroup_name"])])
+            df = df[list(self.VARIANCE_HEADER)].rename(columns=self.VARIANCE_HEADER)
+            with PERF_MONITOR.span("export.excel_variance") as span:
+                span.rows = len(df)
+                df.to_excel(filepath, sheet_name="Variação", index=False)
             messagebox.showinfo("Sucesso", f"Relatório salvo em:\n{filepath}")
         except Exception as e:
             messagebox.showerror("Erro ao Salvar Excel", f"Não foi possível gerar o arquivo.\nErro: {e}")
 
+    # Limite de linhas de uma planilha do Excel; acima disso os detalhes continuam em "Detalhes (2)", ...
+    MAX_SHEET_ROWS = 1_048_576
+    CHUNK_ROWS = 5000
+    DRE_ROW_INDENT = {"group": 0, "subgroup": 1, "indicator": 2, "subgroup_total": 1, "group_total": 0, "result": 0}
+    SUMMARY_HEADER = ["Unidade", "Período", "Arquivo de Origem", "Arrecadadora", "Total Receitas", "Total Despesas", "Resultado"]
+    DETAILS_HEADER = ["Unidade", "Período", "Arquivo de Origem", "Grupo", "Subgrupo", "Indicador", "Valor"]
+
+    def export_details(self, parent, db_manager: DatabaseManager, unit_name: Optional[str], start_month: int, end_month: int, period_title: str,
+                       start_year: Optional[int] = None, end_year: Optional[int] = None):
+        """Pergunta o destino e gera a planilha completa em segundo plano."""
+        scope = unit_name.replace(' ', '_') if unit_name else "Rede"
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            initialfile=f"DRE_Detalhado_{scope}_{period_title.replace('/', '-')}.xlsx"
+        )
+        if not filepath: return
+
+        def on_done(row_count: int):
+            db_manager.log_action("EXCEL_EXPORT", f"{row_count} linha(s) de detalhe exportadas para '{filepath}'.")
+            messagebox.showinfo("Sucesso", f"Relatório salvo em:\n{filepath}\n{row_count} linha(s) de detalhe.")
+
+        def on_error(e: Exception):
+            messagebox.showerror("Erro ao Salvar Excel", f"Não foi possível gerar o arquivo.\nErro: {e}")
+
+        run_in_background(parent, lambda: self.write_details_workbook(filepath, db_manager, unit_name, start_month, end_month, start_year, end_year), on_done, on_error)
+
+    @PERF_MONITOR.timed("export.excel_details", rows=lambda row_count: row_count)
+    def write_details_workbook(self, filepath: str, db_manager: DatabaseManager, unit_name: Optional[str], start_month: int, end_month: int,
+                               start_year: Optional[int] = None, end_year: Optional[int] = None) -> int:
+        """Grava as abas Resumo, DRE e Detalhes com o modo write-only do openpyxl.
+
+        As linhas vêm do cursor do SQLite em blocos de CHUNK_ROWS, então a memória usada não
+        depende do número de detalhes. Retorna quantas linhas de detalhe foram gravadas.
+        """
+        wb = Workbook(write_only=True)
+
+        ws = wb.create_sheet("Resumo")
+        ws.append(self.SUMMARY_HEADER)
+        for chunk in db_manager.iter_summary_rows(unit_name, start_month, end_month, self.CHUNK_ROWS, start_year, end_year):
+            for row in chunk:
+                ws.append(row)
+
+        ws = wb.create_sheet("DRE")
+        ws.append(["Descrição", "Valor"])
+        bold = Font(bold=True)
+        alignments = {level: Alignment(indent=level * 2) for level in set(self.DRE_ROW_INDENT.values())}
+        for kind, label, value in iter_dre_tree(db_manager.iter_detailed_results(unit_name, start_month, end_month, self.CHUNK_ROWS, start_year, end_year)):
+            label_cell = WriteOnlyCell(ws, value=label)
+            label_cell.alignment = alignments[self.DRE_ROW_INDENT[kind]]
+            value_cell = WriteOnlyCell(ws, value=value)
+            if kind != "indicator":
+                label_cell.font = bold
+                value_cell.font = bold
+            ws.append([label_cell, value_cell])
+
+        sheet_number = 1
+        ws = wb.create_sheet("Detalhes")
+        ws.append(self.DETAILS_HEADER)
+        sheet_rows = 1
+        total_rows = 0
+        for chunk in db_manager.iter_detail_rows(unit_name, start_month, end_month, self.CHUNK_ROWS, start_year, end_year):
+            for row in chunk:
+                if sheet_rows >= self.MAX_SHEET_ROWS:
+                    sheet_number += 1
+                    ws = wb.create_sheet(f"Detalhes ({sheet_number})")
+                    ws.append(self.DETAILS_HEADER)
+                    sheet_rows = 1
+                ws.append(row)
+                sheet_rows += 1
+            total_rows += len(chunk)
+
+        wb.save(filepath)
+        return total_rows
+
+class ParquetSnapshotExporter:
+    """Grava o banco de análises como arquivos Parquet particionados por ano e unidade.
+
+    Layout (particionamento estilo Hive, legível por pandas/pyarrow/DuckDB/Spark):
+        <pasta>/analysis_summary/year=2025/unit=<unidade>/part-0.parquet
+        <pasta>/analysis_details/year=2025/unit=<unidade>/part-0.parquet
+        <pasta>/dim_unit.parquet, dim_year.parquet, dim_month.parquet
+    O arquivo _manifest.json guarda a impressão digital de cada partição; na exportação seguinte
+    somente partições novas ou alteradas são regravadas, e as que sumiram do banco são removidas.
+    """
+    MANIFEST_FILE = "_manifest.json"
+    CHUNK_ROWS = 50_000
+    MONTH_NAMES = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+                   "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+
+    @staticmethod
+    def _arrow():
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("A exportação Parquet requer o pacote 'pyarrow' (pip install pyarrow).") from e
+        return pa, pq
+
+    @staticmethod
+    def _schemas(pa) -> Dict[str, Any]:
+        return {
+            "analysis_summary": pa.schema([
+                ("id", pa.int64()), ("unit_name", pa.string()), ("period", pa.string()), ("month", pa.int32()), ("year", pa.int32()),
+                ("generation_date", pa.string()), ("collector", pa.string()), ("source_file", pa.string()),
+                ("total_revenue", pa.float64()), ("total_expense", pa.float64()), ("net_result", pa.float64()),
+            ]),
+            "analysis_details": pa.schema([
+                ("id", pa.int64()), ("summary_id", pa.int64()), ("unit_name", pa.string()), ("month", pa.int32()), ("year", pa.int32()),
+                ("group_name", pa.string()), ("subgroup_name", pa.string()), ("indicator", pa.string()), ("value", pa.float64()),
+            ]),
+        }
+
+    @staticmethod
+    def partition_dir(output_dir: str, table: str, year: str, unit_name: str) -> str:
+        return os.path.join(output_dir, table, f"year={year}", f"unit={urllib.parse.quote(unit_name, safe='')}")
+
+    def _load_manifest(self, output_dir: str) -> Dict[str, str]:
+        try:
+            with open(os.path.join(output_dir, self.MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f).get("partitions", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, output_dir: str, partitions: Dict[str, str]):
+        tmp_path = os.path.join(output_dir, self.MANIFEST_FILE + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "partitions": partitions}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(output_dir, self.MANIFEST_FILE))
+
+    def _write_table(self, pa, pq, filepath: str, schema, chunks: Iterator[List[tuple]]) -> int:
+        """Grava um bloco do cursor por row group em um arquivo temporário e o substitui no final."""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_path = filepath + ".tmp"
+        rows = 0
+        with pq.ParquetWriter(tmp_path, schema, compression="snappy") as writer:
+            for chunk in chunks:
+                columns = list(zip(*chunk))
+                writer.write_batch(pa.record_batch([pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+                rows += len(chunk)
+        os.replace(tmp_path, filepath)
+        return rows
+
+    def _write_dimensions(self, pa, pq, output_dir: str, partitions: List[Tuple[str, str]]):
+        regions = self.db_manager.get_unit_regions()
+        units = sorted({unit for _, unit in partitions})
+        years = sorted({int(year) for year, _ in partitions})
+        pq.write_table(pa.table({"unit_name": units, "region": [regions.get(u) for u in units]}), os.path.join(output_dir, "dim_unit.parquet"))
+        pq.write_table(pa.table({"year": pa.array(years, type=pa.int32())}), os.path.join(output_dir, "dim_year.parquet"))
+        pq.write_table(pa.table({
+            "month": pa.array(range(1, 13), type=pa.int32()),
+            "month_name": self.MONTH_NAMES,
+            "quarter": pa.array([(m - 1) // 3 + 1 for m in range(1, 13)], type=pa.int32()),
+        }), os.path.join(output_dir, "dim_month.parquet"))
+
+    @PERF_MONITOR.timed("export.parquet_snapshot", rows=lambda report: report["rows"])
+    def export(self, output_dir: str, full: bool = False, progress: Optional[Callable[[int, int, str], None]] = None) -> Dict[str, int]:
+        """Gera ou atualiza o snapshot em `output_dir`. Com `full=True` todas as partições são regravadas;
+        partições que saíram do banco são removidas nos dois modos.
+
+        Retorna as contagens {"written", "unchanged", "removed", "rows"}.
+        """
+        pa, pq = self._arrow()
+        schemas = self._schemas(pa)
+        os.makedirs(output_dir, exist_ok=True)
+        previous = self._load_manifest(output_dir)
+        current = {f"{year}/{unit}": fingerprint for (year, unit), fingerprint in self.db_manager.get_partition_fingerprints().items()}
+        changed = [key for key, fingerprint in sorted(current.items()) if full or previous.get(key) != fingerprint]
+        removed = [key for key in previous if key not in current]
+        report = {"written": 0, "unchanged": len(current) - len(changed), "removed": 0, "rows": 0}
+
+        manifest = {key: fp for key, fp in previous.items() if key in current}
+        for done, key in enumerate(changed, start=1):
+            year, unit_name = key.split("/", 1)
+            for table, rows in (("analysis_summary", self.db_manager.iter_partition_summary_rows(year, unit_name, self.CHUNK_ROWS)),
+                                ("analysis_details", self.db_manager.iter_partition_detail_rows(year, unit_name, self.CHUNK_ROWS))):
+                filepath = os.path.join(self.partition_dir(output_dir, table, year, unit_name), "part-0.parquet")
+                report["rows"] += self._write_table(pa, pq, filepath, schemas[table], rows)
+            manifest[key] = current[key]
+            report["written"] += 1
+            # O manifesto é salvo a cada partição para que uma interrupção não force regravar tudo
+            self._save_manifest(output_dir, manifest)
+            if progress:
+                progress(done, len(changed), key)
+
+        for key in removed:
+            year, unit_name = key.split("/", 1)
+            for table in schemas:
+                shutil.rmtree(self.partition_dir(output_dir, table, year, unit_name), ignore_errors=True)
+            report["removed"] += 1
+
+        self._write_dimensions(pa, pq, output_dir, [tuple(key.split("/", 1)) for key in current])
+        self._save_manifest(output_dir, manifest)
+        return report
+
+# ==============================================================================
+# --- 5.1 RENDERIZADOR DE GRÁFICOS ---
+# ==============================================================================
+class ChartRenderer:
+    """Renderiza gráficos com o backend Agg em uma thread de trabalho e mantém os PNGs em cache.
+
+    A chave do cache combina o tipo do gráfico, o hash dos dados, o tema e o tamanho,
+    de modo que revisitar uma tela com os mesmos dados não redesenha nada.
+    """
+    MAX_CACHE_ENTRIES = 32
+    MAX_COMPARISON_BARS = 20
+    POLL_INTERVAL_MS = 30
+    DPI = 100
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-render")
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(kind: str, payload: Dict[str, Any], theme: Dict[str, str], size: Tuple[float, float]) -> str:
+        raw = json.dumps([kind, payload, theme, size], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _get_cached(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            png = self._cache.get(key)
+            if png is not None:
+                self._cache.move_to_end(key)
+            return png
+
+    def _store(self, key: str, png: bytes):
+        with self._lock:
+            self._cache[key] = png
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.MAX_CACHE_ENTRIES:
+                self._cache.popitem(last=False)
+
+    def render_async(self, widget, kind: str, payload: Dict[str, Any], theme: Dict[str, str],
+                     on_ready: Callable[[bytes], None], on_error: Optional[Callable[[Exception], None]] = None,
+                     size: Tuple[float, float] = (8, 4)):
+        """Agenda a renderização e entrega o PNG a `on_ready` na thread do Tk (via `widget.after`)."""
+        key = self._cache_key(kind, payload, theme, size)
+        cached = self._get_cached(key)
+        if cached is not None:
+            on_ready(cached)
+            return
+
+        future = self._executor.submit(self.render, kind, payload, theme, size)
+
+        def poll():
+            if not widget.winfo_exists():
+                return
+            if not future.done():
+                widget.after(self.POLL_INTERVAL_MS, poll)
+                return
+            try:
+                png = future.result()
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                return
+            self._store(key, png)
+            on_ready(png)
+
+        widget.after(self.POLL_INTERVAL_MS, poll)
+
+    def render(self, kind: str, payload: Dict[str, Any], theme: Dict[str, str], size: Tuple[float, float] = (8, 4)) -> bytes:
+        """Desenha o gráfico e devolve os bytes PNG. Não toca em nenhum widget Tk."""
+        fig = Figure(figsize=size, dpi=self.DPI, facecolor=theme["frame"])
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111, facecolor=theme["frame"])
+        draw = getattr(self, f"_draw_{kind}")
+        draw(ax, payload, theme)
+        ax.tick_params(colors=theme["text"])
+        for spine in ax.spines.values():
+            spine.set_edgecolor(theme["text"])
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", facecolor=fig.get_facecolor())
+        return buffer.getvalue()
+
+    def _draw_monthly_net(self, ax, payload: Dict[str, Any], theme: Dict[str, str]):
+        values = payload["values"]
+        ax.bar(payload["labels"], values, color=[theme["primary"] if v >= 0 else Config.COLOR_RED for v in values])
+        goal = payload.get("goal") or 0
+        if payload.get("budget"):
+            ax.plot(payload["labels"], payload["budget"], color=Config.COLOR_SECONDARY_YELLOW, linestyle='--', marker='o', linewidth=2, label='Orçamento (grupos orçados)')
+            if payload.get("budget_actual"):
+                ax.plot(payload["labels"], payload["budget_actual"], color=Config.COLOR_BLUE, marker='o', linewidth=2, label='Realizado (grupos orçados)')
+            ax.legend()
+        elif goal > 0:
+            ax.axhline(y=goal, color=Config.COLOR_SECONDARY_YELLOW, linestyle='--', linewidth=2, label=f'Meta: R$ {goal:,.2f}')
+            ax.legend()
+        ax.set_title(payload["title"], color=theme["text"])
+        ax.set_ylabel("Resultado (R$)", color=theme["text"])
+
+    def _draw_projection(self, ax, payload: Dict[str, Any], theme: Dict[str, str]):
+        values = payload["values"]
+        colors = [theme["primary"] if v >= 0 else Config.COLOR_RED for v in values]
+        bars = ax.bar(payload["labels"], values, color=colors)
+        for bar, projected in zip(bars, payload["projected"]):
+            if projected:
+                bar.set_alpha(0.45)
+                bar.set_hatch("//")
+        goal = payload.get("goal") or 0
+        if goal > 0:
+            ax.axhline(y=goal, color=Config.COLOR_SECONDARY_YELLOW, linestyle='--', linewidth=2, label=f'Meta: R$ {goal:,.2f}')
+            ax.legend()
+        ax.set_title(payload["title"], color=theme["text"])
+        ax.set_ylabel("Resultado (R$)", color=theme["text"])
+
+    def _draw_scenario_fan(self, ax, payload: Dict[str, Any], theme: Dict[str, str]):
+        bands = {int(p): values for p, values in payload["bands"].items()}
+        x = np.arange(len(payload["labels"]))
+        ax.fill_between(x, bands[5], bands[95], color=theme["primary"], alpha=0.18, label="P5–P95")
+        ax.fill_between(x, bands[25], bands[75], color=theme["primary"], alpha=0.35, label="P25–P75")
+        ax.plot(x, bands[50], color=theme["primary"], marker="o", linewidth=2, label="Mediana")
+        goal = payload.get("goal") or 0
+        if goal > 0:
+            ax.axhline(y=goal, color=Config.COLOR_SECONDARY_YELLOW, linestyle='--', linewidth=2, label=f'Meta: R$ {goal:,.2f}')
+        ax.set_xticks(x)
+        ax.set_xticklabels(payload["labels"])
+        ax.legend()
+        ax.set_title(payload["title"], color=theme["text"])
+        ax.set_ylabel("Resultado (R$)", color=theme["text"])
+
+    def _draw_trend(self, ax, payload: Dict[str, Any], theme: Dict[str, str]):
+        x = np.arange(len(payload["labels"]))
+        for unit, values in payload["lines"].items():
+            highlighted = unit == payload.get("highlight")
+            ax.plot(x, np.array(values, dtype=float), marker="o", markersize=3, linewidth=2.5 if highlighted else 1.2,
+                    color=theme["primary"] if highlighted else None, label=unit)
+        ax.axhline(y=0, color=theme["text"], linewidth=0.5)
+        ax.set_xticks(x)
+        ax.set_xticklabels(payload["labels"])
+        ax.legend(fontsize=8)
+        ax.set_title(payload["title"], color=theme["text"])
+        ax.set_ylabel("Valor (R$)", color=theme["text"])
+
+    def _draw_unit_comparison(self, ax, payload: Dict[str, Any], theme: Dict[str, str]):
+        labels = payload["units"]
+        x = np.arange(len(labels))
+        width = 0.4
+        ax.bar(x - width / 2, payload["total_revenue"], width, color=Config.COLOR_BLUE, label="Receita Total")
+        ax.bar(x + width / 2, payload["net_result"], width, color=theme["primary"], label="Resultado Líquido")
+        rotation = 0 if len(labels) <= 6 else 45
+        ax.set_xticks(x)
+        ax.set_xticklabels(labels, rotation=rotation, ha="right" if rotation else "center", fontsize=8 if rotation else None)
+        ax.set_title(payload["title"], color=theme["text"])
+        ax.set_xlabel("Unidades", color=theme["text"])
+        ax.set_ylabel("Valor (R$)", color=theme["text"])
+        ax.legend()
+
+    @classmethod
+    def comparison_payload(cls, data: pd.DataFrame, title: str) -> Dict[str, Any]:
+        """Monta os dados do comparativo; acima de MAX_COMPARISON_BARS unidades, agrega as demais em uma barra."""
+        ordered = data.sort_values("net_result", ascending=False)
+        if len(ordered) > cls.MAX_COMPARISON_BARS:
+            head = ordered.iloc[:cls.MAX_COMPARISON_BARS - 1]
+            tail = ordered.iloc[cls.MAX_COMPARISON_BARS - 1:]
+            units = head["unit_name"].tolist() + [f"Demais ({len(tail)})"]
+            revenue = head["total_revenue"].tolist() + [float(tail["total_revenue"].sum())]
+            net = head["net_result"].tolist() + [float(tail["net_result"].sum())]
+            title = f"{title} (top {cls.MAX_COMPARISON_BARS - 1} de {len(ordered)})"
+        else:
+            units = ordered["unit_name"].tolist()
+            revenue = ordered["total_revenue"].tolist()
+            net = ordered["net_result"].tolist()
+        return {
+            "units": [str(u) for u in units],
+            "total_revenue": [float(v) for v in revenue],
+            "net_result": [float(v) for v in net],
+            "title": title,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# ==============================================================================
+# --- 5.2 PROJEÇÕES ---
+# ==============================================================================
+MONTH_ABBREVIATIONS = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+
+class NetworkForecast:
+    """Projeção de um ano para todas as unidades, produzida pelo ForecastEngine.
+
+    values[u, m, s] é o valor da unidade `units[u]` no mês m (0 = janeiro) para a série
+    `series[s]` = (grupo, subgrupo): o realizado nos meses importados e a projeção nos demais.
+    projected[u, m] indica os meses projetados de cada unidade.
+    """
+    def __init__(self, year: int, units: List[str], series: List[Tuple[str, str]], values: np.ndarray, projected: np.ndarray,
+                 residuals: Optional[np.ndarray] = None, history_observed: Optional[np.ndarray] = None):
+        self.year = year
+        self.units = units
+        self.series = series
+        self.values = values
+        self.projected = projected
+        # Resíduos do modelo nos meses do histórico (unidades, meses, séries), usados pelo ScenarioSimulator
+        self.residuals = residuals if residuals is not None else np.zeros((len(units), 0, len(series)))
+        self.history_observed = history_observed if history_observed is not None else np.zeros((len(units), 0), dtype=bool)
+        self._unit_positions = {unit: i for i, unit in enumerate(units)}
+
+    def unit_position(self, unit_name: str) -> Optional[int]:
+        return self._unit_positions.get(unit_name)
+
+    def monthly_net(self) -> np.ndarray:
+        """Resultado líquido por unidade e mês, shape (unidades, 12)."""
+        return self.values.sum(axis=2)
+
+    def unit_rows(self, unit_name: str) -> List[Tuple[str, str, np.ndarray]]:
+        """Linhas (grupo, subgrupo, 12 valores) da unidade na ordem do DRE, sem séries zeradas."""
+        position = self.unit_position(unit_name)
+        if position is None:
+            return []
+        unit_values = self.values[position]
+        order = sorted(range(len(self.series)), key=lambda s: (dre_group_rank(self.series[s][0]), self.series[s]))
+        return [(self.series[s][0], self.series[s][1], unit_values[:, s]) for s in order if np.any(unit_values[:, s])]
+
+class ForecastEngine:
+    """Projeta os meses sem dados de cada unidade por grupo/subgrupo a partir do histórico.
+
+    Modelo aditivo por (unidade, subgrupo): tendência linear ajustada por mínimos quadrados
+    sobre os meses importados mais sazonalidade pela média dos resíduos de cada mês do ano.
+    Tudo é calculado de uma vez sobre o cubo unidade × mês × série com NumPy, sem laços por unidade.
+    """
+    HISTORY_MONTHS = 36
+    # Com poucos meses a inclinação é ruído: abaixo disso projeta-se a média
+    MIN_TREND_MONTHS = 6
+    # Observações do mesmo mês do ano necessárias para estimar sua sazonalidade
+    MIN_SEASON_OBS = 2
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+
+    def forecast(self, year: Optional[int] = None) -> NetworkForecast:
+        year = current_year() if year is None else year
+        first, last = period_bounds(1, 12, year)
+        return self.project(self.db_manager.get_rollup_history(first - self.HISTORY_MONTHS, last), year)
+
+    @classmethod
+    def project(cls, history: pd.DataFrame, year: int) -> NetworkForecast:
+        """Projeta `year` a partir de um histórico no formato de get_rollup_history."""
+        first = period_index(year, 1) - cls.HISTORY_MONTHS
+        month_count = cls.HISTORY_MONTHS + 12
+        offsets = history["period_index"].to_numpy() - first
+        history = history[(offsets >= 0) & (offsets < month_count)]
+        if history.empty:
+            return NetworkForecast(year, [], [], np.zeros((0, 12, 0)), np.zeros((0, 12), dtype=bool))
+
+        unit_codes, units = pd.factorize(history["unit_name"], sort=True)
+        # Séries (grupo, subgrupo) codificadas como inteiros, sem materializar tuplas por linha
+        group_codes, groups = pd.factorize(history["group_name"], sort=True)
+        subgroup_codes, subgroups = pd.factorize(history["subgroup_name"], sort=True)
+        series_codes, pairs = pd.factorize(group_codes * len(subgroups) + subgroup_codes, sort=True)
+        series = [(groups[pair // len(subgroups)], subgroups[pair % len(subgroups)]) for pair in pairs]
+        month_codes = history["period_index"].to_numpy() - first
+        cube = np.zeros((len(units), month_count, len(series)))
+        cube[unit_codes, month_codes, series_codes] = history["total_value"].to_numpy(dtype=float)
+        observed = np.zeros((len(units), month_count), dtype=bool)
+        observed[unit_codes, month_codes] = True
+
+        # Tendência: mínimos quadrados ponderados pelos meses observados (fórmulas fechadas, vetorizadas)
+        weights = observed.astype(float)
+        x = np.arange(month_count, dtype=float)
+        n = weights.sum(axis=1)
+        sum_x = weights @ x
+        sum_xx = weights @ (x * x)
+        sum_y = cube.sum(axis=1)
+        sum_xy = np.einsum("t,uts->us", x, cube)
+        denominator = n * sum_xx - sum_x ** 2
+        has_trend = (n >= cls.MIN_TREND_MONTHS) & (denominator > 0)
+        slope = np.where(has_trend[:, None], (n[:, None] * sum_xy - sum_x[:, None] * sum_y) / np.where(has_trend, denominator, 1.0)[:, None], 0.0)
+        intercept = (sum_y - slope * sum_x[:, None]) / np.maximum(n, 1.0)[:, None]
+        fitted = intercept[:, None, :] + slope[:, None, :] * x[None, :, None]
+
+        # Sazonalidade: média dos resíduos de cada mês do ano
+        month_of_year = (first + np.arange(month_count)) % 12
+        one_hot = np.eye(12)[month_of_year]
+        residuals = (cube - fitted) * weights[:, :, None]
+        season_sum = np.einsum("uts,tm->ums", residuals, one_hot)
+        season_count = weights @ one_hot
+        seasonal = np.where(season_count[:, :, None] >= cls.MIN_SEASON_OBS, season_sum / np.maximum(season_count, 1.0)[:, :, None], 0.0)
+
+        target = slice(cls.HISTORY_MONTHS, month_count)
+        projection = fitted[:, target, :] + seasonal[:, month_of_year[target], :]
+        target_observed = observed[:, target]
+        values = np.where(target_observed[:, :, None], cube[:, target, :], projection)
+        model_residuals = (cube - fitted - seasonal[:, month_of_year, :]) * weights[:, :, None]
+        return NetworkForecast(year, [str(unit) for unit in units], [(str(g), str(sg)) for g, sg in series], values, ~target_observed,
+                               residuals=model_residuals, history_observed=observed)
+
+class ScenarioResult:
+    """Faixas de percentis do resultado líquido simulado pelo ScenarioSimulator.
+
+    monthly[p, u, m] e annual[p, u] trazem o percentil `percentiles[p]` de cada unidade;
+    network_monthly e network_annual, o mesmo para a soma da rede em cada simulação.
+    """
+    def __init__(self, forecast: NetworkForecast, percentiles: Tuple[int, ...], simulations: int, monthly: np.ndarray, annual: np.ndarray,
+                 network_monthly: np.ndarray, network_annual: np.ndarray):
+        self.forecast = forecast
+        self.percentiles = percentiles
+        self.simulations = simulations
+        self.monthly = monthly
+        self.annual = annual
+        self.network_monthly = network_monthly
+        self.network_annual = network_annual
+
+    def unit_bands(self, unit_name: str) -> Optional[Dict[int, np.ndarray]]:
+        """{percentil: 12 valores mensais} da unidade, ou None se ela não tem histórico."""
+        position = self.forecast.unit_position(unit_name)
+        if position is None:
+            return None
+        return {p: self.monthly[i, position] for i, p in enumerate(self.percentiles)}
+
+    def unit_annual(self, unit_name: str) -> Optional[Dict[int, float]]:
+        position = self.forecast.unit_position(unit_name)
+        if position is None:
+            return None
+        return {p: float(self.annual[i, position]) for i, p in enumerate(self.percentiles)}
+
+class ScenarioSimulator:
+    """Monte Carlo de cenários "e se" sobre a projeção do ForecastEngine.
+
+    Os choques são percentuais por grupo do DRE (ex.: {"Receitas Operacionais": -0.10}) e valem
+    para os meses projetados. Cada simulação sorteia, para cada unidade e mês projetado, um mês do
+    histórico da própria unidade e soma à projeção os resíduos do modelo daquele mês (todos os
+    grupos juntos, preservando a correlação entre eles), também ajustados pelos choques.
+    """
+    PERCENTILES = (5, 25, 50, 75, 95)
+    DEFAULT_SIMULATIONS = 10_000
+    # Elementos (simulações × unidades × meses) sorteados por bloco, para limitar a memória
+    CHUNK_ELEMENTS = 4_000_000
+
+    def __init__(self, forecast: NetworkForecast):
+        self.forecast = forecast
+
+    def shock_factors(self, shocks: Dict[str, float]) -> np.ndarray:
+        return np.array([1.0 + shocks.get(group, 0.0) for group, _ in self.forecast.series])
+
+    def run(self, shocks: Dict[str, float], simulations: int = DEFAULT_SIMULATIONS, seed: Optional[int] = None) -> ScenarioResult:
+        forecast = self.forecast
+        rng = np.random.default_rng(seed)
+        factors = self.shock_factors(shocks)
+        unit_count = len(forecast.units)
+        projected = forecast.projected
+        point_net = np.where(projected[:, :, None], forecast.values * factors, forecast.values).sum(axis=2)
+        residual_net = forecast.residuals @ factors
+
+        # Meses observados de cada unidade no início da linha; sorteia-se uma posição < nº de observados
+        observed_count = forecast.history_observed.sum(axis=1)
+        observed_months = np.argsort(~forecast.history_observed, axis=1, kind="stable")
+        noise_mask = projected & (observed_count > 0)[:, None]
+
+        # Só os meses projetados em alguma unidade variam; os demais entram com o valor realizado
+        percentiles = self.PERCENTILES
+        varying = np.flatnonzero(noise_mask.any(axis=0))
+        realized_total = np.where(np.isin(np.arange(12), varying), 0.0, point_net).sum(axis=1)
+        monthly = np.repeat(point_net[None], len(percentiles), axis=0)
+        annual = np.zeros((len(percentiles), unit_count))
+        network = np.zeros((simulations, len(varying)))
+        chunk = max(1, self.CHUNK_ELEMENTS // (simulations * max(len(varying), 1)))
+        for start in range(0, unit_count, chunk):
+            block = slice(start, min(start + chunk, unit_count))
+            rows = np.arange(block.stop - block.start)[None, :, None]
+            draws = (rng.random((simulations, len(rows[0]), len(varying))) * observed_count[block][None, :, None]).astype(np.int64)
+            months = observed_months[block][rows, draws]
+            simulated = point_net[block][:, varying][None] + residual_net[block][rows, months] * noise_mask[block][:, varying][None]
+            monthly[:, block, varying] = np.percentile(simulated, percentiles, axis=0)
+            annual[:, block] = np.percentile(simulated.sum(axis=2), percentiles, axis=0) + realized_total[block]
+            network += simulated.sum(axis=1)
+        network_monthly = np.repeat(point_net.sum(axis=0)[None], len(percentiles), axis=0)
+        network_monthly[:, varying] = np.percentile(network, percentiles, axis=0)
+        network_annual = np.percentile(network.sum(axis=1), percentiles) + realized_total.sum()
+        return ScenarioResult(forecast, percentiles, simulations, monthly, annual, network_monthly, network_annual)
+
+# ==============================================================================
+# --- 5.3 DETECÇÃO DE ANOMALIAS ---
+# ==============================================================================
+class AnomalyDetector:
+    """Sinaliza, logo após cada importação, subgrupos com valores atípicos.
+
+    Cada subgrupo do mês importado é comparado por z-score robusto (mediana e MAD) com o
+    histórico da própria unidade e com as demais unidades da rede no mesmo mês, sobre
+    analysis_rollups. Todos os subgrupos são avaliados de uma vez com NumPy.
+    """
+    Z_THRESHOLD = 3.5
+    HISTORY_MONTHS = 24
+    MIN_HISTORY_MONTHS = 4
+    MIN_NETWORK_UNITS = 5
+    # Diferenças absolutas menores que isso (R$) nunca são sinalizadas
+    MIN_DEVIATION = 100.0
+    # Piso da escala em fração da mediana, para séries quase constantes (ex.: aluguel)
+    RELATIVE_SCALE_FLOOR = 0.05
+    # Um subgrupo presente em pelo menos esta fração dos meses do histórico é recorrente
+    RECURRING_SHARE = 0.8
+    REASONS = {
+        "missing": "Sem lançamento no mês (recorrente no histórico)",
+        "sign": "Sinal invertido em relação ao histórico",
+        "unit_history": "Fora do padrão do histórico da unidade",
+        "network": "Fora do padrão da rede no mês",
+    }
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+
+    @classmethod
+    def robust_z(cls, values: np.ndarray, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(mediana, z) de cada coluna de `values` contra as linhas de `samples` (amostras × séries)."""
+        median = np.median(samples, axis=0)
+        mad = np.median(np.abs(samples - median), axis=0) * 1.4826
+        scale = np.maximum(mad, cls.RELATIVE_SCALE_FLOOR * np.abs(median))
+        z = np.divide(values - median, scale, out=np.zeros_like(median), where=scale > 0)
+        return median, z
+
+    def check(self, summary_id: int) -> int:
+        """Avalia a importação, grava os alertas e retorna quantos foram sinalizados."""
+        inputs = self.db_manager.get_anomaly_inputs(summary_id, self.HISTORY_MONTHS)
+        if inputs is None:
+            return 0
+        unit_name, current_period, history, network = inputs
+        flags = self.evaluate(unit_name, current_period, history, network)
+        self.db_manager.save_anomaly_flags(summary_id, flags)
+        return len(flags)
+
+    @classmethod
+    def evaluate(cls, unit_name: str, current_period: int, history: pd.DataFrame, network: pd.DataFrame) -> List[Tuple]:
+        unit_matrix = history.pivot_table(index="period_index", columns=["group_name", "subgroup_name"], values="total_value", aggfunc="sum", fill_value=0.0)
+        if current_period not in unit_matrix.index:
+            return []
+        series = unit_matrix.columns
+        current = unit_matrix.loc[current_period].to_numpy(dtype=float)
+        past = unit_matrix.drop(index=current_period).to_numpy(dtype=float)
+        series_count = len(series)
+
+        enough_history = len(past) >= cls.MIN_HISTORY_MONTHS
+        if enough_history:
+            unit_median, unit_z = cls.robust_z(current, past)
+            recurring = (past != 0).mean(axis=0) >= cls.RECURRING_SHARE
+        else:
+            unit_median, unit_z = np.full(series_count, np.nan), np.zeros(series_count)
+            recurring = np.zeros(series_count, dtype=bool)
+
+        others = network[network["unit_name"] != unit_name]
+        network_matrix = others.pivot_table(index="unit_name", columns=["group_name", "subgroup_name"], values="total_value", aggfunc="sum", fill_value=0.0)
+        network_matrix = network_matrix.reindex(columns=series, fill_value=0.0)
+        if len(network_matrix) >= cls.MIN_NETWORK_UNITS:
+            network_median, network_z = cls.robust_z(current, network_matrix.to_numpy(dtype=float))
+        else:
+            network_median, network_z = np.full(series_count, np.nan), np.zeros(series_count)
+
+        material_unit = np.abs(current - np.nan_to_num(unit_median)) >= cls.MIN_DEVIATION
+        material_network = np.abs(current - np.nan_to_num(network_median)) >= cls.MIN_DEVIATION
+        missing = recurring & (current == 0) & material_unit
+        sign = enough_history & (np.sign(current) * np.sign(np.nan_to_num(unit_median)) < 0) & material_unit
+        off_history = enough_history & (np.abs(unit_z) > cls.Z_THRESHOLD) & material_unit
+        off_network = (np.abs(network_z) > cls.Z_THRESHOLD) & material_network
+
+        reasons = np.select([missing, sign, off_history, off_network], ["missing", "sign", "unit_history", "network"], default="")
+        return [
+            (unit_name, current_period, str(series[i][0]), str(series[i][1]), str(reasons[i]), float(current[i]),
+             None if np.isnan(unit_median[i]) else float(unit_median[i]), float(unit_z[i]),
+             None if np.isnan(network_median[i]) else float(network_median[i]), float(network_z[i]))
+            for i in np.flatnonzero(reasons != "")
+        ]
+
+    @classmethod
+    def describe(cls, flag: Dict[str, Any]) -> str:
+        """Texto curto do alerta (linha de get_anomaly_flags), para os destaques do DRE."""
+        text = f"{period_label(int(flag['period_index']))}: {cls.REASONS.get(flag['reason'], flag['reason'])}"
+        reference = flag["unit_median"] if flag["reason"] != "network" else flag["network_median"]
+        if reference is not None and not pd.isna(reference):
+            text += f" (R$ {flag['value']:,.2f}; mediana R$ {reference:,.2f})"
+        return text
+
+# ==============================================================================
+# --- 5.4 TENDÊNCIAS ---
+# ==============================================================================
+class TrendSeries:
+    """Séries mensais por unidade e grupo do DRE, produzidas pelo TrendEngine.
+
+    monthly[u, m, g] é o total da unidade `units[u]` no mês `first_period + m` para `groups[g]`;
+    rolling_12 (soma dos últimos 12 meses) e ytd (acumulado desde janeiro) têm o mesmo shape.
+    rolling_12 é NaN nos meses sem 12 meses de histórico carregado.
+    """
+    KINDS = ("monthly", "rolling_12", "ytd")
+
+    def __init__(self, first_period: int, units: List[str], groups: List[str], monthly: np.ndarray, rolling_12: np.ndarray, ytd: np.ndarray):
+        self.first_period = first_period
+        self.units = units
+        self.groups = groups
+        self.monthly = monthly
+        self.rolling_12 = rolling_12
+        self.ytd = ytd
+        self._unit_positions = {unit: i for i, unit in enumerate(units)}
+
+    @property
+    def periods(self) -> np.ndarray:
+        return self.first_period + np.arange(self.monthly.shape[1])
+
+    def unit_position(self, unit_name: str) -> Optional[int]:
+        return self._unit_positions.get(unit_name)
+
+    def sliced(self, first_period: int) -> "TrendSeries":
+        """As mesmas séries a partir de `first_period`, sem os meses carregados só para os acumulados."""
+        start = first_period - self.first_period
+        return TrendSeries(first_period, self.units, self.groups, self.monthly[:, start:], self.rolling_12[:, start:], self.ytd[:, start:])
+
+    def series(self, kind: str, group: Optional[str] = None) -> np.ndarray:
+        """Série (unidades, meses) de `kind` para um grupo, ou do resultado líquido com `group` None."""
+        values = getattr(self, kind)
+        if group is None:
+            return values.sum(axis=2)
+        if group not in self.groups:
+            return np.zeros(values.shape[:2])
+        return values[:, :, self.groups.index(group)]
+
+class TrendEngine:
+    """Calcula as séries de acumulado móvel de 12 meses e acumulado no ano por unidade e grupo.
+
+    Uma consulta traz o histórico de todas as unidades pedidas; o cubo unidade × mês × grupo é
+    montado com NumPy e os dois acumulados saem de uma única soma cumulativa ao longo dos meses.
+    """
+    ROLLING_MONTHS = 12
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+
+    def trends(self, units: Union[str, List[str], None], start_month: int, end_month: int,
+               start_year: Optional[int] = None, end_year: Optional[int] = None) -> TrendSeries:
+        first, last = period_bounds(start_month, end_month, start_year, end_year)
+        # Meses anteriores necessários para a janela móvel e para o acumulado desde janeiro
+        load_first = min(first - (self.ROLLING_MONTHS - 1), first - first % 12)
+        history = self.db_manager.get_group_history(units, load_first, last)
+        unit_order = [units] if isinstance(units, str) else units
+        return self.build(history, load_first, last, unit_order).sliced(first)
+
+    @classmethod
+    def build(cls, history: pd.DataFrame, first: int, last: int, units: Optional[List[str]] = None) -> TrendSeries:
+        """Séries de `first` a `last` a partir de um histórico no formato de get_group_history.
+
+        Com `units`, as unidades seguem essa ordem (inclusive as sem dados); sem, vêm do histórico.
+        """
+        month_count = last - first + 1
+        history = history[(history["period_index"] >= first) & (history["period_index"] <= last)]
+        if units is None:
+            unit_codes, unit_index = pd.factorize(history["unit_name"], sort=True)
+            unit_list = [str(unit) for unit in unit_index]
+        else:
+            unit_list = list(units)
+            unit_codes = pd.Categorical(history["unit_name"], categories=unit_list).codes
+        groups = sorted(history["group_name"].unique(), key=lambda group: (dre_group_rank(group), group))
+        group_codes = pd.Categorical(history["group_name"], categories=groups).codes
+        known = unit_codes >= 0
+
+        monthly = np.zeros((len(unit_list), month_count, len(groups)))
+        np.add.at(monthly, (unit_codes[known], history["period_index"].to_numpy()[known] - first, group_codes[known]),
+                  history["total_value"].to_numpy(dtype=float)[known])
+
+        # cumulative[:, k] = soma dos k primeiros meses; qualquer janela é a diferença de dois pontos
+        cumulative = np.concatenate([np.zeros((len(unit_list), 1, len(groups))), np.cumsum(monthly, axis=1)], axis=1)
+        ends = np.arange(1, month_count + 1)
+        window_starts = ends - cls.ROLLING_MONTHS
+        rolling_12 = cumulative[:, ends, :] - cumulative[:, np.maximum(window_starts, 0), :]
+        rolling_12[:, window_starts < 0, :] = np.nan
+        periods = first + np.arange(month_count)
+        year_starts = np.maximum(periods - periods % 12 - first, 0)
+        ytd = cumulative[:, ends, :] - cumulative[:, year_starts, :]
+        return TrendSeries(first, unit_list, [str(group) for group in groups], monthly, rolling_12, ytd)
+
+# ==============================================================================
+# --- 5.5 BENCHMARKS ---
+# ==============================================================================
+class SyntheticDataGenerator:
+    """Gera CSVs de Nota de Negócio e de Detalhamento Financeiro e popula bases de teste.
+
+    Códigos e descrições vêm dos mapeamentos de Config, então as linhas passam pelas mesmas
+    regras de uma importação real (inclusive descartes e linhas sem regra). Mesma semente,
+    mesmos arquivos e mesma base.
+    """
+    UNMAPPED_NOTA = "ZZZ"
+
+    def __init__(self, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def format_value(value: float) -> str:
+        """Valor no formato dos relatórios: 1.234,56."""
+        return f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+    def _amounts(self, count: int) -> np.ndarray:
+        return np.round(self.rng.lognormal(mean=7.0, sigma=1.2, size=count), 2)
+
+    def nota_negocio_rows(self, count: int) -> List[Tuple[str, float]]:
+        """(indicador, valor) com o sinal que o arquivo traria: despesas da franqueadora negativas."""
+        codes = list(Config.NOTAS_NEGOCIO_MAPPING) + [self.UNMAPPED_NOTA]
+        picks = self.rng.integers(0, len(codes), count)
+        amounts = self._amounts(count)
+        rows = []
+        for i, (pick, amount) in enumerate(zip(picks, amounts)):
+            code = codes[pick]
+            group = Config.NOTAS_NEGOCIO_MAPPING.get(code, {}).get("group", "")
+            rows.append((f"{code} Indicador {i}", -amount if RuleEngine.sign_policy(group) == "negative" else amount))
+        return rows
+
+    def detalhamento_rows(self, count: int) -> List[Tuple[str, str, float]]:
+        """(SubConta, Descrição, valor) misturando códigos exatos, subcontas novas, palavras-chave e transferências."""
+        codes = list(Config.CHART_OF_ACCOUNTS)
+        keywords = list(Config.DESCRIPTION_MAPPING)
+        samples = (
+            [(code, "LANCAMENTO") for code in codes]
+            + [(f"{code}.{n}", "LANCAMENTO") for code in codes for n in range(3)]
+            + [("99.99.999", f"PAGAMENTO {keyword} REF") for keyword in keywords]
+            + [("99.99.999", "TRANSFERENCIA ENTRE CONTAS"), ("99.99.999", "LANCAMENTO SEM REGRA")]
+        )
+        picks = self.rng.integers(0, len(samples), count)
+        return [(samples[pick][0], samples[pick][1], float(amount)) for pick, amount in zip(picks, self._amounts(count))]
+
+    def write_nota_negocio(self, filepath: str, row_count: int, collector: str = "Arrecadadora Sintética") -> str:
+        lines = ["Nota de Negócio;", f"Arrecadadora: {collector};", ";", "Indicadores;Valores"]
+        lines += [f"{indicator};{self.format_value(value)}" for indicator, value in self.nota_negocio_rows(row_count)]
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return filepath
+
+    def write_detalhamento(self, filepath: str, row_count: int) -> str:
+        lines = ["Detalhamento Financeiro;;", ";;", "SubConta;Descrição;Valor"]
+        lines += [f"{code};{text};R$ {self.format_value(value)}" for code, text, value in self.detalhamento_rows(row_count)]
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return filepath
+
+    def populate_database(self, db_manager: DatabaseManager, units: int, months: int, details_per_import: int,
+                          year: Optional[int] = None, data_processor: Optional["DataProcessor"] = None) -> int:
+        """Grava `units` × `months` importações (terminando em dezembro de `year`) com até `details_per_import`
+        linhas classificadas cada. Retorna o total de linhas gravadas."""
+        year = current_year() if year is None else year
+        processor = data_processor or DataProcessor()
+        last = period_index(year, 12)
+        total = 0
+        for unit in range(units):
+            unit_name = f"Unidade {unit:04d}"
+            for offset in range(months):
+                index = last - months + 1 + offset
+                details = []
+                for code, text, value in self.detalhamento_rows(details_per_import):
+                    classification = processor.classify_detalhamento(code, text)
+                    if classification is None:
+                        continue
+                    group, subgroup, sign = classification
+                    details.append({"group": group, "subgroup": subgroup, "indicator": text.title(), "value": processor.apply_sign_rule(sign, value),
+                                    "source": "detalhamento", "account_code": code, "indicator_key": text, "raw_value": value})
+                db_manager.save_imported_data(unit_name, index % 12 + 1, f"Consolidado_{index % 12 + 1:02d}-{index // 12}", details, year=index // 12)
+                total += len(details)
+        return total
+
+class BenchmarkSuite:
+    """Mede importação e consultas sobre uma base sintética e devolve um relatório comparável entre versões.
+
+    Cada medida roda `repeat` vezes com o cache de consultas limpo e guarda mediana e mínimo em ms;
+    o relatório é um dicionário serializável em JSON, e compare() casa duas execuções pelo nome.
+    """
+    REPORT_FORMAT = 1
+
+    def __init__(self, workdir: str, units: int = 20, months: int = 12, details: int = 200, csv_rows: int = 2000,
+                 repeat: int = 5, seed: int = 0, year: Optional[int] = None):
+        self.workdir = workdir
+        self.units = units
+        self.months = months
+        self.details = details
+        self.csv_rows = csv_rows
+        self.repeat = repeat
+        self.seed = seed
+        self.year = current_year() if year is None else year
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def measure(self, name: str, func: Callable[[], Any], db_manager: Optional[DatabaseManager] = None, repeat: Optional[int] = None):
+        timings = []
+        result = None
+        for _ in range(repeat or self.repeat):
+            if db_manager is not None:
+                db_manager.invalidate_cache()
+            start = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - start) * 1000)
+        rows = len(result) if isinstance(result, (pd.DataFrame, list, tuple)) else None
+        self.results[name] = {"median_ms": float(np.median(timings)), "min_ms": float(min(timings)), "runs": len(timings), "rows": rows}
+
+    def run(self, progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        progress = progress or (lambda name: None)
+        os.makedirs(self.workdir, exist_ok=True)
+        generator = SyntheticDataGenerator(self.seed)
+
+        progress("CSVs sintéticos")
+        nota_path = generator.write_nota_negocio(os.path.join(self.workdir, "nota_negocio.csv"), self.csv_rows)
+        detalhamento_path = generator.write_detalhamento(os.path.join(self.workdir, "detalhamento.csv"), self.csv_rows)
+        # Processador novo a cada execução: inclui a compilação das regras e o cache de classificação frio
+        self.measure("extract_from_notas_negocio", lambda: DataProcessor().extract_from_notas_negocio(nota_path)[1])
+        self.measure("extract_from_detalhamento", lambda: DataProcessor().extract_from_detalhamento(detalhamento_path)[0])
+
+        db_path = os.path.join(self.workdir, "benchmark.db")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        db_manager = DatabaseManager(db_path)
+        progress(f"Base sintética ({self.units} × {self.months} × {self.details})")
+        start = time.perf_counter()
+        detail_count = generator.populate_database(db_manager, self.units, self.months, self.details, self.year)
+        self.results["populate_database"] = {"median_ms": (time.perf_counter() - start) * 1000, "min_ms": None, "runs": 1, "rows": detail_count}
+
+        imported, _ = DataProcessor().extract_from_detalhamento(detalhamento_path)
+        self.measure("save_imported_data", lambda: db_manager.save_imported_data("Unidade Benchmark", 12, "Benchmark", imported or [], year=self.year), db_manager)
+
+        progress("Consultas")
+        unit_names = [f"Unidade {unit:04d}" for unit in range(self.units)]
+        first_unit, year = unit_names[0], self.year
+        line = db_manager.get_consolidated_results(None, 12, 12, year).iloc[0]
+        queries: List[Tuple[str, Callable[[], Any]]] = [
+            ("get_detailed_results.unit_month", lambda: db_manager.get_detailed_results(first_unit, 12, 12, year)),
+            ("get_detailed_results.unit_year", lambda: db_manager.get_detailed_results(first_unit, 1, 12, year)),
+            ("get_detailed_results.network_year", lambda: db_manager.get_detailed_results(None, 1, 12, year)),
+            ("get_consolidated_results.network_year", lambda: db_manager.get_consolidated_results(None, 1, 12, year)),
+            ("get_comparison_data", lambda: db_manager.get_comparison_data(unit_names, 1, 12, year)),
+            ("get_annual_dashboard_data", lambda: db_manager.get_annual_dashboard_data(first_unit, 1, 12, year)),
+            ("get_variance_report.network", lambda: db_manager.get_variance_report(None, 12, year)),
+            ("get_budget_vs_actual.network_year", lambda: db_manager.get_budget_vs_actual(None, 1, 12, year)),
+            ("get_leaderboard.year", lambda: db_manager.get_leaderboard(1, 12, year)),
+            ("get_line_details.network_year", lambda: db_manager.get_line_details(None, line["group_name"], line["subgroup_name"], None, 1, 12, year)),
+            ("search_details", lambda: db_manager.search_details("pagamento")),
+            ("trends.8_units", lambda: TrendEngine(db_manager).trends(unit_names[:8], 1, 12, year)),
+            ("forecast.network", lambda: ForecastEngine(db_manager).forecast(year).units),
+        ]
+        for name, query in queries:
+            progress(name)
+            self.measure(name, query, db_manager)
+
+        return {
+            "format": self.REPORT_FORMAT,
+            "app_version": Config.APP_VERSION,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "environment": {"python": sys.version.split()[0], "sqlite": sqlite3.sqlite_version, "pandas": pd.__version__, "numpy": np.__version__},
+            "params": {"units": self.units, "months": self.months, "details": self.details, "csv_rows": self.csv_rows,
+                       "repeat": self.repeat, "seed": self.seed, "year": self.year},
+            "results": self.results,
+        }
+
+    @staticmethod
+    def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Tuple[str, Optional[float], Optional[float], Optional[float]]]:
+        """(medida, ms da base, ms atual, atual / base) para cada medida de qualquer um dos relatórios."""
+        base_results, current_results = baseline.get("results", {}), current.get("results", {})
+        rows = []
+        for name in list(base_results) + [name for name in current_results if name not in base_results]:
+            base_ms = base_results.get(name, {}).get("median_ms")
+            current_ms = current_results.get(name, {}).get("median_ms")
+            ratio = current_ms / base_ms if base_ms and current_ms is not None else None
+            rows.append((name, base_ms, current_ms, ratio))
+        return rows
+
 # ==============================================================================
 # --- 6. APLICATIVO PRINCIPAL E GERENCIADOR DE TELAS (Sem alterações) ---
 # ==============================================================================
+def run_in_background(widget, task: Callable[[], Any], on_done: Callable[[Any], None], on_error: Callable[[Exception], None], poll_ms: int = 100):
+    """Executa `task` em uma thread e entrega o resultado (ou o erro) na thread do Tk via `widget.after`."""
+    outcome: Dict[str, Any] = {}
+    finished = threading.Event()
+
+    def worker():
+        try:
+            outcome["result"] = task()
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            finished.set()
+
+    def poll():
+        # A tela pode ter sido trocada enquanto a thread rodava; sem o widget não há onde entregar o resultado
+        if not widget.winfo_exists():
+            return
+        if not finished.is_set():
+            widget.after(poll_ms, poll)
+        elif "error" in outcome:
+            on_error(outcome["error"])
+        else:
+            on_done(outcome["result"])
+
+    threading.Thread(target=worker, daemon=True).start()
+    widget.after(poll_ms, poll)
+
+class StartupWarmup:
+    """Executa em segundo plano o trabalho de inicialização enquanto a SplashScreen é exibida."""
+    def __init__(self, db_manager: DatabaseManager, file_manager: FileManager):
+        self.db_manager = db_manager
+        self.file_manager = file_manager
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, name="startup-warmup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.db_manager.ensure_ready()
+            Config.load_mappings(self.db_manager)
+            self.db_manager.get_global_kpis_for_current_month()
+            self.file_manager.get_existing_units()
+            self.db_manager.warm_cache()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
 class App(ctk.CTk):
-    def __init__(self, db_manager: DatabaseManager, file_manager: FileManager, data_processor: DataProcessor, pdf_exporter: PDFExporter, excel_exporter: ExcelExporter):
+    def __init__(self, db_manager: DatabaseManager, file_manager: FileManager, data_processor: DataProcessor, pdf_exporter: PDFExporter, excel_exporter: ExcelExporter, chart_renderer: ChartRenderer):
         super().__init__()
         self.db_manager = db_manager
         self.file_manager = file_manager
         self.data_processor = data_processor
         self.pdf_exporter = pdf_exporter
         self.excel_exporter = excel_exporter
+        self.chart_renderer = chart_renderer
 
         self.title(Config.APP_NAME)
         self.geometry("1200x800")
@@ -876,14 +3754,15 @@ class App(ctk.CTk):
         base_kwargs = {
             "db_manager": self.db_manager, "file_manager": self.file_manager,
             "data_processor": self.data_processor, "pdf_exporter": self.pdf_exporter,
-            "excel_exporter": self.excel_exporter
+            "excel_exporter": self.excel_exporter, "chart_renderer": self.chart_renderer
         }
         base_kwargs.update(kwargs)
         
-        self.current_frame = frame_class(parent=self.content_container, controller=self, breadcrumb_path=breadcrumb_path, **base_kwargs)
-        self.current_frame.pack(fill="both", expand=True)
-        self.update_breadcrumbs(breadcrumb_path)
-        self.update_theme()
+        with PERF_MONITOR.span(f"screen.{frame_class.__name__}"):
+            self.current_frame = frame_class(parent=self.content_container, controller=self, breadcrumb_path=breadcrumb_path, **base_kwargs)
+            self.current_frame.pack(fill="both", expand=True)
+            self.update_breadcrumbs(breadcrumb_path)
+            self.update_theme()
 
     def update_breadcrumbs(self, path: List[Tuple[str, type]]):
         for widget in self.breadcrumb_frame.winfo_children():
@@ -954,6 +3833,7 @@ class BaseFrame(ctk.CTkFrame):
     data_processor: Optional[DataProcessor]
     pdf_exporter: Optional[PDFExporter]
     excel_exporter: Optional[ExcelExporter]
+    chart_renderer: Optional[ChartRenderer]
 
     def __init__(self, parent, controller, **kwargs):
         super().__init__(parent, fg_color="transparent")
@@ -965,6 +3845,7 @@ class BaseFrame(ctk.CTkFrame):
         self.data_processor = kwargs.get("data_processor")
         self.pdf_exporter = kwargs.get("pdf_exporter")
         self.excel_exporter = kwargs.get("excel_exporter")
+        self.chart_renderer = kwargs.get("chart_renderer")
         if self.db_manager is None:
             raise RuntimeError("BaseFrame requires a db_manager instance (was None)")
         if self.file_manager is None:
@@ -993,7 +3874,14 @@ class BaseFrame(ctk.CTkFrame):
         """Return file_manager with correct type for callers."""
         return cast(FileManager, self.file_manager)
 
+    def charts(self) -> ChartRenderer:
+        """Return chart_renderer with correct type for callers."""
+        return cast(ChartRenderer, self.chart_renderer)
+
 class SplashScreen(BaseFrame):
+    MIN_DISPLAY_MS = 1200
+    POLL_INTERVAL_MS = 50
+
     def __init__(self, parent, controller, **kwargs):
         super().__init__(parent, controller, **kwargs)
         self.configure(fg_color=self.theme_colors["bg"])
@@ -1004,7 +3892,23 @@ class SplashScreen(BaseFrame):
         self.progressbar = ctk.CTkProgressBar(splash_frame, progress_color=self.theme_colors["primary"], mode="indeterminate")
         self.progressbar.pack(pady=20, padx=50, fill="x")
         self.progressbar.start()
-        self.after(2000, lambda: controller.show_frame(MainMenu, breadcrumb_path=[("Dashboard Central", MainMenu)]))
+
+        self.min_display_elapsed = False
+        self.warmup = StartupWarmup(self.db(), self.fm())
+        self.warmup.start()
+        self.after(self.MIN_DISPLAY_MS, self._on_min_display_elapsed)
+        self.after(self.POLL_INTERVAL_MS, self._poll_warmup)
+
+    def _on_min_display_elapsed(self):
+        self.min_display_elapsed = True
+
+    def _poll_warmup(self):
+        if not (self.warmup.done.is_set() and self.min_display_elapsed):
+            self.after(self.POLL_INTERVAL_MS, self._poll_warmup)
+            return
+        if self.warmup.error:
+            messagebox.showerror("Erro na Inicialização", f"Não foi possível preparar os dados iniciais.\n{self.warmup.error}")
+        self.controller.show_frame(MainMenu, breadcrumb_path=[("Dashboard Central", MainMenu)])
 
 class MainMenu(BaseFrame):
     def __init__(self, parent, controller, **kwargs):
@@ -1018,12 +3922,19 @@ class MainMenu(BaseFrame):
         actions_frame.pack_propagate(False)
 
         ctk.CTkLabel(actions_frame, text="Ações Principais", font=ctk.CTkFont(size=18, weight="bold")).pack(pady=20)
+        # "Sair" fica fixo no rodapé; as demais ações rolam quando a janela é baixa demais para todas
+        ctk.CTkButton(actions_frame, text="Sair", command=self.controller.destroy, height=50, fg_color=Config.COLOR_RED).pack(side="bottom", fill="x", padx=20, pady=(10,20))
+        buttons_frame = ctk.CTkScrollableFrame(actions_frame, fg_color="transparent")
+        buttons_frame.pack(fill="both", expand=True, padx=10)
         
-        ctk.CTkButton(actions_frame, text="Acessar Unidades", command=self.go_to_units, height=50, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(fill="x", padx=20, pady=10)
-        ctk.CTkButton(actions_frame, text="Cadastrar Nova Unidade", command=self.cadastrar_unidade, height=50, fg_color=self.theme_colors["button_secondary_fg"], text_color=self.theme_colors["button_secondary_text"]).pack(fill="x", padx=20, pady=10)
-        ctk.CTkButton(actions_frame, text="Gerenciamento", command=self.go_to_management, height=50).pack(fill="x", padx=20, pady=10)
-        ctk.CTkButton(actions_frame, text="Editar Mapeamentos", command=self.go_to_mappings, height=50, fg_color=Config.COLOR_BLUE, text_color=Config.COLOR_BUTTON_TEXT_LIGHT).pack(fill="x", padx=20, pady=10)
-        ctk.CTkButton(actions_frame, text="Sair", command=self.controller.destroy, height=50, fg_color=Config.COLOR_RED).pack(fill="x", padx=20, pady=(40,10))
+        ctk.CTkButton(buttons_frame, text="Acessar Unidades", command=self.go_to_units, height=50, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(fill="x", padx=10, pady=10)
+        ctk.CTkButton(buttons_frame, text="Busca Global", command=self.go_to_search, height=50, fg_color=self.theme_colors["button_secondary_fg"], text_color=self.theme_colors["button_secondary_text"]).pack(fill="x", padx=10, pady=10)
+        ctk.CTkButton(buttons_frame, text="Ranking da Rede", command=self.go_to_leaderboard, height=50, fg_color=self.theme_colors["button_secondary_fg"], text_color=self.theme_colors["button_secondary_text"]).pack(fill="x", padx=10, pady=10)
+        ctk.CTkButton(buttons_frame, text="DRE Consolidado da Rede", command=self.consolidated_dre, height=50, fg_color=self.theme_colors["button_secondary_fg"], text_color=self.theme_colors["button_secondary_text"]).pack(fill="x", padx=10, pady=10)
+        ctk.CTkButton(buttons_frame, text="Variação Mensal da Rede", command=self.go_to_network_variance, height=50, fg_color=self.theme_colors["button_secondary_fg"], text_color=self.theme_colors["button_secondary_text"]).pack(fill="x", padx=10, pady=10)
+        ctk.CTkButton(buttons_frame, text="Cadastrar Nova Unidade", command=self.cadastrar_unidade, height=50, fg_color=self.theme_colors["button_secondary_fg"], text_color=self.theme_colors["button_secondary_text"]).pack(fill="x", padx=10, pady=10)
+        ctk.CTkButton(buttons_frame, text="Gerenciamento", command=self.go_to_management, height=50).pack(fill="x", padx=10, pady=10)
+        ctk.CTkButton(buttons_frame, text="Editar Mapeamentos", command=self.go_to_mappings, height=50, fg_color=Config.COLOR_BLUE, text_color=Config.COLOR_BUTTON_TEXT_LIGHT).pack(fill="x", padx=10, pady=10)
 
         kpi_frame = ctk.CTkFrame(self, fg_color="transparent")
         kpi_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 0))
@@ -1059,6 +3970,23 @@ class MainMenu(BaseFrame):
     def go_to_units(self):
         path = self.breadcrumb_path + [("Seleção de Unidades", UnitSelectionScreen)]
         self.controller.show_frame(UnitSelectionScreen, breadcrumb_path=path)
+
+    def go_to_search(self):
+        path = self.breadcrumb_path + [("Busca Global", GlobalSearchScreen)]
+        self.controller.show_frame(GlobalSearchScreen, breadcrumb_path=path)
+
+    def go_to_leaderboard(self):
+        path = self.breadcrumb_path + [("Ranking da Rede", LeaderboardScreen)]
+        self.controller.show_frame(LeaderboardScreen, breadcrumb_path=path)
+
+    def go_to_network_variance(self):
+        path = self.breadcrumb_path + [("Variação Mensal da Rede", VarianceReportScreen)]
+        self.controller.show_frame(VarianceReportScreen, breadcrumb_path=path)
+
+    def consolidated_dre(self):
+        period = ask_period_range("DRE Consolidado da Rede", "Período do consolidado")
+        if period is not None:
+            show_consolidated_dre(self, None, *period)
     
     def cadastrar_unidade(self):
         dialog = ctk.CTkInputDialog(text="Digite o nome da nova unidade:", title="Cadastrar Unidade")
@@ -1072,10 +4000,10 @@ class MainMenu(BaseFrame):
         self.controller.show_frame(ManagementScreen, breadcrumb_path=path)
 
     def go_to_mappings(self):
-        path = self.breadcrumb_path + [("Editar Mapeamentos", ManagementScreen)]
-        self.controller.show_frame(ManagementScreen, breadcrumb_path=path)
-# --- ManagementScreen: tela para editar mapeamentos de grupo/subgrupo/nome ---
-class ManagementScreen(BaseFrame):
+        path = self.breadcrumb_path + [("Editar Mapeamentos", MappingEditorScreen)]
+        self.controller.show_frame(MappingEditorScreen, breadcrumb_path=path)
+# --- MappingEditorScreen: tela para editar mapeamentos de grupo/subgrupo/nome ---
+class MappingEditorScreen(BaseFrame):
     def __init__(self, parent, controller, **kwargs):
         super().__init__(parent, controller, **kwargs)
         self.grid_columnconfigure(0, weight=1)
@@ -1173,12 +4101,12 @@ class ManagementScreen(BaseFrame):
         if not key:
             messagebox.showwarning("Seleção", "Selecione um item para editar.")
             return
-        mapping = self.get_mapping()
+        info = dict(self.get_mapping().get(key, {}))
         for field, entry in self.edit_fields.items():
-            mapping.setdefault(key, {})[field] = entry.get()
-        Config.save_mappings()
+            info[field] = entry.get()
+        Config.save_mapping(self.db(), self.mapping_type.get(), key, info)
         self.refresh_list()
-        messagebox.showinfo("Salvo", "Mapeamento salvo com sucesso.")
+        self.reclassify_history({self.mapping_type.get(): [key]}, "Mapeamento salvo com sucesso.")
 
     def add_new(self):
         key = simpledialog.askstring("Novo Mapeamento", "Digite o código ou palavra-chave:")
@@ -1188,8 +4116,7 @@ class ManagementScreen(BaseFrame):
         if key in mapping:
             messagebox.showerror("Erro", "Já existe esse código/palavra-chave.")
             return
-        mapping[key] = {"group": "", "subgroup": ""}
-        Config.save_mappings()
+        Config.save_mapping(self.db(), self.mapping_type.get(), key, {"group": "", "subgroup": ""})
         self.refresh_list()
         self.selected_key.set(key)
         self.show_fields(mapping[key])
@@ -1201,32 +4128,252 @@ class ManagementScreen(BaseFrame):
             return
         mapping = self.get_mapping()
         if key in mapping:
-            del mapping[key]
-            Config.save_mappings()
+            Config.delete_mapping(self.db(), self.mapping_type.get(), key)
             self.refresh_list()
-            messagebox.showinfo("Excluído", "Mapeamento removido.")
+            self.reclassify_history({self.mapping_type.get(): [key]}, "Mapeamento removido.")
+
+    def reclassify_history(self, changed_keys: Dict[str, List[str]], message: str):
+        """Atualiza em segundo plano as linhas já importadas afetadas pelas chaves alteradas."""
+        db_manager = self.db()
+
+        def on_done(report: Dict[str, int]):
+            messagebox.showinfo("Salvo", f"{message}\n\nHistórico atualizado: {report['updated']} linha(s) reclassificada(s), "
+                                         f"{report['excluded']} excluída(s), {report['summaries']} importação(ões) recalculada(s).")
+
+        def on_error(e: Exception):
+            messagebox.showerror("Erro na Reclassificação", f"O mapeamento foi salvo, mas o histórico não pôde ser atualizado.\nErro: {e}")
+
+        data_processor = cast(DataProcessor, self.data_processor)
+        run_in_background(self, lambda: ReclassificationJob(db_manager, data_processor).run(changed_keys), on_done, on_error)
+
+class VirtualTable(ctk.CTkFrame):
+    """Tabela baseada em ttk.Treeview que insere as linhas sob demanda, em páginas, conforme a rolagem.
+
+    Apenas as linhas já alcançadas pela barra de rolagem existem como itens do Treeview, então
+    montar a tabela custa o mesmo para 50 ou 500.000 linhas.
+    """
+    PAGE_SIZE = 200
+
+    def __init__(self, parent, columns: List[Tuple[str, str, int, str]], theme_colors: dict, selectmode: str = "browse", horizontal_scroll: bool = False):
+        super().__init__(parent, fg_color="transparent")
+        self.theme_colors = theme_colors
+        self._rows: List[Tuple] = []
+        self._iids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._inserted = 0
+        self._loading = False
+
+        style = ttk.Style()
+        style.theme_use("default")
+        style.configure("Treeview", background=theme_colors["frame"], foreground=theme_colors["text"], fieldbackground=theme_colors["frame"], rowheight=25, borderwidth=0)
+        style.map('Treeview', background=[('selected', theme_colors["primary"])])
+        style.configure("Treeview.Heading", background=theme_colors["primary"], foreground=theme_colors["button_primary_text"], font=('Arial', 10, 'bold'))
+
+        self.tree = ttk.Treeview(self, columns=[c[0] for c in columns], show="headings", selectmode=selectmode)
+        for col_id, heading, width, anchor in columns:
+            self.tree.heading(col_id, text=heading)
+            self.tree.column(col_id, width=width, anchor=anchor)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        if horizontal_scroll:
+            x_scrollbar = ctk.CTkScrollbar(self, orientation="horizontal", command=self.tree.xview)
+            self.tree.configure(xscrollcommand=x_scrollbar.set)
+            x_scrollbar.pack(side="bottom", fill="x")
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+    def set_rows(self, rows: List[Tuple], iids: Optional[List[str]] = None):
+        self.tree.delete(*self.tree.get_children())
+        self._rows = list(rows)
+        self._iids = list(iids) if iids is not None else [str(i) for i in range(len(self._rows))]
+        self._positions = {iid: i for i, iid in enumerate(self._iids)}
+        self._inserted = 0
+        self._insert_next_page()
+
+    def update_row(self, iid: str, values: Tuple):
+        index = self._positions[iid]
+        self._rows[index] = values
+        if index < self._inserted:
+            self.tree.item(iid, values=values)
+
+    @property
+    def row_count(self) -> int:
+        return len(self._rows)
+
+    def _insert_next_page(self):
+        end = min(self._inserted + self.PAGE_SIZE, len(self._rows))
+        for i in range(self._inserted, end):
+            self.tree.insert("", "end", iid=self._iids[i], values=self._rows[i])
+        self._inserted = end
+        self._loading = False
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) > 0.9 and self._inserted < len(self._rows) and not self._loading:
+            self._loading = True
+            self.after_idle(self._insert_next_page)
+
+class UnitPicker(ctk.CTkFrame):
+    """Lista de unidades pesquisável e virtualizada, com filtro por região e seleção múltipla opcional."""
+    ALL_REGIONS = "Todas as Regiões"
+    SEARCH_DELAY_MS = 120
+    CHECK_ON, CHECK_OFF = "☑", "☐"
+
+    def __init__(self, parent, units: List[str], regions: Dict[str, str], theme_colors: dict, multiselect: bool = False,
+                 selected: Optional[List[str]] = None, on_activate: Optional[Callable[[str], None]] = None,
+                 on_change: Optional[Callable[[], None]] = None):
+        super().__init__(parent, fg_color="transparent")
+        self.theme_colors = theme_colors
+        self.multiselect = multiselect
+        self.selected = set(selected or [])
+        self.on_activate = on_activate
+        self.on_change = on_change
+        self.index = UnitIndex(units, regions)
+        self.visible: List[str] = []
+        self._search_job = None
+
+        toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        toolbar.pack(fill="x", pady=(0, 5))
+        self.search_entry = ctk.CTkEntry(toolbar, placeholder_text="Buscar unidade...")
+        self.search_entry.pack(side="left", fill="x", expand=True)
+        self.search_entry.bind("<KeyRelease>", self._schedule_search)
+        self.region_var = ctk.StringVar(value=self.ALL_REGIONS)
+        self.region_menu = ctk.CTkOptionMenu(toolbar, variable=self.region_var, values=[self.ALL_REGIONS] + self.index.region_names(), command=lambda _: self.refresh())
+        self.region_menu.pack(side="left", padx=(10, 0))
+
+        columns = [("unit", "Unidade", 320, "w"), ("region", "Região", 160, "w")]
+        if multiselect:
+            columns.insert(0, ("check", "", 40, "center"))
+        self.table = VirtualTable(self, columns, theme_colors)
+        self.table.pack(fill="both", expand=True)
+        self.table.tree.bind("<Double-1>", self._on_double_click)
+        if multiselect:
+            # No clique (e não na soltura): o segundo clique de um duplo vai só para <Double-1>
+            self.table.tree.bind("<Button-1>", self._on_click)
+            self.table.tree.bind("<space>", self._on_space)
+
+        self.refresh()
+
+    def _row(self, unit: str) -> Tuple:
+        region = self.index.regions.get(unit, "")
+        if self.multiselect:
+            return (self.CHECK_ON if unit in self.selected else self.CHECK_OFF, unit, region)
+        return (unit, region)
+
+    def _schedule_search(self, event=None):
+        if self._search_job:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(self.SEARCH_DELAY_MS, self.refresh)
+
+    def refresh(self):
+        self._search_job = None
+        region = self.region_var.get()
+        self.visible = self.index.search(self.search_entry.get(), None if region == self.ALL_REGIONS else region)
+        self.table.set_rows([self._row(unit) for unit in self.visible], iids=self.visible)
+
+    def set_units(self, units: List[str], regions: Dict[str, str]):
+        self.index = UnitIndex(units, regions)
+        self.selected &= set(units)
+        values = [self.ALL_REGIONS] + self.index.region_names()
+        self.region_menu.configure(values=values)
+        if self.region_var.get() not in values:
+            self.region_var.set(self.ALL_REGIONS)
+        self.refresh()
+
+    def current(self) -> Optional[str]:
+        selection = self.table.tree.selection()
+        return selection[0] if selection else None
+
+    def get_selected(self) -> List[str]:
+        return [unit for unit in self.index.units if unit in self.selected]
+
+    def toggle(self, unit: str):
+        if unit in self.selected:
+            self.selected.discard(unit)
+        else:
+            self.selected.add(unit)
+        self.table.update_row(unit, self._row(unit))
+        if self.on_change:
+            self.on_change()
+
+    def select_all(self):
+        """Marca todas as unidades visíveis (respeitando a busca e a região filtradas)."""
+        self.selected.update(self.visible)
+        self.refresh()
+        if self.on_change:
+            self.on_change()
+
+    def clear_selection(self):
+        self.selected.clear()
+        self.refresh()
+        if self.on_change:
+            self.on_change()
+
+    def _clicked_unit(self, event) -> Optional[str]:
+        """Unidade da linha sob o cursor; None para cabeçalho, área vazia ou separadores."""
+        tree = self.table.tree
+        if tree.identify_region(event.x, event.y) != "cell":
+            return None
+        return tree.identify_row(event.y) or None
+
+    def _on_click(self, event):
+        unit = self._clicked_unit(event)
+        if unit:
+            self.toggle(unit)
+
+    def _on_space(self, event=None):
+        unit = self.current()
+        if unit:
+            self.toggle(unit)
+
+    def _on_double_click(self, event):
+        unit = self._clicked_unit(event)
+        if unit and self.on_activate:
+            self.on_activate(unit)
 
 class UnitSelectionScreen(BaseFrame):
     def __init__(self, parent, controller, **kwargs):
         super().__init__(parent, controller, **kwargs)
+        self.picker: Optional[UnitPicker] = None
         self.populate_units()
 
     def populate_units(self):
+        units = self.fm().get_existing_units()
+        if self.picker and units:
+            self.picker.set_units(units, self.db().get_unit_regions())
+            return
+
         for widget in self.winfo_children():
             widget.destroy()
+        self.picker = None
 
-        units = self.fm().get_existing_units()
         if not units:
             ctk.CTkLabel(self, text="Nenhuma unidade cadastrada.\nCadastre uma no menu principal.", font=ctk.CTkFont(size=18), text_color=self.theme_colors["text"]).pack(expand=True)
-        else:
-            scroll_frame = ctk.CTkScrollableFrame(self, label_text="Unidades Cadastradas", label_text_color=self.theme_colors["text"])
-            scroll_frame.pack(fill="both", expand=True, padx=20, pady=10)
-            for unit_name in units:
-                card = ctk.CTkFrame(scroll_frame, fg_color=self.theme_colors["frame"], corner_radius=10)
-                card.pack(fill="x", padx=10, pady=8)
-                ctk.CTkButton(card, text=unit_name, font=ctk.CTkFont(size=16, weight="bold"), height=60, command=lambda u=unit_name: self.select_unit(u), fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(side="left", fill="x", expand=True, padx=(10,5), pady=10)
-                ctk.CTkButton(card, text="Renomear", width=80, command=lambda u=unit_name: self.rename_unit(u)).pack(side="left", padx=5, pady=10)
-                ctk.CTkButton(card, text="Excluir", width=80, fg_color=Config.COLOR_RED, command=lambda u=unit_name: self.delete_unit(u)).pack(side="left", padx=5, pady=10)
+            return
+
+        actions = ctk.CTkFrame(self, fg_color="transparent")
+        actions.pack(fill="x", padx=20, pady=(10, 0))
+        ctk.CTkButton(actions, text="Abrir Painel", command=lambda: self._with_selected(self.select_unit), fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(side="left", padx=(0, 5))
+        ctk.CTkButton(actions, text="Renomear", width=100, command=lambda: self._with_selected(self.rename_unit)).pack(side="left", padx=5)
+        ctk.CTkButton(actions, text="Definir Região", width=120, command=lambda: self._with_selected(self.set_region)).pack(side="left", padx=5)
+        ctk.CTkButton(actions, text="Excluir", width=100, fg_color=Config.COLOR_RED, command=lambda: self._with_selected(self.delete_unit)).pack(side="left", padx=5)
+
+        self.picker = UnitPicker(self, units, self.db().get_unit_regions(), self.theme_colors, on_activate=self.select_unit)
+        self.picker.pack(fill="both", expand=True, padx=20, pady=10)
+
+    def _with_selected(self, action: Callable[[str], None]):
+        unit_name = self.picker.current() if self.picker else None
+        if not unit_name:
+            messagebox.showwarning("Seleção", "Selecione uma unidade na lista.")
+            return
+        action(unit_name)
+
+    def set_region(self, unit_name: str):
+        dialog = ctk.CTkInputDialog(text=f"Região de '{unit_name}' (deixe vazio para remover):", title="Definir Região")
+        region = dialog.get_input()
+        if region is not None:
+            self.db().set_unit_region(unit_name, region)
+            self.populate_units()
 
     def select_unit(self, unit_name: str):
         path = self.breadcrumb_path + [(f"Painel: {unit_name}", UnitDashboard)]
@@ -1243,6 +4390,41 @@ class UnitSelectionScreen(BaseFrame):
         if self.fm().delete_unit(unit_name):
             self.populate_units()
 
+def ask_period_range(title: str, prompt: str, default_year: Optional[int] = None) -> Optional[Tuple[int, int, int, int]]:
+    """Pergunta um período (ver parse_period_spec) e retorna (mês inicial, mês final, ano inicial, ano final)."""
+    dialog = ctk.CTkInputDialog(text=f"{prompt} (ex: 08, 1-12, 08/2024 ou 11/2024-02/2025):", title=title)
+    spec = dialog.get_input()
+    if spec is None:
+        return None
+    try:
+        return parse_period_spec(spec, default_year)
+    except ValueError:
+        messagebox.showerror("Erro", "Entrada inválida.")
+        return None
+
+def ask_excel_detail_export(parent, db_manager: DatabaseManager, excel_exporter: ExcelExporter, unit_name: Optional[str]):
+    """Pergunta o período e dispara a exportação detalhada (unidade ou rede inteira)."""
+    period = ask_period_range("Exportar Detalhes", "Período da exportação")
+    if period is None:
+        return
+    start_month, end_month, start_year, end_year = period
+    excel_exporter.export_details(parent, db_manager, unit_name, start_month, end_month, format_period_range(*period), start_year, end_year)
+
+def show_consolidated_dre(frame: "BaseFrame", unit_names: Optional[List[str]], start_month: int, end_month: int, start_year: int, end_year: int,
+                          period_title: Optional[str] = None):
+    """Abre o DRE consolidado de várias unidades (None = rede inteira) no InteractiveDREScreen."""
+    period_title = period_title or format_period_range(start_month, end_month, start_year, end_year)
+    consolidated_df = frame.db().get_consolidated_results(unit_names, start_month, end_month, start_year, end_year)
+    if consolidated_df.empty:
+        messagebox.showinfo("Sem Dados", f"Não há dados importados para {period_title}.")
+        return
+    dre_df, units, contribution_rows = consolidated_dre_frames(consolidated_df)
+    scope = "Rede" if unit_names is None else f"{len(units)} Unidades"
+    path = frame.breadcrumb_path + [(f"DRE Consolidado: {period_title}", InteractiveDREScreen)]
+    frame.controller.show_frame(InteractiveDREScreen, breadcrumb_path=path, unit_name=scope, period_title=period_title, data_df=dre_df,
+                                start_month=start_month, end_month=end_month, start_year=start_year, end_year=end_year, consolidated_units=unit_names,
+                                contribution=(units, contribution_rows))
+
 class UnitDashboard(BaseFrame):
     def __init__(self, parent, controller, unit_name: str, **kwargs):
         self.unit_name = unit_name
@@ -1255,25 +4437,40 @@ class UnitDashboard(BaseFrame):
         ctk.CTkLabel(data_card, text="Gestão de Dados", font=ctk.CTkFont(size=18, weight="bold"), text_color=self.theme_colors["text"]).pack(pady=(20, 15), padx=20)
         ctk.CTkButton(data_card, text="Importar Dados do Mês", command=self.open_import_window, height=45, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(fill="x", pady=8, padx=20)
         ctk.CTkButton(data_card, text="Navegar nos Detalhes", command=self.browse_details, height=45).pack(fill="x", pady=8, padx=20)
+        ctk.CTkButton(data_card, text="Exportar Detalhes (Excel)", command=self.export_details_excel, height=45).pack(fill="x", pady=8, padx=20)
         
         report_card = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"], corner_radius=10)
         report_card.grid(row=0, column=1, padx=(10, 0), pady=10, sticky="nsew")
         ctk.CTkLabel(report_card, text="Relatórios e Análises", font=ctk.CTkFont(size=18, weight="bold"), text_color=self.theme_colors["text"]).pack(pady=(20, 15), padx=20)
+        year_bar = ctk.CTkFrame(report_card, fg_color="transparent")
+        year_bar.pack(fill="x", pady=(0, 8), padx=20)
+        ctk.CTkLabel(year_bar, text="Ano:", text_color=self.theme_colors["text"]).pack(side="left")
+        self.year_var = ctk.StringVar(value=str(current_year()))
+        ctk.CTkOptionMenu(year_bar, variable=self.year_var, values=[str(year) for year in self.db().get_available_years()], width=100).pack(side="left", padx=10)
         ctk.CTkButton(report_card, text="DRE Mensal", command=self.emitir_dre_mensal, height=45).pack(fill="x", pady=8, padx=20)
         ctk.CTkButton(report_card, text="DRE Trimestral", command=self.emitir_dre_trimestral, height=45).pack(fill="x", pady=8, padx=20)
         ctk.CTkButton(report_card, text="DRE Anual", command=self.emitir_dre_anual, height=45).pack(fill="x", pady=8, padx=20)
+        ctk.CTkButton(report_card, text="DRE por Período", command=self.emitir_dre_periodo, height=45).pack(fill="x", pady=8, padx=20)
         ctk.CTkButton(report_card, text="Dashboard Anual", command=self.show_dashboard, height=45).pack(fill="x", pady=8, padx=20)
         ctk.CTkButton(report_card, text="Metas e Projeções", command=self.manage_goals, height=45).pack(fill="x", pady=8, padx=20)
+        ctk.CTkButton(report_card, text="Variação Mensal", command=self.show_variance, height=45).pack(fill="x", pady=8, padx=20)
+        ctk.CTkButton(report_card, text="Previsto x Realizado", command=self.show_budget, height=45).pack(fill="x", pady=8, padx=20)
         ctk.CTkButton(report_card, text="Análise Comparativa", command=self.compare_units, height=45, fg_color=self.theme_colors["button_secondary_fg"], text_color=self.theme_colors["button_secondary_text"]).pack(fill="x", pady=8, padx=20)
 
     def open_import_window(self):
         ImportDataWindow(parent=self, unit_name=self.unit_name, data_processor=self.data_processor, db_manager=self.db())
 
-    def emitir_dre(self, start_month, end_month, period_text):
-        results_df = self.db().get_detailed_results(self.unit_name, start_month, end_month)
+    def selected_year(self) -> int:
+        return int(self.year_var.get())
+
+    def emitir_dre(self, start_month, end_month, period_text, start_year: Optional[int] = None, end_year: Optional[int] = None):
+        start_year = self.selected_year() if start_year is None else start_year
+        end_year = start_year if end_year is None else end_year
+        results_df = self.db().get_detailed_results(self.unit_name, start_month, end_month, start_year, end_year)
         if not results_df.empty:
             path = self.breadcrumb_path + [(f"DRE: {period_text}", InteractiveDREScreen)]
-            self.controller.show_frame(InteractiveDREScreen, breadcrumb_path=path, unit_name=self.unit_name, period_title=period_text, data_df=results_df)
+            self.controller.show_frame(InteractiveDREScreen, breadcrumb_path=path, unit_name=self.unit_name, period_title=period_text, data_df=results_df,
+                                       start_month=start_month, end_month=end_month, start_year=start_year, end_year=end_year)
         else:
             messagebox.showinfo("Sem Dados", f"Não há dados importados para {period_text}.")
 
@@ -1282,7 +4479,7 @@ class UnitDashboard(BaseFrame):
         month_str = dialog.get_input()
         if month_str and month_str.isdigit() and 1 <= int(month_str) <= 12:
             month = int(month_str)
-            self.emitir_dre(month, month, f"{month:02d}/{Config.CURRENT_YEAR}")
+            self.emitir_dre(month, month, f"{month:02d}/{self.selected_year()}")
         elif month_str is not None: messagebox.showerror("Erro", "Entrada inválida.")
 
     def emitir_dre_trimestral(self):
@@ -1290,20 +4487,30 @@ class UnitDashboard(BaseFrame):
         q_str = dialog.get_input()
         if q_str and q_str.isdigit() and 1 <= int(q_str) <= 4:
             q = int(q_str); start_month = (q - 1) * 3 + 1; end_month = q * 3
-            self.emitir_dre(start_month, end_month, f"{q}º Trimestre {Config.CURRENT_YEAR}")
+            self.emitir_dre(start_month, end_month, f"{q}º Trimestre {self.selected_year()}")
         elif q_str is not None: messagebox.showerror("Erro", "Entrada inválida.")
 
     def emitir_dre_anual(self):
-        self.emitir_dre(1, 12, f"Ano de {Config.CURRENT_YEAR}")
+        self.emitir_dre(1, 12, f"Ano de {self.selected_year()}")
+
+    def emitir_dre_periodo(self):
+        period = ask_period_range("DRE por Período", "Período da análise", default_year=self.selected_year())
+        if period is not None:
+            start_month, end_month, start_year, end_year = period
+            self.emitir_dre(start_month, end_month, format_period_range(*period), start_year, end_year)
 
     def show_dashboard(self):
-        data = self.db().get_annual_dashboard_data(self.unit_name)
+        year = self.selected_year()
+        data = self.db().get_annual_dashboard_data(self.unit_name, 1, 12, year)
         if not data.empty:
-            path = self.breadcrumb_path + [("Dashboard Anual", DashboardScreen)]
-            self.controller.show_frame(DashboardScreen, breadcrumb_path=path, unit_name=self.unit_name, data=data)
+            path = self.breadcrumb_path + [(f"Dashboard Anual {year}", DashboardScreen)]
+            self.controller.show_frame(DashboardScreen, breadcrumb_path=path, unit_name=self.unit_name, data=data, year=year)
         else:
             messagebox.showinfo("Sem Dados", "Não há dados para gerar o dashboard.")
 
+    def export_details_excel(self):
+        ask_excel_detail_export(self, self.db(), cast(ExcelExporter, self.excel_exporter), self.unit_name)
+
     def browse_details(self):
         path = self.breadcrumb_path + [("Detalhes de Arquivos", DetailsBrowserScreen)]
         self.controller.show_frame(DetailsBrowserScreen, breadcrumb_path=path, unit_name=self.unit_name)
@@ -1316,6 +4523,14 @@ class UnitDashboard(BaseFrame):
         path = self.breadcrumb_path + [("Configurar Comparação", UnitComparisonSetupScreen)]
         self.controller.show_frame(UnitComparisonSetupScreen, breadcrumb_path=path, current_unit=self.unit_name)
 
+    def show_variance(self):
+        path = self.breadcrumb_path + [("Variação Mensal", VarianceReportScreen)]
+        self.controller.show_frame(VarianceReportScreen, breadcrumb_path=path, unit_name=self.unit_name)
+
+    def show_budget(self):
+        path = self.breadcrumb_path + [("Previsto x Realizado", BudgetScreen)]
+        self.controller.show_frame(BudgetScreen, breadcrumb_path=path, unit_name=self.unit_name)
+
 class ImportDataWindow(ctk.CTkToplevel):
     def __init__(self, parent, unit_name, data_processor, db_manager):
         super().__init__(parent)
@@ -1331,9 +4546,19 @@ class ImportDataWindow(ctk.CTkToplevel):
         self.transient(parent)
         self.grab_set()
 
-        ctk.CTkLabel(self, text="Mês da Importação (ex: 08):").pack(pady=(10,0))
-        self.month_entry = ctk.CTkEntry(self)
-        self.month_entry.pack(pady=5)
+        # Sugere o mês anterior (e o ano dele): em janeiro, o fechamento importado é o de dezembro
+        today = datetime.date.today()
+        suggested_year, suggested_month0 = divmod(period_index(today.year, today.month) - 1, 12)
+        period_bar = ctk.CTkFrame(self, fg_color="transparent")
+        period_bar.pack(pady=(10, 5))
+        ctk.CTkLabel(period_bar, text="Mês da Importação (ex: 08):").pack(side="left")
+        self.month_entry = ctk.CTkEntry(period_bar, width=60)
+        self.month_entry.insert(0, f"{suggested_month0 + 1:02d}")
+        self.month_entry.pack(side="left", padx=(5, 15))
+        ctk.CTkLabel(period_bar, text="Ano:").pack(side="left")
+        self.year_entry = ctk.CTkEntry(period_bar, width=70)
+        self.year_entry.insert(0, str(suggested_year))
+        self.year_entry.pack(side="left", padx=5)
 
         ctk.CTkButton(self, text="Selecionar Notas de Negócio (.csv)", command=self.select_notas).pack(fill="x", padx=20, pady=10)
         self.notas_label = ctk.CTkLabel(self, text="Nenhum arquivo selecionado.")
@@ -1364,6 +4589,10 @@ class ImportDataWindow(ctk.CTkToplevel):
         if not (month_str and month_str.isdigit() and 1 <= int(month_str) <= 12):
             messagebox.showerror("Erro", "Mês inválido. Por favor, digite um número de 1 a 12.", parent=self)
             return
+        year_str = self.year_entry.get().strip()
+        if not (year_str.isdigit() and len(year_str) == 4):
+            messagebox.showerror("Erro", "Ano inválido. Por favor, digite o ano com quatro dígitos (ex: 2025).", parent=self)
+            return
         
         if not self.notas_files and not self.detalhamento_files:
             messagebox.showwarning("Aviso", "Nenhum arquivo foi selecionado para importação.", parent=self)
@@ -1409,19 +4638,159 @@ class ImportDataWindow(ctk.CTkToplevel):
             messagebox.showwarning("Aviso", "Nenhum dado válido foi extraído dos arquivos selecionados.", parent=self)
             return
 
-        source_file_name = f"Consolidado_{int(month_str):02d}-{Config.CURRENT_YEAR}"
-        self.db_manager.save_imported_data(self.unit_name, int(month_str), source_file_name, all_details)
+        source_file_name = f"Consolidado_{int(month_str):02d}-{year_str}"
+        summary_id = self.db_manager.save_imported_data(self.unit_name, int(month_str), source_file_name, all_details, year=int(year_str))
+        if self.detalhamento_files:
+            stats = self.data_processor.classification_cache.stats()
+            self.db_manager.log_action("CLASSIFICATION_CACHE", f"Acertos: {stats['hits']}, falhas: {stats['misses']} ({stats['hit_rate']:.1%}), {stats['entries']} entrada(s).")
+        anomaly_note = ""
+        if summary_id is not None:
+            try:
+                anomaly_count = AnomalyDetector(self.db_manager).check(summary_id)
+            except Exception as e:
+                # A verificação é auxiliar: uma falha nela não invalida a importação já gravada
+                self.db_manager.log_action("ANOMALY_CHECK_ERROR", f"'{source_file_name}' ({self.unit_name}): {e}")
+                anomaly_count = 0
+            if anomaly_count:
+                self.db_manager.log_action("ANOMALY_CHECK", f"{anomaly_count} valor(es) atípico(s) em '{source_file_name}' ({self.unit_name}).")
+                anomaly_note = f"\n\nAtenção: {anomaly_count} valor(es) atípico(s) sinalizado(s) no DRE do mês."
         
-        messagebox.showinfo("Concluído", f"Processo de importação finalizado.\nArquivos processados:\n" + "\n".join(processed_files))
+        messagebox.showinfo("Concluído", f"Processo de importação finalizado.\nArquivos processados:\n" + "\n".join(processed_files) + anomaly_note)
+        self.destroy()
+
+class BatchExportWindow(ctk.CTkToplevel):
+    """Janela de exportação em lote: um PDF de DRE por unidade e período, gerado em segundo plano."""
+    POLL_INTERVAL_MS = 100
+
+    def __init__(self, parent, db_manager: DatabaseManager, file_manager: FileManager):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.file_manager = file_manager
+        self.output_dir = ""
+        self.progress_queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+
+        self.title("Exportação de PDFs em Lote")
+        self.geometry("520x380")
+        self.transient(parent)
+        self.grab_set()
+
+        ctk.CTkLabel(self, text="Meses (ex: 08 ou 1-3,5):").pack(pady=(15, 0))
+        self.months_entry = ctk.CTkEntry(self)
+        self.months_entry.insert(0, f"{datetime.datetime.now().month:02d}")
+        self.months_entry.pack(pady=5)
+        year_bar = ctk.CTkFrame(self, fg_color="transparent")
+        year_bar.pack(pady=5)
+        ctk.CTkLabel(year_bar, text="Ano:").pack(side="left")
+        self.year_var = ctk.StringVar(value=str(current_year()))
+        ctk.CTkOptionMenu(year_bar, variable=self.year_var, values=[str(year) for year in db_manager.get_available_years()], width=100).pack(side="left", padx=5)
+        self.annual_var = ctk.StringVar(value="off")
+        ctk.CTkCheckBox(self, text="Incluir DRE anual do ano selecionado", variable=self.annual_var, onvalue="on", offvalue="off").pack(pady=5)
+
+        ctk.CTkButton(self, text="Selecionar Pasta de Destino", command=self.select_output_dir).pack(fill="x", padx=20, pady=10)
+        self.dir_label = ctk.CTkLabel(self, text="Nenhuma pasta selecionada.", wraplength=460)
+        self.dir_label.pack()
+
+        self.progressbar = ctk.CTkProgressBar(self, progress_color=Config.COLOR_PRIMARY_GREEN)
+        self.progressbar.set(0)
+        self.progressbar.pack(fill="x", padx=20, pady=(20, 5))
+        self.status_label = ctk.CTkLabel(self, text="")
+        self.status_label.pack()
+
+        self.start_button = ctk.CTkButton(self, text="Gerar PDFs", command=self.start, height=40, fg_color=Config.COLOR_PRIMARY_GREEN, text_color=Config.COLOR_BUTTON_TEXT_LIGHT)
+        self.start_button.pack(fill="x", padx=20, pady=15)
+
+    def select_output_dir(self):
+        directory = filedialog.askdirectory(title="Pasta de destino dos PDFs", parent=self)
+        if directory:
+            self.output_dir = directory
+            self.dir_label.configure(text=directory)
+
+    def start(self):
+        try:
+            months = BatchPDFExporter.parse_month_spec(self.months_entry.get())
+        except ValueError:
+            messagebox.showerror("Erro", "Meses inválidos. Use números de 1 a 12, ex: 08 ou 1-3,5.", parent=self)
+            return
+        if not self.output_dir:
+            messagebox.showwarning("Aviso", "Selecione a pasta de destino.", parent=self)
+            return
+        units = self.file_manager.get_existing_units()
+        exporter = BatchPDFExporter(self.db_manager.db_path)
+        jobs = exporter.plan_jobs(units, months, self.output_dir, include_annual=self.annual_var.get() == "on", year=int(self.year_var.get()))
+        if not jobs:
+            messagebox.showinfo("Sem Unidades", "Nenhuma unidade cadastrada.", parent=self)
+            return
+
+        self.start_button.configure(state="disabled")
+        self.protocol("WM_DELETE_WINDOW", lambda: None)
+        self.status_label.configure(text=f"Preparando {len(jobs)} relatório(s)...")
+        threading.Thread(target=self._run, args=(exporter, jobs), daemon=True).start()
+        self.after(self.POLL_INTERVAL_MS, self._poll)
+
+    def _run(self, exporter: BatchPDFExporter, jobs: List[Dict[str, Any]]):
+        try:
+            report = exporter.run(jobs, progress=lambda done, total, name: self.progress_queue.put(("progress", (done, total, name))))
+            self.progress_queue.put(("done", report))
+        except Exception as e:
+            self.progress_queue.put(("error", e))
+
+    def _poll(self):
+        finished = None
+        while not self.progress_queue.empty():
+            kind, payload = self.progress_queue.get_nowait()
+            if kind == "progress":
+                done, total, name = payload
+                self.progressbar.set(done / total)
+                self.status_label.configure(text=f"{done}/{total} - {name}")
+            else:
+                finished = (kind, payload)
+        if finished is None:
+            self.after(self.POLL_INTERVAL_MS, self._poll)
+            return
+
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+        kind, payload = finished
+        if kind == "error":
+            self.db_manager.log_action("BATCH_PDF_ERROR", str(payload))
+            messagebox.showerror("Erro na Exportação", f"A exportação em lote falhou.\n{payload}", parent=self)
+            self.start_button.configure(state="normal")
+            return
+        report = payload
+        self.db_manager.log_action("BATCH_PDF_SUCCESS", f"{len(report['generated'])} PDF(s) gerados em '{self.output_dir}'.")
+        summary = f"{len(report['generated'])} PDF(s) gerado(s), {len(report['skipped'])} sem dados."
+        if report["errors"]:
+            messagebox.showerror("Exportação Concluída com Erros", summary + "\n\n" + "\n".join(report["errors"][:10]), parent=self)
+        else:
+            messagebox.showinfo("Exportação Concluída", summary, parent=self)
         self.destroy()
 
 class InteractiveDREScreen(BaseFrame):
-    def __init__(self, parent, controller, unit_name: str, period_title: str, data_df: pd.DataFrame, **kwargs):
+    """DRE de uma unidade ou, com `contribution`, o consolidado de várias unidades.
+
+    `consolidated_units` é a lista de unidades consolidadas (None = rede inteira) e `contribution`
+    é o par (unidades, linhas) de consolidated_dre_frames, exibido na aba "Contribuição por Unidade".
+    """
+    def __init__(self, parent, controller, unit_name: str, period_title: str, data_df: pd.DataFrame, start_month: int = 1, end_month: int = 12,
+                 start_year: Optional[int] = None, end_year: Optional[int] = None,
+                 consolidated_units: Optional[List[str]] = None, contribution: Optional[Tuple[List[str], List[Tuple[str, str, np.ndarray]]]] = None, **kwargs):
         self.unit_name = unit_name
         self.period_title = period_title
         self.data_df = data_df
+        self.start_month = start_month
+        self.end_month = end_month
+        self.start_year = start_year
+        self.end_year = end_year
+        self.consolidated_units = consolidated_units
+        self.contribution = contribution
         super().__init__(parent, controller, **kwargs)
 
+        toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        toolbar.pack(fill="x", padx=10, pady=(0, 10))
+        ctk.CTkButton(toolbar, text="Exportar PDF", command=self.export_pdf, width=140, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(side="right")
+        if self.contribution is not None:
+            ctk.CTkSegmentedButton(toolbar, values=["DRE", "Contribuição por Unidade"], command=self.switch_view,
+                                   variable=ctk.StringVar(value="DRE")).pack(side="left")
+
         summary_frame = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"], corner_radius=10)
         summary_frame.pack(fill="x", padx=10, pady=(0, 10))
         summary_frame.grid_columnconfigure((0, 1, 2), weight=1)
@@ -1448,29 +4817,91 @@ class InteractiveDREScreen(BaseFrame):
 
         scroll_frame = ctk.CTkScrollableFrame(self)
         scroll_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        self.dre_view = scroll_frame
+        self.contribution_view: Optional[VirtualTable] = None
+
+        anomalies = self.load_anomalies()
+        anomaly_count = sum(len(texts) for subgroups in anomalies.values() for texts in subgroups.values())
+        if anomaly_count:
+            ctk.CTkLabel(toolbar, text=f" ⚠ {anomaly_count} valor(es) atípico(s) no período ", font=ctk.CTkFont(size=13, weight="bold"),
+                         fg_color=Config.COLOR_SECONDARY_YELLOW, text_color=Config.COLOR_BUTTON_TEXT_DARK, corner_radius=8).pack(side="left", padx=10)
+
+        group_dfs = {str(name): df for name, df in self.data_df.groupby("group_name")}
+        # Grupos só com alertas (nenhuma linha no período) também ganham cartão, vazio
+        group_names = [name for name in Config.DRE_GROUP_ORDER if name in group_dfs or name in anomalies]
+        group_names += sorted((set(group_dfs) | set(anomalies)) - set(Config.DRE_GROUP_ORDER))
+        for group_name in group_names:
+            group_df = group_dfs.get(group_name, self.data_df.iloc[0:0])
+            card = CollapsibleCard(scroll_frame, group_name=group_name, data_df=group_df, theme_colors=self.theme_colors, anomalies=anomalies.get(group_name), on_drill=self.drill_down)
+            card.pack(fill="x", pady=5, padx=5)
+
+    def load_anomalies(self) -> Dict[str, Dict[str, List[str]]]:
+        """Alertas do AnomalyDetector no período, agrupados por grupo e subgrupo."""
+        units = self.consolidated_units if self.contribution is not None else self.unit_name
+        flags = self.db().get_anomaly_flags(units, self.start_month, self.end_month, self.start_year, self.end_year)
+        anomalies: Dict[str, Dict[str, List[str]]] = {}
+        for flag in flags.to_dict("records"):
+            text = AnomalyDetector.describe(flag)
+            if self.contribution is not None:
+                text = f"{flag['unit_name']} – {text}"
+            anomalies.setdefault(flag["group_name"], {}).setdefault(flag["subgroup_name"], []).append(text)
+        return anomalies
+
+    def drill_down(self, group_name: str, subgroup_name: str, indicator: Optional[str]):
+        """Abre os registros importados que compõem a linha clicada."""
+        units = self.consolidated_units if self.contribution is not None else self.unit_name
+        line = indicator or subgroup_name
+        path = self.breadcrumb_path + [(f"Origem: {line[:25]}", LineDetailsScreen)]
+        self.controller.show_frame(LineDetailsScreen, breadcrumb_path=path, units=units, group_name=group_name, subgroup_name=subgroup_name,
+                                   indicator=indicator, period=(self.start_month, self.end_month, self.start_year, self.end_year), period_title=self.period_title)
+
+    def switch_view(self, view: str):
+        if view == "DRE":
+            if self.contribution_view is not None:
+                self.contribution_view.pack_forget()
+            self.dre_view.pack(fill="both", expand=True, padx=10, pady=10)
+            return
+        self.dre_view.pack_forget()
+        if self.contribution_view is None:
+            self.contribution_view = self._build_contribution_table()
+        self.contribution_view.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def _build_contribution_table(self) -> VirtualTable:
+        units, rows = cast(Tuple[List[str], List[Tuple[str, str, np.ndarray]]], self.contribution)
+        columns = [("linha", "Linha do DRE", 320, "w"), ("rede", "Total", 130, "e")]
+        columns += [(f"u{i}", unit, 130, "e") for i, unit in enumerate(units)]
+        table = VirtualTable(self, columns, self.theme_colors, horizontal_scroll=True)
+        # Mostra as colunas com largura fixa para que a rolagem horizontal funcione com centenas de unidades
+        for col_id, _, width, _ in columns:
+            table.tree.column(col_id, width=width, minwidth=width, stretch=False)
+        table.set_rows([(label, *(f"R$ {value:,.2f}" for value in values)) for _, label, values in rows])
+        return table
+
+    def export_pdf(self):
+        units = self.consolidated_units if self.contribution is not None else self.unit_name
+        results_data = self.db().get_collector_results(units, self.start_month, self.end_month, self.start_year, self.end_year)
+        cast(PDFExporter, self.pdf_exporter).export(self.unit_name, self.period_title, results_data, detail_df=self.data_df)
+
+class CollapsibleCard(ctk.CTkFrame):
+    """Grupo do DRE expansível; `anomalies` mapeia subgrupo -> textos de alerta exibidos como destaques.
 
-        grouped_data = self.data_df.groupby("group_name")
-        group_dfs = {name: df for name, df in grouped_data}
+    Subgrupos com alerta mas sem linhas em `data_df` (ex: despesa recorrente que não veio no mês)
+    aparecem ao final, como "sem lançamentos no período", para que todo alerta contado seja exibido.
 
-        for group_name in Config.DRE_GROUP_ORDER:
-            if group_name in group_dfs:
-                group_df = group_dfs[group_name]
-                card = CollapsibleCard(scroll_frame, group_name=str(group_name), data_df=group_df, theme_colors=self.theme_colors)
-                card.pack(fill="x", pady=5, padx=5)
-        
-        for group_name, group_df in grouped_data:
-            if group_name not in Config.DRE_GROUP_ORDER:
-                card = CollapsibleCard(scroll_frame, group_name=str(group_name), data_df=group_df, theme_colors=self.theme_colors)
-                card.pack(fill="x", pady=5, padx=5)
+    Com `on_drill`, clicar em um subgrupo ou indicador chama on_drill(grupo, subgrupo, indicador ou None).
+    """
+    MAX_ANOMALY_BADGES = 5
 
-class CollapsibleCard(ctk.CTkFrame):
-    def __init__(self, parent, group_name: str, data_df: pd.DataFrame, theme_colors: dict):
+    def __init__(self, parent, group_name: str, data_df: pd.DataFrame, theme_colors: dict, anomalies: Optional[Dict[str, List[str]]] = None,
+                 on_drill: Optional[Callable[[str, str, Optional[str]], None]] = None):
         super().__init__(parent, fg_color=theme_colors["frame"], corner_radius=10)
+        anomalies = anomalies or {}
         self.theme_colors = theme_colors
         self.is_expanded = False
 
         total_group_value = data_df['total_value'].sum()
         
+        # Mesmas regras de sinal da importação: só grupos de receita nunca ficam em vermelho
         is_expense_group = any(keyword in group_name for keyword in ["Despesas", "Impostos", "Investimentos", "Dividendos", "Ajustes"])
         header_color = Config.COLOR_RED if is_expense_group and total_group_value < 0 else theme_colors["primary"]
         
@@ -1481,19 +4912,46 @@ class CollapsibleCard(ctk.CTkFrame):
         self.toggle_icon = ctk.CTkLabel(self.header_frame, text="▶", font=ctk.CTkFont(size=14))
         self.toggle_icon.pack(side="left", padx=(5, 10))
         
-        ctk.CTkLabel(self.header_frame, text=group_name, font=ctk.CTkFont(size=16, weight="bold"), text_color=theme_colors["text"]).pack(side="left", expand=True, anchor="w")
+        ctk.CTkLabel(self.header_frame, text=group_name, font=ctk.CTkFont(size=16, weight="bold"), text_color=theme_colors["text"]).pack(side="left", anchor="w")
+        anomaly_count = sum(len(texts) for texts in anomalies.values())
+        if anomaly_count:
+            ctk.CTkLabel(self.header_frame, text=f" ⚠ {anomaly_count} ", font=ctk.CTkFont(size=12, weight="bold"), fg_color=Config.COLOR_SECONDARY_YELLOW,
+                         text_color=Config.COLOR_BUTTON_TEXT_DARK, corner_radius=8).pack(side="left", padx=10)
         ctk.CTkLabel(self.header_frame, text=f"R$ {total_group_value:,.2f}", font=ctk.CTkFont(size=16, weight="bold"), text_color=header_color).pack(side="right", padx=10)
 
         self.content_frame = ctk.CTkFrame(self, fg_color="transparent")
         
         subgrouped_data = data_df.groupby("subgroup_name")
+        cursor = "hand2" if on_drill else ""
         for subgroup_name, subgroup_df in subgrouped_data:
-            ctk.CTkLabel(self.content_frame, text=f"  • {subgroup_name}", font=ctk.CTkFont(size=14, weight="bold")).pack(anchor="w", padx=20, pady=(5,0))
+            subgroup_label = ctk.CTkLabel(self.content_frame, text=f"  • {subgroup_name}", font=ctk.CTkFont(size=14, weight="bold"), cursor=cursor)
+            subgroup_label.pack(anchor="w", padx=20, pady=(5,0))
+            if on_drill:
+                subgroup_label.bind("<Button-1>", lambda event, sg=str(subgroup_name): on_drill(group_name, sg, None))
+            self._add_anomaly_badges(anomalies.get(str(subgroup_name), []))
             for _, row in subgroup_df.iterrows():
-                item_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+                item_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent", cursor=cursor)
                 item_frame.pack(fill="x", padx=40)
-                ctk.CTkLabel(item_frame, text=row['indicator'], justify="left", wraplength=400).pack(side="left", expand=True, anchor="w")
-                ctk.CTkLabel(item_frame, text=f"R$ {row['total_value']:,.2f}").pack(side="right")
+                labels = [ctk.CTkLabel(item_frame, text=row['indicator'], justify="left", wraplength=400, cursor=cursor),
+                          ctk.CTkLabel(item_frame, text=f"R$ {row['total_value']:,.2f}", cursor=cursor)]
+                labels[0].pack(side="left", expand=True, anchor="w")
+                labels[1].pack(side="right")
+                if on_drill:
+                    for widget in [item_frame] + labels:
+                        widget.bind("<Button-1>", lambda event, sg=str(subgroup_name), ind=str(row['indicator']): on_drill(group_name, sg, ind))
+
+        present = {str(name) for name in data_df["subgroup_name"].unique()}
+        for subgroup_name in sorted(set(anomalies) - present):
+            ctk.CTkLabel(self.content_frame, text=f"  • {subgroup_name} (sem lançamentos no período)", font=ctk.CTkFont(size=14, weight="bold"),
+                         text_color=theme_colors["text_light"]).pack(anchor="w", padx=20, pady=(5, 0))
+            self._add_anomaly_badges(anomalies[subgroup_name])
+
+    def _add_anomaly_badges(self, texts: List[str]):
+        if len(texts) > self.MAX_ANOMALY_BADGES:
+            texts = texts[:self.MAX_ANOMALY_BADGES - 1] + [f"e mais {len(texts) - self.MAX_ANOMALY_BADGES + 1} alerta(s) neste subgrupo"]
+        for text in texts:
+            ctk.CTkLabel(self.content_frame, text=f"⚠ {text}", font=ctk.CTkFont(size=12), fg_color=Config.COLOR_SECONDARY_YELLOW,
+                         text_color=Config.COLOR_BUTTON_TEXT_DARK, corner_radius=6, wraplength=600, justify="left").pack(anchor="w", padx=40, pady=2)
 
     def toggle_expand(self, event=None):
         self.is_expanded = not self.is_expanded
@@ -1504,10 +4962,32 @@ class CollapsibleCard(ctk.CTkFrame):
             self.content_frame.pack_forget()
             self.toggle_icon.configure(text="▶")
 
+class ChartView(ctk.CTkLabel):
+    """Área que exibe um gráfico renderizado pelo ChartRenderer assim que ele fica pronto."""
+    def __init__(self, parent, renderer: ChartRenderer, theme_colors: dict, size: Tuple[float, float] = (8, 4)):
+        super().__init__(parent, text="Gerando gráfico...", text_color=theme_colors["text_light"], fg_color=theme_colors["frame"])
+        self.renderer = renderer
+        self.theme_colors = theme_colors
+        self.size = size
+        self._image = None
+
+    def show(self, kind: str, payload: Dict[str, Any]):
+        self.renderer.render_async(self, kind, payload, self.theme_colors, self._on_ready, self._on_error, size=self.size)
+
+    def _on_ready(self, png: bytes):
+        pil_image = Image.open(io.BytesIO(png))
+        self._image = ctk.CTkImage(light_image=pil_image, dark_image=pil_image, size=pil_image.size)
+        self.configure(image=self._image, text="")
+
+    def _on_error(self, error: Exception):
+        self.configure(text=f"Não foi possível gerar o gráfico.\n{error}", text_color=Config.COLOR_RED)
+
 class DashboardScreen(BaseFrame):
-    def __init__(self, parent, controller, unit_name: str, data: pd.DataFrame, **kwargs):
+    """Resultado mensal do ano e simulação de cenários (ScenarioSimulator) da unidade."""
+    def __init__(self, parent, controller, unit_name: str, data: pd.DataFrame, year: Optional[int] = None, **kwargs):
         self.unit_name = unit_name
         self.data = data
+        self.year = current_year() if year is None else year
         super().__init__(parent, controller, **kwargs)
 
         top_frame = ctk.CTkFrame(self, fg_color="transparent")
@@ -1531,29 +5011,172 @@ class DashboardScreen(BaseFrame):
         ctk.CTkLabel(avg_month_card, text="Resultado Médio", font=ctk.CTkFont(size=14, weight="bold"), text_color=self.theme_colors["text"]).pack(pady=(10,2))
         ctk.CTkLabel(avg_month_card, text=f"R$ {avg_month_val:,.2f}", font=ctk.CTkFont(size=20, weight="bold"), text_color=Config.COLOR_BLUE).pack(pady=(0,10))
 
-        self.data['month'] = self.data['period'].apply(lambda x: int(x.split('/')[0]))
-        self.data = self.data.sort_values('month')
-        months = [f"{m:02d}/{Config.CURRENT_YEAR_SHORT}" for m in self.data['month']]
+        self.data = self.data.sort_values('period_index')
+        months = [period_label(int(index), short_year=True) for index in self.data['period_index']]
         
-        fig = Figure(figsize=(8, 4), dpi=100, facecolor=self.theme_colors["frame"])
-        ax = fig.add_subplot(111, facecolor=self.theme_colors["frame"])
-        ax.bar(months, self.data['total_net'], color=[self.theme_colors["primary"] if x >= 0 else Config.COLOR_RED for x in self.data['total_net']])
-
-        goal = self.db().get_unit_goal(self.unit_name)
-        if goal > 0:
-            ax.axhline(y=goal, color=Config.COLOR_SECONDARY_YELLOW, linestyle='--', linewidth=2, label=f'Meta: R$ {goal:,.2f}')
-            ax.legend()
-
-        ax.set_title(f"Resultado Líquido Mensal - {Config.CURRENT_YEAR}", color=self.theme_colors["text"])
-        ax.set_ylabel("Resultado (R$)", color=self.theme_colors["text"])
-        ax.tick_params(colors=self.theme_colors["text"])
-        for spine in ax.spines.values():
-            spine.set_edgecolor(self.theme_colors["text"])
-        fig.tight_layout()
-
-        canvas = FigureCanvasTkAgg(fig, master=self)
-        canvas.draw()
-        canvas.get_tk_widget().pack(side=ctk.TOP, fill=ctk.BOTH, expand=True, padx=0, pady=10)
+        self.goal = self.db().get_unit_goal(self.unit_name)
+        payload = {
+            "labels": months,
+            "values": [float(v) for v in self.data['total_net']],
+            "goal": float(self.goal),
+            "title": f"Resultado Líquido Mensal - {self.year}",
+        }
+        # Com orçamento por grupo cadastrado, a linha de referência é o resultado orçado de cada mês. O orçamento
+        # costuma cobrir só parte dos grupos, então ele é comparado ao realizado desses mesmos grupos, não às barras.
+        budget = self.db().get_budget_vs_actual(self.unit_name, 1, 12, self.year)
+        if budget["budget"].any():
+            budgeted_groups = budget.loc[budget["budget"] != 0, "group_name"].unique()
+            budgeted = budget[budget["group_name"].isin(budgeted_groups)].groupby("period_index")[["budget", "actual"]].sum()
+            payload["budget"] = [float(budgeted["budget"].get(int(index), 0.0)) for index in self.data['period_index']]
+            payload["budget_actual"] = [float(budgeted["actual"].get(int(index), 0.0)) for index in self.data['period_index']]
+        ctk.CTkSegmentedButton(self, values=["Resultado Mensal", "Tendências", "Cenários"], command=self.switch_view,
+                               variable=ctk.StringVar(value="Resultado Mensal")).pack(anchor="w", pady=(0, 5))
+        self.monthly_chart = ChartView(self, self.charts(), self.theme_colors)
+        self.monthly_chart.pack(side=ctk.TOP, fill=ctk.BOTH, expand=True, padx=0, pady=10)
+        self.monthly_chart.show("monthly_net", payload)
+        self.trend_series: Optional[TrendSeries] = None
+        self.trend_view = self._build_trend_view()
+        self.scenario_view = self._build_scenario_view()
+        self.views = {"Resultado Mensal": self.monthly_chart, "Tendências": self.trend_view, "Cenários": self.scenario_view}
+
+    def switch_view(self, view: str):
+        for name, widget in self.views.items():
+            if name != view:
+                widget.pack_forget()
+        self.views[view].pack(side=ctk.TOP, fill=ctk.BOTH, expand=True, padx=0, pady=10)
+        if view == "Tendências" and self.trend_series is None:
+            self.load_trends()
+
+    TREND_KINDS = {"Acumulado 12 Meses": "rolling_12", "Acumulado no Ano": "ytd", "Mensal": "monthly"}
+    NET_RESULT = "Resultado Líquido"
+    MAX_TREND_UNITS = 8
+
+    def _build_trend_view(self) -> ctk.CTkFrame:
+        view = ctk.CTkFrame(self, fg_color="transparent")
+        view.grid_columnconfigure(1, weight=1)
+        view.grid_rowconfigure(1, weight=1)
+        all_units = self.fm().get_existing_units()
+        self.trend_picker = UnitPicker(view, all_units, self.db().get_unit_regions(), self.theme_colors, multiselect=True,
+                                       selected=[self.unit_name] if self.unit_name in all_units else [], on_change=self.load_trends)
+        self.trend_picker.grid(row=0, column=0, rowspan=2, sticky="nsw", padx=(0, 10))
+
+        controls = ctk.CTkFrame(view, fg_color="transparent")
+        controls.grid(row=0, column=1, sticky="ew")
+        self.trend_kind_var = ctk.StringVar(value="Acumulado 12 Meses")
+        ctk.CTkOptionMenu(controls, variable=self.trend_kind_var, values=list(self.TREND_KINDS), command=lambda _: self.show_trends(), width=180).pack(side="left")
+        self.trend_group_var = ctk.StringVar(value=self.NET_RESULT)
+        ctk.CTkOptionMenu(controls, variable=self.trend_group_var, values=[self.NET_RESULT] + Config.DRE_GROUP_ORDER, command=lambda _: self.show_trends(), width=220).pack(side="left", padx=10)
+        self.trend_label = ctk.CTkLabel(controls, text="", text_color=self.theme_colors["text_light"])
+        self.trend_label.pack(side="left", padx=10)
+
+        self.trend_chart = ChartView(view, self.charts(), self.theme_colors)
+        self.trend_chart.grid(row=1, column=1, sticky="nsew", pady=5)
+        return view
+
+    def trend_units(self) -> List[str]:
+        """Unidades marcadas, com a unidade do dashboard primeiro."""
+        selected = sorted(self.trend_picker.get_selected(), key=lambda unit: (unit != self.unit_name, unit))
+        return selected[:self.MAX_TREND_UNITS]
+
+    def load_trends(self):
+        units = self.trend_units()
+        if not units:
+            self.trend_series = None
+            self.trend_chart.configure(image=None, text="Selecione ao menos uma unidade.")
+            return
+        year = self.year
+        db = self.db()
+        self.trend_label.configure(text="Carregando...")
+        run_in_background(self, lambda: TrendEngine(db).trends(units, 1, 12, year), self._on_trends_loaded,
+                          lambda error: self.trend_label.configure(text=f"Não foi possível calcular as tendências: {error}"))
+
+    def _on_trends_loaded(self, series: TrendSeries):
+        self.trend_series = series
+        self.show_trends()
+
+    def show_trends(self):
+        """Redesenha a partir das séries já calculadas; trocar o tipo ou o grupo não consulta o banco."""
+        series = self.trend_series
+        if series is None:
+            return
+        group = self.trend_group_var.get()
+        values = series.series(self.TREND_KINDS[self.trend_kind_var.get()], None if group == self.NET_RESULT else group)
+        selected = len(self.trend_picker.get_selected())
+        self.trend_label.configure(text=f"Mostrando {self.MAX_TREND_UNITS} de {selected} unidades." if selected > self.MAX_TREND_UNITS else "")
+        self.trend_chart.show("trend", {
+            "labels": [MONTH_ABBREVIATIONS[int(p) % 12] for p in series.periods],
+            "lines": {unit: [None if np.isnan(v) else float(v) for v in values[i]] for i, unit in enumerate(series.units)},
+            "highlight": self.unit_name,
+            "title": f"{self.trend_kind_var.get()} - {group} - {self.year}",
+        })
+
+    def _build_scenario_view(self) -> ctk.CTkFrame:
+        view = ctk.CTkFrame(self, fg_color="transparent")
+        shocks_card = ctk.CTkFrame(view, fg_color=self.theme_colors["frame"])
+        shocks_card.pack(fill="x")
+        ctk.CTkLabel(shocks_card, text="Choques nos meses projetados (% por grupo do DRE, ex: -10 ou 5):",
+                     font=ctk.CTkFont(size=14, weight="bold"), text_color=self.theme_colors["text"]).grid(row=0, column=0, columnspan=8, sticky="w", padx=10, pady=(10, 5))
+        self.shock_entries: Dict[str, ctk.CTkEntry] = {}
+        for i, group in enumerate(Config.DRE_GROUP_ORDER):
+            row, column = divmod(i, 4)
+            ctk.CTkLabel(shocks_card, text=group, text_color=self.theme_colors["text"]).grid(row=row + 1, column=column * 2, sticky="e", padx=(10, 4), pady=3)
+            entry = ctk.CTkEntry(shocks_card, width=60)
+            entry.insert(0, "0")
+            entry.grid(row=row + 1, column=column * 2 + 1, sticky="w", pady=3)
+            self.shock_entries[group] = entry
+
+        controls = ctk.CTkFrame(view, fg_color="transparent")
+        controls.pack(fill="x", pady=5)
+        ctk.CTkLabel(controls, text="Simulações:", text_color=self.theme_colors["text"]).pack(side="left")
+        self.simulations_var = ctk.StringVar(value=str(ScenarioSimulator.DEFAULT_SIMULATIONS))
+        ctk.CTkOptionMenu(controls, variable=self.simulations_var, values=["1000", "10000", "50000"], width=100).pack(side="left", padx=10)
+        self.simulate_button = ctk.CTkButton(controls, text="Simular", command=self.run_scenario, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"])
+        self.simulate_button.pack(side="left", padx=10)
+        self.scenario_label = ctk.CTkLabel(controls, text="", text_color=self.theme_colors["text"], justify="left")
+        self.scenario_label.pack(side="left", padx=10)
+
+        self.fan_chart = ChartView(view, self.charts(), self.theme_colors)
+        self.fan_chart.pack(fill="both", expand=True, pady=5)
+        self.fan_chart.configure(text="Defina os choques e clique em Simular.")
+        return view
+
+    def run_scenario(self):
+        try:
+            shocks = {group: float(entry.get().replace(",", ".") or 0) / 100 for group, entry in self.shock_entries.items()}
+        except ValueError:
+            messagebox.showerror("Erro", "Informe os choques como percentuais numéricos (ex: -10 ou 5).")
+            return
+        simulations = int(self.simulations_var.get())
+        year = self.year
+
+        def task() -> ScenarioResult:
+            forecast = ForecastEngine(self.db()).forecast(year)
+            return ScenarioSimulator(forecast).run(shocks, simulations)
+
+        self.simulate_button.configure(state="disabled")
+        self.scenario_label.configure(text=f"Simulando {simulations:,} cenários...")
+        run_in_background(self, task, self.show_scenario, self._on_scenario_error)
+
+    def _on_scenario_error(self, error: Exception):
+        self.simulate_button.configure(state="normal")
+        self.scenario_label.configure(text=f"Não foi possível simular.\n{error}")
+
+    def show_scenario(self, result: ScenarioResult):
+        self.simulate_button.configure(state="normal")
+        bands = result.unit_bands(self.unit_name)
+        annual = result.unit_annual(self.unit_name)
+        if bands is None or annual is None:
+            self.scenario_label.configure(text="Não há histórico da unidade para simular.")
+            return
+        position = cast(int, result.forecast.unit_position(self.unit_name))
+        projected = result.forecast.projected[position]
+        self.scenario_label.configure(text=f"Resultado do ano: P5 R$ {annual[5]:,.2f} | mediana R$ {annual[50]:,.2f} | P95 R$ {annual[95]:,.2f}")
+        self.fan_chart.show("scenario_fan", {
+            "labels": [f"{MONTH_ABBREVIATIONS[m]}{'*' if projected[m] else ''}" for m in range(12)],
+            "bands": {str(p): [float(v) for v in values] for p, values in bands.items()},
+            "goal": float(self.goal),
+            "title": f"Cenários do Resultado Líquido - {self.year} ({result.simulations:,} simulações)",
+        })
 
 class DetailsBrowserScreen(BaseFrame):
     def __init__(self, parent, controller, unit_name: str, **kwargs):
@@ -1642,33 +5265,207 @@ class FileDetailsScreen(BaseFrame):
             tree.insert("", "end", values=(row['group_name'], row['subgroup_name'], row['indicator'], val_str))
         tree.pack(fill="both", expand=True, padx=10, pady=10)
 
+class LineDetailsScreen(BaseFrame):
+    """Registros de analysis_details que compõem uma linha do DRE, com unidade, período e arquivo de origem.
+
+    `units` segue DatabaseManager._units_condition (uma unidade, uma lista ou None = rede) e
+    `indicator` None abre o subgrupo inteiro. Clique duplo abre o arquivo importado.
+    """
+    COLUMNS = [("unit", "Unidade", 180, "w"), ("period", "Período", 80, "center"), ("source", "Arquivo de Origem", 220, "w"),
+               ("collector", "Arrecadadora", 140, "w"), ("indicator", "Indicador", 300, "w"), ("value", "Valor", 130, "e")]
+
+    def __init__(self, parent, controller, units: Union[str, List[str], None], group_name: str, subgroup_name: str, indicator: Optional[str],
+                 period: Tuple[int, int, Optional[int], Optional[int]], period_title: str, **kwargs):
+        super().__init__(parent, controller, **kwargs)
+        line = f"{group_name} › {subgroup_name}" + (f" › {indicator}" if indicator is not None else "")
+        ctk.CTkLabel(self, text=f"{line} — {period_title}", font=ctk.CTkFont(size=16, weight="bold"), text_color=self.theme_colors["text"],
+                     wraplength=900, justify="left").pack(anchor="w", padx=10)
+
+        start = time.perf_counter()
+        details = self.db().get_line_details(units, group_name, subgroup_name, indicator, *period)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._summaries = {str(row.id): (row.unit_name, int(row.summary_id), row.source_file) for row in details.itertuples()}
+        files = details["summary_id"].nunique()
+        self.status_label = ctk.CTkLabel(self, text=f"{len(details)} registro(s) de {files} arquivo(s), total R$ {details['value'].sum():,.2f}, em {elapsed_ms:.0f} ms. "
+                                                    "Clique duas vezes para abrir o arquivo de origem.", text_color=self.theme_colors["text_light"])
+        self.status_label.pack(anchor="w", padx=10)
+
+        self.table = VirtualTable(self, self.COLUMNS, self.theme_colors, horizontal_scroll=True)
+        self.table.pack(fill="both", expand=True, padx=10, pady=10)
+        self.table.tree.bind("<Double-1>", self.open_source_file)
+        self.table.set_rows([(row.unit_name, row.period, row.source_file, row.collector or "", row.indicator, f"R$ {row.value:,.2f}")
+                             for row in details.itertuples()], [str(detail_id) for detail_id in details["id"]])
+
+    def open_source_file(self, event=None):
+        selection = self.table.tree.selection()
+        if not selection or selection[0] not in self._summaries:
+            return
+        unit_name, summary_id, source_file = self._summaries[selection[0]]
+        path = self.breadcrumb_path + [(f"Detalhes: {source_file[:20]}...", FileDetailsScreen)]
+        self.controller.show_frame(FileDetailsScreen, breadcrumb_path=path, unit_name=unit_name, summary_id=summary_id)
+
+class GlobalSearchScreen(BaseFrame):
+    """Busca em todos os detalhes importados, de todas as unidades e anos, pelo índice FTS5."""
+    # Só vira busca por valor com "R$" ou centavos ("1.234,56"): números soltos como "2024" ou
+    # códigos de conta ("4101", "01.11.004") continuam sendo busca de texto
+    MONEY_PATTERN = re.compile(r"^\s*(R\$\s*-?[\d.]*\d(,\d{1,2})?|-?[\d.]*\d,\d{1,2})\s*$")
+
+    def __init__(self, parent, controller, **kwargs):
+        super().__init__(parent, controller, **kwargs)
+        self._summaries: Dict[str, Tuple[str, int, str]] = {}
+
+        filter_frame = ctk.CTkFrame(self, fg_color="transparent")
+        filter_frame.pack(fill="x", padx=10, pady=(0, 10))
+        ctk.CTkLabel(filter_frame, text="Buscar:").pack(side="left")
+        self.search_entry = ctk.CTkEntry(filter_frame, placeholder_text="Indicador, grupo, unidade ou valor (ex: 1.234,56)")
+        self.search_entry.pack(side="left", fill="x", expand=True, padx=5)
+        ctk.CTkLabel(filter_frame, text="Valor de:").pack(side="left", padx=(10, 0))
+        self.min_entry = ctk.CTkEntry(filter_frame, width=100)
+        self.min_entry.pack(side="left", padx=5)
+        ctk.CTkLabel(filter_frame, text="até:").pack(side="left")
+        self.max_entry = ctk.CTkEntry(filter_frame, width=100)
+        self.max_entry.pack(side="left", padx=5)
+        ctk.CTkButton(filter_frame, text="Buscar", command=self.run_search, width=100, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(side="left", padx=(10, 0))
+        for entry in (self.search_entry, self.min_entry, self.max_entry):
+            entry.bind("<Return>", lambda event: self.run_search())
+
+        self.status_label = ctk.CTkLabel(self, text="Digite um termo ou uma faixa de valores (valores comparados sem sinal).", text_color=self.theme_colors["text_light"])
+        self.status_label.pack(anchor="w", padx=10)
+
+        columns = [("Unidade", "Unidade", 160, "w"), ("Periodo", "Período", 80, "center"), ("Grupo", "Grupo", 180, "w"),
+                   ("Subgrupo", "Subgrupo", 180, "w"), ("Indicador", "Indicador", 320, "w"), ("Valor", "Valor", 130, "e")]
+        self.table = VirtualTable(self, columns, self.theme_colors)
+        self.table.pack(fill="both", expand=True, padx=10, pady=10)
+        self.table.tree.bind("<Double-1>", self.open_source_file)
+        self.search_entry.focus_set()
+
+    @staticmethod
+    def _parse_money(text: str) -> Optional[float]:
+        text = text.strip()
+        if not text:
+            return None
+        try:
+            return float(text.replace("R$", "").strip().replace(".", "").replace(",", "."))
+        except ValueError:
+            raise ValueError(f"Valor inválido: '{text}'")
+
+    def run_search(self):
+        text = self.search_entry.get()
+        try:
+            min_value = self._parse_money(self.min_entry.get())
+            max_value = self._parse_money(self.max_entry.get())
+            # Um valor digitado na busca ("R$ 1.234,56") procura exatamente esse valor
+            exact_value = None
+            if self.MONEY_PATTERN.match(text) and min_value is None and max_value is None:
+                exact_value = self._parse_money(text)
+        except ValueError as e:
+            messagebox.showerror("Filtro Inválido", str(e))
+            return
+
+        start = time.perf_counter()
+        if exact_value is not None:
+            results = self.db().search_details("", exact_value, exact_value)
+            if results.empty:
+                # Nenhum lançamento com esse valor: tenta o mesmo texto no índice de texto
+                results = self.db().search_details(text, None, None)
+        else:
+            results = self.db().search_details(text, min_value, max_value)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self._summaries = {str(row.id): (row.unit_name, int(row.summary_id), row.source_file) for row in results.itertuples()}
+        rows = [
+            (row.unit_name, row.period, row.group_name, row.subgroup_name, row.indicator,
+             f"R$ {row.value:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
+            for row in results.itertuples()
+        ]
+        self.table.set_rows(rows, [str(detail_id) for detail_id in results["id"]])
+        limit_note = f" (limitado a {DatabaseManager.SEARCH_LIMIT})" if len(rows) >= DatabaseManager.SEARCH_LIMIT else ""
+        self.status_label.configure(text=f"{len(rows)} resultado(s){limit_note} em {elapsed_ms:.0f} ms. Clique duas vezes para abrir o arquivo de origem.")
+
+    def open_source_file(self, event=None):
+        selection = self.table.tree.selection()
+        if not selection or selection[0] not in self._summaries:
+            return
+        unit_name, summary_id, source_file = self._summaries[selection[0]]
+        path = self.breadcrumb_path + [(f"Detalhes: {source_file[:20]}...", FileDetailsScreen)]
+        self.controller.show_frame(FileDetailsScreen, breadcrumb_path=path, unit_name=unit_name, summary_id=summary_id)
+
 class ProjectionScreen(BaseFrame):
+    """Meta mensal da unidade e projeção do ano (ForecastEngine) por grupo/subgrupo."""
     def __init__(self, parent, controller, unit_name: str, **kwargs):
         self.unit_name = unit_name
         super().__init__(parent, controller, **kwargs)
         
-        current_goal = self.db().get_unit_goal(self.unit_name)
+        self.current_goal = self.db().get_unit_goal(self.unit_name)
 
         main_frame = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"])
-        main_frame.pack(expand=True, padx=100, pady=100)
+        main_frame.pack(fill="x", padx=10, pady=(0, 10))
 
-        ctk.CTkLabel(main_frame, text="Defina uma meta de lucro líquido mensal.", font=ctk.CTkFont(size=18), text_color=self.theme_colors["text"]).pack(pady=20, padx=40)
-        
-        entry_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-        entry_frame.pack(pady=10, padx=40)
-        ctk.CTkLabel(entry_frame, text="R$", font=ctk.CTkFont(size=18), text_color=self.theme_colors["text"]).pack(side="left")
-        self.goal_entry = ctk.CTkEntry(entry_frame, font=ctk.CTkFont(size=18), width=200)
-        self.goal_entry.insert(0, f"{current_goal:.2f}")
+        ctk.CTkLabel(main_frame, text="Meta de lucro líquido mensal:", font=ctk.CTkFont(size=16), text_color=self.theme_colors["text"]).pack(side="left", pady=15, padx=(20, 10))
+        ctk.CTkLabel(main_frame, text="R$", font=ctk.CTkFont(size=16), text_color=self.theme_colors["text"]).pack(side="left")
+        self.goal_entry = ctk.CTkEntry(main_frame, font=ctk.CTkFont(size=16), width=160)
+        self.goal_entry.insert(0, f"{self.current_goal:.2f}")
         self.goal_entry.pack(side="left", padx=10)
+        ctk.CTkButton(main_frame, text="Salvar Meta", command=self.save_goal, height=36, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(side="left", padx=10)
+        self.year_var = ctk.StringVar(value=str(current_year()))
+        ctk.CTkOptionMenu(main_frame, variable=self.year_var, values=[str(year) for year in self.db().get_available_years()], width=100,
+                          command=lambda _: self.load_forecast()).pack(side="right", padx=20)
+        ctk.CTkLabel(main_frame, text="Ano da projeção:", text_color=self.theme_colors["text"]).pack(side="right")
+
+        self.summary_label = ctk.CTkLabel(self, text="Calculando projeção...", font=ctk.CTkFont(size=14), text_color=self.theme_colors["text"], justify="left")
+        self.summary_label.pack(anchor="w", padx=20, pady=(0, 5))
+        self.chart = ChartView(self, self.charts(), self.theme_colors, size=(9, 3))
+        self.chart.pack(fill="x", padx=10, pady=5)
+        self.table_container = ctk.CTkFrame(self, fg_color="transparent")
+        self.table_container.pack(fill="both", expand=True, padx=10, pady=(5, 10))
+        self.load_forecast()
+
+    def load_forecast(self):
+        year = int(self.year_var.get())
+        self.summary_label.configure(text="Calculando projeção...")
+        run_in_background(self, lambda: ForecastEngine(self.db()).forecast(year), self.show_forecast,
+                          lambda e: self.summary_label.configure(text=f"Não foi possível calcular a projeção.\n{e}"))
+
+    def show_forecast(self, forecast: NetworkForecast):
+        for child in self.table_container.winfo_children():
+            child.destroy()
+        position = forecast.unit_position(self.unit_name)
+        rows = forecast.unit_rows(self.unit_name)
+        if position is None or not rows:
+            self.summary_label.configure(text=f"Não há histórico da unidade para projetar {forecast.year}.")
+            return
 
-        ctk.CTkButton(main_frame, text="Salvar Meta", command=self.save_goal, height=40, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(pady=20, padx=40)
+        projected = forecast.projected[position]
+        monthly_net = forecast.monthly_net()[position]
+        realized, pending = float(monthly_net[~projected].sum()), float(monthly_net[projected].sum())
+        summary = (f"Resultado {forecast.year}: realizado R$ {realized:,.2f} + projetado R$ {pending:,.2f} "
+                   f"= R$ {realized + pending:,.2f} ({int(projected.sum())} mês(es) projetado(s))")
+        if self.current_goal > 0:
+            summary += f"\nMeta anual: R$ {self.current_goal * 12:,.2f}"
+        self.summary_label.configure(text=summary)
+
+        labels = [f"{MONTH_ABBREVIATIONS[m]}{'*' if projected[m] else ''}" for m in range(12)]
+        self.chart.show("projection", {
+            "labels": labels, "values": [float(v) for v in monthly_net], "projected": [bool(p) for p in projected],
+            "goal": float(self.current_goal), "title": f"Resultado Líquido Realizado e Projetado (*) - {forecast.year}",
+        })
+
+        columns = [("linha", "Grupo / Subgrupo", 300, "w")] + [(f"m{m}", labels[m], 105, "e") for m in range(12)] + [("total", "Total", 120, "e")]
+        table = VirtualTable(self.table_container, columns, self.theme_colors, horizontal_scroll=True)
+        for col_id, _, width, _ in columns:
+            table.tree.column(col_id, width=width, minwidth=width, stretch=False)
+        table_rows = [(f"{group} / {subgroup}", *(f"{v:,.2f}" for v in values), f"{values.sum():,.2f}") for group, subgroup, values in rows]
+        table_rows.append(("Resultado Líquido", *(f"{v:,.2f}" for v in monthly_net), f"{monthly_net.sum():,.2f}"))
+        table.set_rows(table_rows)
+        table.pack(fill="both", expand=True)
 
     def save_goal(self):
         try:
             goal_value = float(self.goal_entry.get().replace(",", "."))
             self.db().set_unit_goal(self.unit_name, goal_value)
+            self.current_goal = goal_value
             messagebox.showinfo("Sucesso", "Meta salva com sucesso!")
-            self.controller.navigate_back(self.breadcrumb_path[:-1])
+            self.load_forecast()
         except ValueError:
             messagebox.showerror("Erro", "Por favor, insira um valor numérico válido para a meta.")
 
@@ -1689,7 +5486,8 @@ class HelpScreen(BaseFrame):
 2. Importar os Dados:
    - No aplicativo, acesse a unidade desejada.
    - Clique em "Importar Dados do Mês".
-   - Digite o número do mês que você quer importar (ex: 7 para Julho).
+   - Digite o número do mês que você quer importar (ex: 7 para Julho) e o ano
+     (o mês anterior já vem sugerido, inclusive dezembro do ano passado em janeiro).
    - Selecione todos os arquivos CSV de "Nota de Negócio" daquele mês.
    - Selecione o arquivo CSV de "Detalhamento Financeiro" daquele mês.
    - Clique em "Processar e Salvar". O sistema lerá os arquivos e os salvará no banco de dados.
@@ -1697,6 +5495,17 @@ class HelpScreen(BaseFrame):
 3. Gerar Relatórios e Análises:
    - Após importar, use os botões no painel da unidade para gerar DREs interativas,
      visualizar o Dashboard Anual ou comparar a performance com outras unidades.
+
+4. Orçamentos:
+   - Em Gerenciamento > Orçamentos, clique em "Importar Orçamento (CSV)".
+   - O arquivo usa ';' e traz as colunas Unidade;Ano;Mês;Grupo;Valor, ou Unidade;Ano;Grupo
+     com uma coluna por mês (Jan a Dez). Os grupos são os do DRE; despesas podem vir positivas.
+   - Reimportar a mesma unidade, mês e grupo substitui o valor anterior.
+
+5. Desempenho:
+   - Em Gerenciamento > Desempenho, ligue a medição para registrar quanto tempo levam a leitura e a
+     classificação dos arquivos, as consultas ao banco, a abertura das telas e as exportações.
+   - "Gravar no banco" guarda as medidas da sessão; desligada, a medição não pesa no aplicativo.
 """
         ctk.CTkLabel(scroll_frame, text=help_text, font=ctk.CTkFont(size=14), text_color=self.theme_colors["text"], justify="left").pack(anchor="w", padx=20, pady=5)
 
@@ -1711,62 +5520,451 @@ Este aplicativo foi criado para simplificar a consolidação e análise de Demon
 """
         ctk.CTkLabel(scroll_frame, text=about_text, font=ctk.CTkFont(size=14), text_color=self.theme_colors["text"], justify="left").pack(anchor="w", padx=20, pady=5)
 
+class VarianceReportScreen(BaseFrame):
+    """Variação por grupo/subgrupo do mês contra o mês anterior e o mesmo mês do ano anterior.
+
+    `unit_name` None mostra a rede inteira.
+    """
+    SORT_OPTIONS = {
+        "Ordem do DRE": "dre",
+        "Maior variação vs mês anterior": "previous",
+        "Maior variação vs ano anterior": "last_year",
+    }
+    COLUMNS = [
+        ("line", "Linha", 320, "w"), ("current", "Mês", 120, "e"), ("previous", "Mês Anterior", 120, "e"),
+        ("previous_delta", "Var. R$", 110, "e"), ("previous_pct", "Var. %", 80, "e"), ("last_year", "Ano Anterior", 120, "e"),
+        ("last_year_delta", "Var. R$ (ano)", 110, "e"), ("last_year_pct", "Var. % (ano)", 90, "e"),
+    ]
+
+    def __init__(self, parent, controller, unit_name: Optional[str] = None, **kwargs):
+        self.unit_name = unit_name
+        self.report = pd.DataFrame()
+        super().__init__(parent, controller, **kwargs)
+
+        toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        toolbar.pack(fill="x", padx=10, pady=(0, 10))
+        ctk.CTkLabel(toolbar, text="Mês (MM/AAAA):").pack(side="left")
+        today = datetime.date.today()
+        self.period_entry = ctk.CTkEntry(toolbar, width=90)
+        self.period_entry.insert(0, period_label(period_index(today.year, today.month) - 1))
+        self.period_entry.pack(side="left", padx=5)
+        self.period_entry.bind("<Return>", lambda event: self.load_report())
+        self.sort_var = ctk.StringVar(value="Ordem do DRE")
+        ctk.CTkOptionMenu(toolbar, variable=self.sort_var, values=list(self.SORT_OPTIONS), command=lambda _: self.load_report(), width=260).pack(side="left", padx=10)
+        ctk.CTkButton(toolbar, text="Atualizar", command=self.load_report, width=100).pack(side="left")
+        ctk.CTkButton(toolbar, text="Exportar Excel", command=self.export_excel, width=140, fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(side="right")
+
+        self.status_label = ctk.CTkLabel(self, text="", text_color=self.theme_colors["text_light"])
+        self.status_label.pack(anchor="w", padx=10)
+        self.table = VirtualTable(self, self.COLUMNS, self.theme_colors, horizontal_scroll=True)
+        self.table.pack(fill="both", expand=True, padx=10, pady=10)
+        self.load_report()
+
+    def selected_period(self) -> Optional[Tuple[int, int]]:
+        try:
+            start_month, end_month, start_year, end_year = parse_period_spec(self.period_entry.get())
+        except ValueError:
+            return None
+        if (start_month, start_year) != (end_month, end_year):
+            return None
+        return start_month, start_year
+
+    def load_report(self):
+        period = self.selected_period()
+        if period is None:
+            messagebox.showerror("Erro", "Informe um único mês, ex: 08/2025.")
+            return
+        month, year = period
+        self.report = self.db().get_variance_report(self.unit_name, month, year, self.SORT_OPTIONS[self.sort_var.get()])
+        if self.sort_var.get() == "Ordem do DRE":
+            ranks = self.report["group_name"].map(dre_group_rank)
+            self.report = self.report.assign(_rank=ranks).sort_values("_rank", kind="stable").drop(columns="_rank")
+
+        def money(value: float) -> str:
+            return f"R$ {value:,.2f}"
+
+        def percent(value: Optional[float]) -> str:
+            return "—" if value is None or pd.isna(value) else f"{value:+.1f}%"
+
+        rows = [
+            (variance_line_label(row.group_name, row.subgroup_name), money(row.current_value), money(row.previous_value),
+             money(row.previous_delta), percent(row.previous_pct), money(row.last_year_value), money(row.last_year_delta), percent(row.last_year_pct))
+            for row in self.report.itertuples(index=False)
+        ]
+        self.table.set_rows(rows)
+        current = period_label(period_index(year, month))
+        self.status_label.configure(text=f"{current} contra {period_label(period_index(year, month) - 1)} e {period_label(period_index(year, month) - 12)}: {len(rows)} linha(s).")
+
+    def export_excel(self):
+        if self.report.empty:
+            messagebox.showinfo("Sem Dados", "Não há linhas para exportar.")
+            return
+        period = self.selected_period()
+        title = period_label(period_index(period[1], period[0])) if period else "periodo"
+        cast(ExcelExporter, self.excel_exporter).export_variance(self.report, self.unit_name or "Rede", title)
+
+class BudgetScreen(BaseFrame):
+    """Previsto x realizado por unidade, com a abertura por grupo do DRE da unidade selecionada.
+
+    A consulta roda uma vez por período (em segundo plano); filtrar, ordenar e trocar de unidade
+    só reorganizam o resultado já carregado, então a tela responde igual com centenas de unidades.
+    `unit_name` None mostra a rede inteira.
+    """
+    SORT_OPTIONS = ["Unidade", "Menor execução acumulada", "Maior desvio (R$)"]
+    VALUE_COLUMNS = [
+        ("budget", "Previsto", 120, "e"), ("actual", "Realizado", 120, "e"), ("delta", "Desvio R$", 120, "e"),
+        ("attainment", "Execução %", 90, "e"), ("ytd_budget", "Previsto no Ano", 120, "e"),
+        ("ytd_actual", "Realizado no Ano", 120, "e"), ("ytd_attainment", "Execução no Ano %", 120, "e"),
+    ]
+
+    def __init__(self, parent, controller, unit_name: Optional[str] = None, **kwargs):
+        self.unit_name = unit_name
+        self.units_summary = pd.DataFrame()
+        self.groups_summary = pd.DataFrame()
+        self.unit_index = UnitIndex([])
+        super().__init__(parent, controller, **kwargs)
+
+        toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        toolbar.pack(fill="x", padx=10, pady=(0, 10))
+        ctk.CTkLabel(toolbar, text="Período (ex: 1-6/2025):").pack(side="left")
+        self.period_entry = ctk.CTkEntry(toolbar, width=140)
+        self.period_entry.insert(0, f"1-12/{current_year()}")
+        self.period_entry.pack(side="left", padx=5)
+        self.period_entry.bind("<Return>", lambda event: self.load_budget())
+        self.refresh_button = ctk.CTkButton(toolbar, text="Atualizar", command=self.load_budget, width=100)
+        self.refresh_button.pack(side="left", padx=5)
+        self.filter_entry = ctk.CTkEntry(toolbar, placeholder_text="Filtrar unidades...", width=200)
+        self.filter_entry.pack(side="left", padx=10)
+        self.filter_entry.bind("<KeyRelease>", lambda event: self.show_units())
+        self.sort_var = ctk.StringVar(value=self.SORT_OPTIONS[0])
+        ctk.CTkOptionMenu(toolbar, variable=self.sort_var, values=self.SORT_OPTIONS, command=lambda _: self.show_units(), width=220).pack(side="left")
+        ctk.CTkButton(toolbar, text="Importar Orçamento (CSV)", command=self.import_budget, width=200,
+                      fg_color=self.theme_colors["button_primary_fg"], text_color=self.theme_colors["button_primary_text"]).pack(side="right")
+
+        self.status_label = ctk.CTkLabel(self, text="", text_color=self.theme_colors["text_light"])
+        self.status_label.pack(anchor="w", padx=10)
+        self.units_table = VirtualTable(self, [("unit", "Unidade", 240, "w")] + self.VALUE_COLUMNS, self.theme_colors, horizontal_scroll=True)
+        self.units_table.pack(fill="both", expand=True, padx=10, pady=(5, 5))
+        self.units_table.tree.bind("<<TreeviewSelect>>", lambda event: self.show_groups())
+        self.groups_label = ctk.CTkLabel(self, text="Selecione uma unidade para ver os grupos do DRE.", font=ctk.CTkFont(size=14, weight="bold"), text_color=self.theme_colors["text"])
+        self.groups_label.pack(anchor="w", padx=10)
+        self.groups_table = VirtualTable(self, [("group", "Grupo", 240, "w")] + self.VALUE_COLUMNS, self.theme_colors, horizontal_scroll=True)
+        self.groups_table.pack(fill="both", expand=True, padx=10, pady=(5, 10))
+        self.load_budget()
+
+    @staticmethod
+    def summarize(data: pd.DataFrame, keys: List[str], last_period: int) -> pd.DataFrame:
+        """Soma previsto/realizado do período por `keys`; o acumulado no ano vem da última linha de cada grupo no ano final."""
+        totals = data.groupby(keys, sort=False)[["budget", "actual"]].sum()
+        per_group = keys if "group_name" in keys else keys + ["group_name"]
+        in_last_year = data[data["period_index"] // 12 == last_period // 12]
+        latest = in_last_year.sort_values("period_index").groupby(per_group, sort=False).tail(1)
+        ytd = latest.groupby(keys, sort=False)[["ytd_budget", "ytd_actual"]].sum()
+        summary = totals.join(ytd).fillna(0.0).reset_index()
+        summary["delta"] = summary["actual"] - summary["budget"]
+        summary["attainment"] = summary["actual"] * 100.0 / summary["budget"].where(summary["budget"] != 0)
+        summary["ytd_attainment"] = summary["ytd_actual"] * 100.0 / summary["ytd_budget"].where(summary["ytd_budget"] != 0)
+        return summary
+
+    @staticmethod
+    def _value_cells(row) -> Tuple[str, ...]:
+        def money(value: float) -> str:
+            return f"R$ {value:,.2f}"
+
+        def percent(value: float) -> str:
+            return "—" if pd.isna(value) else f"{value:.1f}%"
+        return (money(row.budget), money(row.actual), money(row.delta), percent(row.attainment),
+                money(row.ytd_budget), money(row.ytd_actual), percent(row.ytd_attainment))
+
+    def load_budget(self):
+        try:
+            period = parse_period_spec(self.period_entry.get())
+        except ValueError:
+            messagebox.showerror("Erro", "Período inválido. Use, por exemplo, 08/2025, 1-6/2025 ou 11/2024-02/2025.")
+            return
+        start_month, end_month, start_year, end_year = period
+        last_period = period_index(end_year, end_month)
+        self.period_title = format_period_range(*period)
+        db = self.db()
+
+        def task() -> Tuple[pd.DataFrame, pd.DataFrame]:
+            data = db.get_budget_vs_actual(self.unit_name, start_month, end_month, start_year, end_year)
+            return self.summarize(data, ["unit_name"], last_period), self.summarize(data, ["unit_name", "group_name"], last_period)
+
+        self.refresh_button.configure(state="disabled")
+        self.status_label.configure(text=f"Carregando previsto x realizado de {self.period_title}...")
+        run_in_background(self, task, self.show_budget, self._on_load_error)
+
+    def _on_load_error(self, error: Exception):
+        self.refresh_button.configure(state="normal")
+        self.status_label.configure(text=f"Não foi possível carregar o orçamento: {error}")
+
+    def show_budget(self, result: Tuple[pd.DataFrame, pd.DataFrame]):
+        self.refresh_button.configure(state="normal")
+        self.units_summary, self.groups_summary = result
+        self.unit_index = UnitIndex(self.units_summary["unit_name"].tolist())
+        self.show_units()
+        self.groups_table.set_rows([])
+        budgeted = int((self.units_summary["budget"] != 0).sum()) if not self.units_summary.empty else 0
+        self.status_label.configure(text=f"{self.period_title}: {len(self.units_summary)} unidade(s), {budgeted} com orçamento.")
+        if self.unit_name is not None and self.units_table.row_count:
+            self.units_table.tree.selection_set(self.unit_name)
+
+    def show_units(self):
+        if self.units_summary.empty:
+            self.units_table.set_rows([])
+            return
+        visible = set(self.unit_index.search(self.filter_entry.get()))
+        summary = self.units_summary[self.units_summary["unit_name"].isin(visible)]
+        sort = self.sort_var.get()
+        if sort == "Menor execução acumulada":
+            summary = summary.sort_values("ytd_attainment", na_position="last")
+        elif sort == "Maior desvio (R$)":
+            summary = summary.reindex(summary["delta"].abs().sort_values(ascending=False).index)
+        else:
+            summary = summary.sort_values("unit_name")
+        self.units_table.set_rows([(row.unit_name, *self._value_cells(row)) for row in summary.itertuples(index=False)],
+                                  iids=summary["unit_name"].tolist())
+
+    def show_groups(self):
+        selection = self.units_table.tree.selection()
+        if not selection:
+            return
+        unit = selection[0]
+        groups = self.groups_summary[self.groups_summary["unit_name"] == unit]
+        groups = groups.assign(_rank=groups["group_name"].map(dre_group_rank)).sort_values("_rank", kind="stable")
+        self.groups_label.configure(text=f"Grupos do DRE - {unit}")
+        self.groups_table.set_rows([(row.group_name, *self._value_cells(row)) for row in groups.itertuples(index=False)])
+
+    def import_budget(self):
+        filepath = filedialog.askopenfilename(title="Selecione o CSV de orçamento", filetypes=[("CSV files", "*.csv")])
+        if not filepath:
+            return
+        rows, error = self.data_processor.extract_budgets(filepath)
+        if error or rows is None:
+            messagebox.showerror("Erro no Orçamento", error or "Arquivo sem linhas de orçamento.")
+            return
+        try:
+            self.db().import_budgets(rows)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro no Orçamento", f"Não foi possível gravar o orçamento.\nErro: {e}")
+            return
+        units = {row[0] for row in rows}
+        unknown = sorted(units - set(self.fm().get_existing_units()))
+        self.db().log_action("IMPORT_BUDGET", f"{len(rows)} linha(s) de orçamento de {len(units)} unidade(s) importadas de '{os.path.basename(filepath)}'.")
+        message = f"{len(rows)} linha(s) de orçamento importadas para {len(units)} unidade(s)."
+        if unknown:
+            message += f"\n\nUnidades sem cadastro: {', '.join(unknown[:10])}{'...' if len(unknown) > 10 else ''}"
+        messagebox.showinfo("Orçamento Importado", message)
+        self.load_budget()
+
+class LeaderboardScreen(BaseFrame):
+    """Ranking da rede no período, com faixa de percentil e movimento contra o período anterior.
+
+    Cada página é uma consulta LIMIT/OFFSET em get_leaderboard, então o custo de exibir não cresce
+    com o número de unidades.
+    """
+    PAGE_SIZE = 50
+    METRICS = {
+        "Resultado Líquido": "net_result",
+        "Receita": "total_revenue",
+        "Margem (%)": "margin",
+        "Crescimento (%)": "growth",
+    }
+    COLUMNS = [
+        ("rank", "Posição", 70, "center"), ("unit", "Unidade", 240, "w"), ("net_result", "Resultado", 130, "e"),
+        ("revenue", "Receita", 130, "e"), ("margin", "Margem", 80, "e"), ("growth", "Crescimento", 100, "e"),
+        ("percentile", "Percentil", 80, "e"), ("band", "Faixa", 110, "center"), ("previous", "Posição Anterior", 120, "center"),
+        ("movement", "Movimento", 90, "center"),
+    ]
+
+    def __init__(self, parent, controller, **kwargs):
+        self.page = 0
+        self.total_units = 0
+        super().__init__(parent, controller, **kwargs)
+
+        toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        toolbar.pack(fill="x", padx=10, pady=(0, 10))
+        ctk.CTkLabel(toolbar, text="Período (ex: 08/2025 ou 1-6/2025):").pack(side="left")
+        today = datetime.date.today()
+        self.period_entry = ctk.CTkEntry(toolbar, width=140)
+        self.period_entry.insert(0, period_label(period_index(today.year, today.month) - 1))
+        self.period_entry.pack(side="left", padx=5)
+        self.period_entry.bind("<Return>", lambda event: self.load_page(0))
+        self.metric_var = ctk.StringVar(value="Resultado Líquido")
+        ctk.CTkOptionMenu(toolbar, variable=self.metric_var, values=list(self.METRICS), command=lambda _: self.load_page(0), width=180).pack(side="left", padx=10)
+        ctk.CTkButton(toolbar, text="Atualizar", command=lambda: self.load_page(0), width=100).pack(side="left")
+        self.next_button = ctk.CTkButton(toolbar, text="Próxima ▶", command=lambda: self.load_page(self.page + 1), width=100)
+        self.next_button.pack(side="right")
+        self.page_label = ctk.CTkLabel(toolbar, text="", text_color=self.theme_colors["text"])
+        self.page_label.pack(side="right", padx=10)
+        self.previous_button = ctk.CTkButton(toolbar, text="◀ Anterior", command=lambda: self.load_page(self.page - 1), width=100)
+        self.previous_button.pack(side="right")
+
+        self.bands_label = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=14, weight="bold"), text_color=self.theme_colors["text"])
+        self.bands_label.pack(anchor="w", padx=10)
+        self.status_label = ctk.CTkLabel(self, text="", text_color=self.theme_colors["text_light"])
+        self.status_label.pack(anchor="w", padx=10)
+        self.table = VirtualTable(self, self.COLUMNS, self.theme_colors, horizontal_scroll=True)
+        self.table.pack(fill="both", expand=True, padx=10, pady=10)
+        self.load_page(0)
+
+    @staticmethod
+    def percentile_band(percentile: float) -> str:
+        if percentile >= 90:
+            return "Top 10%"
+        if percentile >= 75:
+            return "P75–P90"
+        if percentile >= 50:
+            return "P50–P75"
+        if percentile >= 25:
+            return "P25–P50"
+        return "Abaixo de P25"
+
+    @staticmethod
+    def movement(rank_change: float) -> str:
+        if pd.isna(rank_change):
+            return "novo"
+        if rank_change > 0:
+            return f"▲ {int(rank_change)}"
+        if rank_change < 0:
+            return f"▼ {int(-rank_change)}"
+        return "="
+
+    def format_metric(self, metric: str, value: float) -> str:
+        if pd.isna(value):
+            return "—"
+        return f"{value:,.1f}%" if metric in ("margin", "growth") else f"R$ {value:,.2f}"
+
+    def load_page(self, page: int):
+        try:
+            period = parse_period_spec(self.period_entry.get())
+        except ValueError:
+            messagebox.showerror("Erro", "Período inválido. Use, por exemplo, 08/2025, 1-6/2025 ou 11/2024-02/2025.")
+            return
+        if page < 0 or (page > self.page and (page * self.PAGE_SIZE) >= self.total_units):
+            return
+        metric = self.METRICS[self.metric_var.get()]
+        db = self.db()
+
+        def task() -> pd.DataFrame:
+            return db.get_leaderboard(*period, metric=metric, limit=self.PAGE_SIZE, offset=page * self.PAGE_SIZE)
+
+        self.status_label.configure(text="Calculando ranking...")
+        run_in_background(self, task, lambda data: self.show_page(page, metric, period, data),
+                          lambda error: self.status_label.configure(text=f"Não foi possível calcular o ranking: {error}"))
+
+    def show_page(self, page: int, metric: str, period: Tuple[int, int, int, int], data: pd.DataFrame):
+        self.page = page
+        self.total_units = int(data["ranked_units"].iloc[0]) if not data.empty else 0
+        pages = max(1, -(-self.total_units // self.PAGE_SIZE))
+        self.page_label.configure(text=f"Página {page + 1} de {pages}")
+        self.previous_button.configure(state="normal" if page > 0 else "disabled")
+        self.next_button.configure(state="normal" if page + 1 < pages else "disabled")
+        rows = [
+            (int(row.rank), row.unit_name, f"R$ {row.net_result:,.2f}", f"R$ {row.total_revenue:,.2f}",
+             self.format_metric("margin", row.margin), self.format_metric("growth", row.growth), f"{row.percentile:.0f}",
+             self.percentile_band(row.percentile), "—" if pd.isna(row.previous_rank) else int(row.previous_rank), self.movement(row.rank_change))
+            for row in data.itertuples(index=False)
+        ]
+        self.table.set_rows(rows)
+        title = format_period_range(*period)
+        if data.empty:
+            self.bands_label.configure(text="")
+            self.status_label.configure(text=f"Nenhuma unidade com {self.metric_var.get().lower()} em {title}.")
+            return
+        cuts = data.iloc[0]
+        self.bands_label.configure(text=f"{self.metric_var.get()} na rede: P25 {self.format_metric(metric, cuts.p25)} | "
+                                        f"Mediana {self.format_metric(metric, cuts.p50)} | P75 {self.format_metric(metric, cuts.p75)} | "
+                                        f"P90 {self.format_metric(metric, cuts.p90)}")
+        self.status_label.configure(text=f"{title}: {self.total_units} unidade(s) ranqueadas; movimento contra o período anterior de mesma duração.")
+
 class UnitComparisonSetupScreen(BaseFrame):
     def __init__(self, parent, controller, current_unit: str, **kwargs):
         self.current_unit = current_unit
         super().__init__(parent, controller, **kwargs)
-        self.unit_vars = {}
 
         main_frame = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"])
-        main_frame.pack(expand=True, padx=50, pady=50)
+        main_frame.pack(fill="both", expand=True, padx=50, pady=30)
 
         ctk.CTkLabel(main_frame, text="Selecione as Unidades para Comparar", font=ctk.CTkFont(size=18, weight="bold")).pack(pady=20)
 
-        units_frame = ctk.CTkScrollableFrame(main_frame, label_text="Unidades Disponíveis")
-        units_frame.pack(fill="both", expand=True, padx=20, pady=10)
+        selection_bar = ctk.CTkFrame(main_frame, fg_color="transparent")
+        selection_bar.pack(fill="x", padx=20)
+        ctk.CTkButton(selection_bar, text="Selecionar Todas", width=140, command=lambda: self.picker.select_all()).pack(side="left", padx=(0, 5))
+        ctk.CTkButton(selection_bar, text="Limpar Seleção", width=140, command=lambda: self.picker.clear_selection()).pack(side="left", padx=5)
+        self.selection_label = ctk.CTkLabel(selection_bar, text="")
+        self.selection_label.pack(side="right")
+
         all_units = self.fm().get_existing_units()
-        for unit in all_units:
-            var = ctk.StringVar(value="on" if unit == current_unit else "off")
-            cb = ctk.CTkCheckBox(units_frame, text=unit, variable=var, onvalue="on", offvalue="off")
-            cb.pack(anchor="w", padx=10, pady=5)
-            self.unit_vars[unit] = var
+        self.picker = UnitPicker(main_frame, all_units, self.db().get_unit_regions(), self.theme_colors, multiselect=True,
+                                 selected=[current_unit] if current_unit in all_units else [], on_change=self.update_selection_label)
+        self.picker.pack(fill="both", expand=True, padx=20, pady=10)
+        self.update_selection_label()
 
         ctk.CTkLabel(main_frame, text="Selecione o Período", font=ctk.CTkFont(size=16)).pack(pady=(20,5))
         self.period_var = ctk.StringVar(value="Mês Atual")
-        period_menu = ctk.CTkOptionMenu(main_frame, variable=self.period_var, values=["Mês Atual", "Último Trimestre", "Ano Inteiro"])
+        period_menu = ctk.CTkOptionMenu(main_frame, variable=self.period_var, values=["Mês Atual", "Último Trimestre", "Ano Inteiro", "Últimos 12 Meses", "Ano Anterior", "Período Personalizado"])
         period_menu.pack(pady=10)
 
-        ctk.CTkButton(main_frame, text="Gerar Comparativo", command=self.generate_comparison, height=40).pack(pady=20)
+        button_bar = ctk.CTkFrame(main_frame, fg_color="transparent")
+        button_bar.pack(pady=20)
+        ctk.CTkButton(button_bar, text="Gerar Comparativo", command=self.generate_comparison, height=40).pack(side="left", padx=5)
+        ctk.CTkButton(button_bar, text="DRE Consolidado", command=self.generate_consolidated, height=40).pack(side="left", padx=5)
+
+    def update_selection_label(self):
+        self.selection_label.configure(text=f"{len(self.picker.selected)} unidade(s) selecionada(s)")
 
     def generate_comparison(self):
-        selected_units = [unit for unit, var in self.unit_vars.items() if var.get() == "on"]
+        selected_units = self.picker.get_selected()
         if len(selected_units) < 2:
             messagebox.showwarning("Seleção Inválida", "Por favor, selecione pelo menos duas unidades para comparar.")
             return
 
+        period = self.selected_period()
+        if period is None:
+            return
+        data = self.db().get_comparison_data(selected_units, *period)
+
+        if data.empty:
+            messagebox.showinfo("Sem Dados", "Nenhuma das unidades selecionadas possui dados para o período escolhido.")
+            return
+        
+        path = self.breadcrumb_path + [("Resultado da Comparação", UnitComparisonResultScreen)]
+        self.controller.show_frame(UnitComparisonResultScreen, breadcrumb_path=path, data=data, period_title=format_period_range(*period))
+
+    def generate_consolidated(self):
+        selected_units = self.picker.get_selected()
+        if not selected_units:
+            messagebox.showwarning("Seleção Inválida", "Selecione ao menos uma unidade para consolidar.")
+            return
+        period = self.selected_period()
+        if period is not None:
+            show_consolidated_dre(self, selected_units, *period)
+
+    def selected_period(self) -> Optional[Tuple[int, int, int, int]]:
+        """(mês inicial, mês final, ano inicial, ano final) da opção escolhida; None se o usuário cancelar."""
+        if self.period_var.get() == "Período Personalizado":
+            return ask_period_range("Período da Comparação", "Período")
         now = datetime.datetime.now()
         current_month = now.month
+        year = now.year
         
         if current_month <= 3: q_start, q_end = 1, 3
         elif current_month <= 6: q_start, q_end = 4, 6
         elif current_month <= 9: q_start, q_end = 7, 9
         else: q_start, q_end = 10, 12
 
+        # Os 12 meses até o atual, atravessando a virada do ano
+        first_year, first_month0 = divmod(period_index(year, current_month) - 11, 12)
         period_map = {
-            "Mês Atual": (current_month, current_month),
-            "Último Trimestre": (q_start, q_end),
-            "Ano Inteiro": (1, 12)
+            "Mês Atual": (current_month, current_month, year, year),
+            "Último Trimestre": (q_start, q_end, year, year),
+            "Ano Inteiro": (1, 12, year, year),
+            "Últimos 12 Meses": (first_month0 + 1, current_month, first_year, year),
+            "Ano Anterior": (1, 12, year - 1, year - 1),
         }
-        start, end = period_map[self.period_var.get()]
-
-        data = self.db().get_comparison_data(selected_units, start, end)
-
-        if data.empty:
-            messagebox.showinfo("Sem Dados", "Nenhuma das unidades selecionadas possui dados para o período escolhido.")
-            return
-        
-        path = self.breadcrumb_path + [("Resultado da Comparação", UnitComparisonResultScreen)]
-        self.controller.show_frame(UnitComparisonResultScreen, breadcrumb_path=path, data=data, period_title=self.period_var.get())
+        return period_map[self.period_var.get()]
 
 class UnitComparisonResultScreen(BaseFrame):
     def __init__(self, parent, controller, data: pd.DataFrame, period_title: str, **kwargs):
@@ -1778,22 +5976,9 @@ class UnitComparisonResultScreen(BaseFrame):
         self.grid_rowconfigure(1, weight=1)
         self.grid_columnconfigure(0, weight=1)
 
-        fig = Figure(figsize=(8, 4), dpi=100, facecolor=self.theme_colors["frame"])
-        ax = fig.add_subplot(111, facecolor=self.theme_colors["frame"])
-        
-        self.data.plot(kind='bar', x='unit_name', y=['total_revenue', 'net_result'], ax=ax, color=[Config.COLOR_BLUE, self.theme_colors["primary"]])
-        
-        ax.set_title(f"Comparativo de Performance - {self.period_title}", color=self.theme_colors["text"])
-        ax.set_xlabel("Unidades", color=self.theme_colors["text"])
-        ax.set_ylabel("Valor (R$)", color=self.theme_colors["text"])
-        ax.tick_params(axis='x', labelrotation=0, colors=self.theme_colors["text"])
-        ax.tick_params(axis='y', colors=self.theme_colors["text"])
-        ax.legend(["Receita Total", "Resultado Líquido"])
-        fig.tight_layout()
-
-        canvas = FigureCanvasTkAgg(fig, master=self)
-        canvas.draw()
-        canvas.get_tk_widget().grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
+        chart = ChartView(self, self.charts(), self.theme_colors)
+        chart.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
+        chart.show("unit_comparison", ChartRenderer.comparison_payload(self.data, f"Comparativo de Performance - {self.period_title}"))
 
         table_frame = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"])
         table_frame.grid(row=1, column=0, sticky="nsew", padx=10, pady=10)
@@ -1818,7 +6003,7 @@ class UnitComparisonResultScreen(BaseFrame):
 class ManagementScreen(BaseFrame):
     def __init__(self, parent, controller, **kwargs):
         super().__init__(parent, controller, **kwargs)
-        self.grid_columnconfigure((0, 1), weight=1)
+        self.grid_columnconfigure((0, 1, 2, 3), weight=1)
         self.grid_rowconfigure(0, weight=1)
 
         collector_card = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"], corner_radius=10)
@@ -1828,11 +6013,31 @@ class ManagementScreen(BaseFrame):
         ctk.CTkButton(collector_card, text="Acessar", command=self.go_to_collector_manager, height=45).pack(pady=20, padx=20)
 
         log_card = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"], corner_radius=10)
-        log_card.grid(row=0, column=1, sticky="nsew", padx=(10, 0), pady=10)
+        log_card.grid(row=0, column=1, sticky="nsew", padx=10, pady=10)
         ctk.CTkLabel(log_card, text="Visualizador de Logs", font=ctk.CTkFont(size=18, weight="bold")).pack(pady=20)
         ctk.CTkLabel(log_card, text="Audite todas as ações importantes realizadas no sistema.", wraplength=300).pack(pady=10, padx=20)
         ctk.CTkButton(log_card, text="Acessar", command=self.go_to_log_viewer, height=45).pack(pady=20, padx=20)
 
+        export_card = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"], corner_radius=10)
+        export_card.grid(row=0, column=2, sticky="nsew", padx=10, pady=10)
+        ctk.CTkLabel(export_card, text="Exportação em Lote", font=ctk.CTkFont(size=18, weight="bold")).pack(pady=20)
+        ctk.CTkLabel(export_card, text="Gere os relatórios de todas as unidades de uma só vez.", wraplength=300).pack(pady=10, padx=20)
+        ctk.CTkButton(export_card, text="PDFs por Unidade", command=self.open_batch_export, height=45).pack(pady=(20, 5), padx=20)
+        ctk.CTkButton(export_card, text="Excel da Rede (Detalhado)", command=self.export_network_excel, height=45).pack(pady=5, padx=20)
+        ctk.CTkButton(export_card, text="Snapshot Parquet (Análise)", command=self.export_parquet_snapshot, height=45).pack(pady=(5, 20), padx=20)
+
+        budget_card = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"], corner_radius=10)
+        budget_card.grid(row=0, column=3, sticky="nsew", padx=(10, 0), pady=10)
+        ctk.CTkLabel(budget_card, text="Orçamentos", font=ctk.CTkFont(size=18, weight="bold")).pack(pady=20)
+        ctk.CTkLabel(budget_card, text="Importe o orçamento por grupo do DRE e acompanhe o previsto x realizado da rede.", wraplength=300).pack(pady=10, padx=20)
+        ctk.CTkButton(budget_card, text="Acessar", command=self.go_to_budgets, height=45).pack(pady=20, padx=20)
+
+        perf_card = ctk.CTkFrame(self, fg_color=self.theme_colors["frame"], corner_radius=10)
+        perf_card.grid(row=1, column=0, columnspan=4, sticky="ew", pady=(0, 10))
+        ctk.CTkLabel(perf_card, text="Desempenho", font=ctk.CTkFont(size=18, weight="bold")).pack(side="left", padx=20, pady=15)
+        ctk.CTkLabel(perf_card, text="Latências p50/p95 de importação, consultas, telas e exportações.").pack(side="left", padx=10)
+        ctk.CTkButton(perf_card, text="Acessar", command=self.go_to_performance, height=45).pack(side="right", padx=20, pady=15)
+
     def go_to_collector_manager(self):
         path = self.breadcrumb_path + [("Gerenciar Arrecadadoras", CollectorManagerScreen)]
         self.controller.show_frame(CollectorManagerScreen, breadcrumb_path=path)
@@ -1841,6 +6046,35 @@ class ManagementScreen(BaseFrame):
         path = self.breadcrumb_path + [("Logs de Atividade", LogViewerScreen)]
         self.controller.show_frame(LogViewerScreen, breadcrumb_path=path)
 
+    def go_to_budgets(self):
+        path = self.breadcrumb_path + [("Previsto x Realizado", BudgetScreen)]
+        self.controller.show_frame(BudgetScreen, breadcrumb_path=path)
+
+    def go_to_performance(self):
+        path = self.breadcrumb_path + [("Desempenho", PerformanceScreen)]
+        self.controller.show_frame(PerformanceScreen, breadcrumb_path=path)
+
+    def open_batch_export(self):
+        BatchExportWindow(parent=self, db_manager=self.db(), file_manager=self.fm())
+
+    def export_network_excel(self):
+        ask_excel_detail_export(self, self.db(), cast(ExcelExporter, self.excel_exporter), None)
+
+    def export_parquet_snapshot(self):
+        output_dir = filedialog.askdirectory(title="Pasta do snapshot Parquet")
+        if not output_dir: return
+        db_manager = self.db()
+
+        def on_done(report: Dict[str, int]):
+            db_manager.log_action("PARQUET_SNAPSHOT", f"Snapshot em '{output_dir}': {report['written']} partição(ões) gravada(s), {report['unchanged']} inalterada(s), {report['removed']} removida(s).")
+            messagebox.showinfo("Snapshot Concluído",
+                                f"Partições gravadas: {report['written']}\nInalteradas: {report['unchanged']}\nRemovidas: {report['removed']}\nLinhas gravadas: {report['rows']}")
+
+        def on_error(e: Exception):
+            messagebox.showerror("Erro no Snapshot", f"Não foi possível gerar o snapshot Parquet.\nErro: {e}")
+
+        run_in_background(self, lambda: ParquetSnapshotExporter(db_manager).export(output_dir), on_done, on_error)
+
 class CollectorManagerScreen(BaseFrame):
     def __init__(self, parent, controller, **kwargs):
         super().__init__(parent, controller, **kwargs)
@@ -1894,6 +6128,85 @@ class CollectorManagerScreen(BaseFrame):
             self.db().merge_collectors(selected, final_name)
             self.populate_collectors()
 
+class PerformanceScreen(BaseFrame):
+    """Latências p50/p95 e linhas por etapa, medidas pelo PERF_MONITOR.
+
+    'Sessão atual' lê o buffer em memória; 'Gravado' lê a tabela perf_samples, alimentada por
+    'Gravar no banco' (que esvazia o buffer e passa para 'Gravado') e pelo fechamento do aplicativo
+    com a medição ligada.
+    """
+    SOURCES = ("Sessão atual", "Gravado")
+    CATEGORIES = {"Todas as etapas": "", "Banco de dados": "db.", "Processamento": "processor.", "Telas": "screen.", "Exportação": "export."}
+    COLUMNS = [
+        ("stage", "Etapa", 320, "w"), ("calls", "Chamadas", 90, "e"), ("p50", "p50 (ms)", 100, "e"), ("p95", "p95 (ms)", 100, "e"),
+        ("max", "Máx (ms)", 100, "e"), ("total", "Total (ms)", 110, "e"), ("rows", "Linhas (média)", 120, "e"),
+    ]
+
+    def __init__(self, parent, controller, **kwargs):
+        super().__init__(parent, controller, **kwargs)
+
+        toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        toolbar.pack(fill="x", padx=10, pady=(0, 10))
+        self.enabled_var = ctk.BooleanVar(value=PERF_MONITOR.enabled)
+        ctk.CTkSwitch(toolbar, text="Medição ligada", variable=self.enabled_var, command=self.toggle_monitor).pack(side="left")
+        self.source_var = ctk.StringVar(value=self.SOURCES[0])
+        ctk.CTkSegmentedButton(toolbar, values=list(self.SOURCES), variable=self.source_var, command=lambda _: self.refresh()).pack(side="left", padx=10)
+        self.category_var = ctk.StringVar(value="Todas as etapas")
+        ctk.CTkOptionMenu(toolbar, variable=self.category_var, values=list(self.CATEGORIES), command=lambda _: self.refresh(), width=170).pack(side="left")
+        ctk.CTkButton(toolbar, text="Limpar", command=self.clear, width=100, fg_color=Config.COLOR_RED).pack(side="right")
+        ctk.CTkButton(toolbar, text="Gravar no banco", command=self.flush, width=130).pack(side="right", padx=10)
+        ctk.CTkButton(toolbar, text="Atualizar", command=self.refresh, width=100).pack(side="right")
+
+        self.status_label = ctk.CTkLabel(self, text="", text_color=self.theme_colors["text_light"])
+        self.status_label.pack(anchor="w", padx=10)
+        self.table = VirtualTable(self, self.COLUMNS, self.theme_colors)
+        self.table.pack(fill="both", expand=True, padx=10, pady=10)
+        self.refresh()
+
+    def toggle_monitor(self):
+        PERF_MONITOR.enabled = bool(self.enabled_var.get())
+        self.refresh()
+
+    def refresh(self):
+        if self.source_var.get() == self.SOURCES[0]:
+            samples = pd.DataFrame(PERF_MONITOR.samples(), columns=["recorded_at", "stage", "elapsed_ms", "row_count"])
+            state = "ligada" if PERF_MONITOR.enabled else "desligada"
+            self.show_statistics(samples, PERF_MONITOR.counts(),
+                                 f"{len(samples)} medida(s) no buffer (capacidade {PERF_MONITOR.capacity}); medição {state}.")
+            return
+        self.status_label.configure(text="Lendo medidas gravadas...")
+        run_in_background(self, self.db().get_perf_samples,
+                          lambda samples: self.show_statistics(samples, None, f"{len(samples)} medida(s) gravada(s) no banco."),
+                          lambda error: self.status_label.configure(text=f"Não foi possível ler as medidas: {error}"))
+
+    def show_statistics(self, samples: pd.DataFrame, counts: Optional[Dict[str, int]], status: str):
+        prefix = self.CATEGORIES[self.category_var.get()]
+        if prefix:
+            samples = samples[samples["stage"].str.startswith(prefix)]
+        stats = PerformanceMonitor.statistics(samples)
+        rows = [
+            (row.stage, (counts or {}).get(row.stage, row.calls), f"{row.p50_ms:,.1f}", f"{row.p95_ms:,.1f}", f"{row.max_ms:,.1f}",
+             f"{row.total_ms:,.0f}", "—" if pd.isna(row.avg_rows) else f"{row.avg_rows:,.0f}")
+            for row in stats.itertuples(index=False)
+        ]
+        self.table.set_rows(rows)
+        self.status_label.configure(text=status)
+
+    def flush(self):
+        count = PERF_MONITOR.flush(self.db())
+        # O buffer da sessão fica vazio após a gravação; as medidas passam a ser vistas em 'Gravado'
+        self.source_var.set(self.SOURCES[1])
+        self.status_label.configure(text=f"{count} medida(s) gravada(s) no banco.")
+        self.refresh()
+
+    def clear(self):
+        if self.source_var.get() == self.SOURCES[0]:
+            PERF_MONITOR.clear()
+        elif messagebox.askyesno("Confirmar", "Apagar todas as medidas de desempenho gravadas no banco?"):
+            self.db().clear_perf_samples()
+            self.db().log_action("PERF_CLEAR", "Medidas de desempenho gravadas foram apagadas.")
+        self.refresh()
+
 class LogViewerScreen(BaseFrame):
     def __init__(self, parent, controller, **kwargs):
         super().__init__(parent, controller, **kwargs)
@@ -1920,14 +6233,115 @@ class LogViewerScreen(BaseFrame):
 # ==============================================================================
 # --- 8. PONTO DE ENTRADA DO PROGRAMA ---
 # ==============================================================================
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=Config.APP_NAME)
+    parser.add_argument("--batch-pdf", metavar="PASTA", help="Gera os PDFs de DRE de todas as unidades na pasta indicada, sem abrir a interface.")
+    parser.add_argument("--months", default=f"{datetime.datetime.now().month:02d}", help="Meses do lote, ex: 08 ou 1-3,5 (padrão: mês atual).")
+    parser.add_argument("--year", type=int, default=None, help="Ano dos meses do lote (padrão: ano corrente).")
+    parser.add_argument("--annual", action="store_true", help="Inclui também o DRE anual de cada unidade.")
+    parser.add_argument("--workers", type=int, default=None, help="Número de processos (padrão: nº de CPUs).")
+    parser.add_argument("--snapshot", metavar="PASTA", help="Exporta o banco como Parquet particionado por ano/unidade, regravando só partições alteradas.")
+    parser.add_argument("--full", action="store_true", help="Com --snapshot, regrava todas as partições.")
+    parser.add_argument("--benchmark-rules", metavar="LINHAS", type=int, help="Mede o custo por linha da classificação com os mapeamentos atuais.")
+    parser.add_argument("--benchmark", metavar="SAIDA.json", help="Roda o benchmark de importação e consultas sobre dados sintéticos e grava o resultado em JSON.")
+    parser.add_argument("--bench-units", type=int, default=20, help="Com --benchmark, número de unidades da base sintética (padrão: 20).")
+    parser.add_argument("--bench-months", type=int, default=12, help="Com --benchmark, meses por unidade (padrão: 12).")
+    parser.add_argument("--bench-details", type=int, default=200, help="Com --benchmark, linhas de detalhamento por importação (padrão: 200).")
+    parser.add_argument("--bench-rows", type=int, default=2000, help="Com --benchmark, linhas dos CSVs sintéticos (padrão: 2000).")
+    parser.add_argument("--bench-repeat", type=int, default=5, help="Com --benchmark, repetições de cada medida (padrão: 5).")
+    parser.add_argument("--bench-seed", type=int, default=0, help="Com --benchmark, semente do gerador (padrão: 0).")
+    parser.add_argument("--bench-dir", metavar="PASTA", help="Com --benchmark, mantém CSVs e base sintética nesta pasta (padrão: pasta temporária).")
+    parser.add_argument("--bench-compare", metavar="BASE.json", help="Com --benchmark, compara o resultado com um JSON de outra execução.")
+    parser.add_argument("--perf", action="store_true", help="Abre a interface com a medição de desempenho ligada; as medidas são gravadas no banco ao fechar.")
+    return parser
+
+def run_batch_pdf_cli(args: argparse.Namespace) -> int:
+    db_manager = DatabaseManager(Config.DB_PATH)
+    file_manager = FileManager(db_manager)
+    try:
+        months = BatchPDFExporter.parse_month_spec(args.months)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    exporter = BatchPDFExporter(db_manager.db_path, max_workers=args.workers)
+    jobs = exporter.plan_jobs(file_manager.get_existing_units(), months, args.batch_pdf, include_annual=args.annual, year=args.year)
+    report = exporter.run(jobs, progress=lambda done, total, name: print(f"[{done}/{total}] {name}", flush=True))
+    print(f"{len(report['generated'])} PDF(s) gerado(s), {len(report['skipped'])} sem dados, {len(report['errors'])} erro(s).")
+    for error in report["errors"]:
+        print(f"ERRO: {error}", file=sys.stderr)
+    db_manager.log_action("BATCH_PDF_SUCCESS", f"{len(report['generated'])} PDF(s) gerados em '{args.batch_pdf}' (modo headless).")
+    return 1 if report["errors"] else 0
+
+def run_snapshot_cli(args: argparse.Namespace) -> int:
+    db_manager = DatabaseManager(Config.DB_PATH)
+    try:
+        report = ParquetSnapshotExporter(db_manager).export(
+            args.snapshot, full=args.full, progress=lambda done, total, key: print(f"[{done}/{total}] {key}", flush=True))
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(f"{report['written']} partição(ões) gravada(s), {report['unchanged']} inalterada(s), {report['removed']} removida(s), {report['rows']} linha(s).")
+    db_manager.log_action("PARQUET_SNAPSHOT", f"Snapshot em '{args.snapshot}': {report['written']} partição(ões) gravada(s) (modo headless).")
+    return 0
+
+def run_benchmark_cli(args: argparse.Namespace) -> int:
+    def run(workdir: str) -> Dict[str, Any]:
+        suite = BenchmarkSuite(workdir, units=args.bench_units, months=args.bench_months, details=args.bench_details,
+                               csv_rows=args.bench_rows, repeat=args.bench_repeat, seed=args.bench_seed)
+        return suite.run(progress=lambda name: print(f"... {name}", flush=True))
+
+    if args.bench_dir:
+        report = run(args.bench_dir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="dre-benchmark-") as workdir:
+            report = run(workdir)
+    with open(args.benchmark, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.bench_compare:
+        with open(args.bench_compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if baseline is None:
+        for name, result in report["results"].items():
+            print(f"{name:<40} {result['median_ms']:>10.2f} ms  ({result['rows'] if result['rows'] is not None else '-'} linhas)")
+    else:
+        for name, base_ms, current_ms, ratio in BenchmarkSuite.compare(baseline, report):
+            base_text = f"{base_ms:>10.2f}" if base_ms is not None else f"{'-':>10}"
+            current_text = f"{current_ms:>10.2f}" if current_ms is not None else f"{'-':>10}"
+            ratio_text = f"{ratio:.2f}x" if ratio is not None else "-"
+            print(f"{name:<40} {base_text} ms -> {current_text} ms  {ratio_text}")
+    print(f"Resultado gravado em '{args.benchmark}'.")
+    return 0
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    args = build_arg_parser().parse_args()
+    if args.batch_pdf:
+        sys.exit(run_batch_pdf_cli(args))
+    if args.snapshot:
+        sys.exit(run_snapshot_cli(args))
+    if args.benchmark:
+        sys.exit(run_benchmark_cli(args))
+    if args.benchmark_rules:
+        Config.load_mappings(DatabaseManager(Config.DB_PATH))
+        for name, value in benchmark_rule_engine(args.benchmark_rules).items():
+            print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+        sys.exit(0)
+
     ctk.set_appearance_mode(Config.CTK_APPEARANCE_MODE)
+    PERF_MONITOR.enabled = args.perf
 
-    db_manager = DatabaseManager(Config.DB_PATH)
+    # A criação/migração do banco é feita pela SplashScreen em segundo plano
+    db_manager = DatabaseManager(Config.DB_PATH, defer_setup=True)
     file_manager = FileManager(db_manager)
     data_processor = DataProcessor()
     pdf_exporter = PDFExporter()
     excel_exporter = ExcelExporter()
+    chart_renderer = ChartRenderer()
 
-    app = App(db_manager, file_manager, data_processor, pdf_exporter, excel_exporter)
+    app = App(db_manager, file_manager, data_processor, pdf_exporter, excel_exporter, chart_renderer)
     app.mainloop()
+    chart_renderer.shutdown()
+    if PERF_MONITOR.enabled:
+        PERF_MONITOR.flush(db_manager)